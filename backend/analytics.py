@@ -0,0 +1,233 @@
+import heapq
+import threading
+import time
+from collections import Counter, deque
+
+from money import from_paise
+
+_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_windows(spec):
+    """Parse '5m,1h,1d' into [('5m', 300), ('1h', 3600), ('1d', 86400)]"""
+    windows = []
+    for name in filter(None, (part.strip() for part in spec.split(','))):
+        unit = _UNITS.get(name[-1])
+        if unit is None or not name[:-1].isdigit() or int(name[:-1]) == 0:
+            raise ValueError(f'Invalid analytics window: {name}')
+        windows.append((name, int(name[:-1]) * unit))
+    if not windows:
+        raise ValueError('At least one analytics window is required')
+    return windows
+
+
+class _Flow:
+    """A symbol's trading in one sliding window: per-bucket totals and their running sums"""
+
+    __slots__ = ('buckets', 'volume', 'notional', 'trades', 'buy_volume')
+
+    def __init__(self):
+        self.buckets = deque()      # [bucket, volume, notional, trades, buy_volume], oldest first
+        self.volume = self.notional = self.trades = self.buy_volume = 0
+
+    def add(self, bucket, span, quantity, notional, buy):
+        if not self.buckets or bucket > self.buckets[-1][0]:
+            self.expire(bucket - span + 1)
+            self.buckets.append([bucket, 0, 0, 0, 0])
+        entry = self.buckets[-1]
+        entry[1] += quantity
+        entry[2] += notional
+        entry[3] += 1
+        self.volume += quantity
+        self.notional += notional
+        self.trades += 1
+        if buy:
+            entry[4] += quantity
+            self.buy_volume += quantity
+
+    def expire(self, oldest):
+        while self.buckets and self.buckets[0][0] < oldest:
+            _, volume, notional, trades, buy_volume = self.buckets.popleft()
+            self.volume -= volume
+            self.notional -= notional
+            self.trades -= trades
+            self.buy_volume -= buy_volume
+
+
+class _Quote:
+    """A symbol's price in one sliding window: first and last price per bucket"""
+
+    __slots__ = ('buckets', 'base')
+
+    def __init__(self):
+        self.buckets = deque()      # [bucket, first, last], oldest first
+        self.base = None            # last price before the window
+
+    def add(self, bucket, span, price):
+        if not self.buckets or bucket > self.buckets[-1][0]:
+            self.expire(bucket - span + 1)
+            self.buckets.append([bucket, price, price])
+        else:
+            self.buckets[-1][2] = price
+
+    def expire(self, oldest):
+        while len(self.buckets) > 1 and self.buckets[0][0] < oldest:
+            self.base = self.buckets.popleft()[2]
+        if self.buckets and self.buckets[0][0] < oldest:
+            # Keep the latest price even when it is older than the window
+            bucket = self.buckets[0]
+            self.base = bucket[1] = bucket[2]
+
+    def change(self):
+        """(reference, last) prices: the window's opening price and the latest one"""
+        if not self.buckets:
+            return self.base, self.base
+        return (self.base if self.base is not None else self.buckets[0][1]), self.buckets[-1][2]
+
+
+class _Traders:
+    """Distinct users who traded in one sliding window"""
+
+    __slots__ = ('buckets', 'counts')
+
+    def __init__(self):
+        self.buckets = deque()      # [bucket, set of user ids], oldest first
+        self.counts = Counter()     # user id -> buckets the user traded in
+
+    def add(self, bucket, span, user_id):
+        if not self.buckets or bucket > self.buckets[-1][0]:
+            self.expire(bucket - span + 1)
+            self.buckets.append([bucket, set()])
+        users = self.buckets[-1][1]
+        if user_id not in users:
+            users.add(user_id)
+            self.counts[user_id] += 1
+
+    def expire(self, oldest):
+        while self.buckets and self.buckets[0][0] < oldest:
+            for user_id in self.buckets.popleft()[1]:
+                self.counts[user_id] -= 1
+                if not self.counts[user_id]:
+                    del self.counts[user_id]
+
+
+class MarketAnalytics:
+    """
+    Rolling per-symbol and market-wide trading aggregates over sliding
+    windows, kept up to date by the settlement path (record_fill) and the
+    price ticker (record_prices), so reads never scan the orders table.
+    Each window is split into a fixed number of buckets and slides one
+    bucket at a time; a symbol keeps at most that many buckets per window,
+    dropping the oldest (and taking it off the running totals) when a new
+    one starts. Prices are in
+    paise. Like the trade tape, the aggregates cover the fills settled by
+    this process since it started.
+    """
+
+    def __init__(self, windows, buckets=60, clock=time.time):
+        self.windows = list(windows)
+        self.buckets = buckets
+        self.clock = clock
+        self._widths = [seconds / buckets for _, seconds in self.windows]
+        self._index = {name: position for position, (name, _) in enumerate(self.windows)}
+        self._lock = threading.Lock()
+        self._flows = {}            # stock_id -> [_Flow per window]
+        self._quotes = {}           # stock_id -> [_Quote per window]
+        self._traders = [_Traders() for _ in self.windows]
+        self._symbols = {}          # stock_id -> symbol
+
+    def _bucket_of(self, at):
+        return [int(at // width) for width in self._widths]
+
+    def record_fill(self, stock_id, user_id, order_type, quantity, price, at=None):
+        bucket_of = self._bucket_of(self.clock() if at is None else at)
+        notional = quantity * price
+        with self._lock:
+            flows = self._flows.get(stock_id)
+            if flows is None:
+                flows = self._flows[stock_id] = [_Flow() for _ in self.windows]
+            for flow, traders, bucket in zip(flows, self._traders, bucket_of):
+                flow.add(bucket, self.buckets, quantity, notional, order_type == 'buy')
+                traders.add(bucket, self.buckets, user_id)
+
+    def record_price(self, stock_id, price, symbol=None, at=None):
+        self.record_prices([(stock_id, symbol, price)], at)
+
+    def record_prices(self, prices, at=None):
+        """Record (stock_id, symbol, price) for many stocks at once; symbol may be None"""
+        bucket_of = self._bucket_of(self.clock() if at is None else at)
+        prices = list(prices)
+        with self._lock:
+            for stock_id, symbol, price in prices:
+                if symbol is not None:
+                    self._symbols[stock_id] = symbol
+                quotes = self._quotes.get(stock_id)
+                if quotes is None:
+                    quotes = self._quotes[stock_id] = [_Quote() for _ in self.windows]
+                for quote, bucket in zip(quotes, bucket_of):
+                    quote.add(bucket, self.buckets, price)
+
+    def summary(self, window, top=10):
+        """
+        Market totals for one window plus its most traded symbols and top
+        gainers and losers. Rupee amounts are floats, as in API responses.
+        """
+        position = self._index[window]
+        oldest = self._bucket_of(self.clock())[position] - self.buckets + 1
+        flows, quotes = {}, {}
+        with self._lock:
+            traders = self._traders[position]
+            traders.expire(oldest)
+            active_traders = len(traders.counts)
+            for stock_id, windows in self._flows.items():
+                flow = windows[position]
+                flow.expire(oldest)
+                if flow.trades:
+                    flows[stock_id] = (flow.volume, flow.notional, flow.trades, flow.buy_volume)
+            for stock_id, windows in self._quotes.items():
+                quote = windows[position]
+                quote.expire(oldest)
+                reference, last = quote.change()
+                if reference:
+                    quotes[stock_id] = (reference, last)
+            symbols = dict(self._symbols)
+
+        changes = [((last - reference) / reference, stock_id) for stock_id, (reference, last) in quotes.items()]
+
+        def row(stock_id):
+            volume, notional, trades, buy_volume = flows.get(stock_id, (0, 0, 0, 0))
+            reference, last = quotes.get(stock_id, (None, None))
+            return {
+                'stock_id': stock_id,
+                'symbol': symbols.get(stock_id),
+                'volume': volume,
+                'buy_volume': buy_volume,
+                'sell_volume': volume - buy_volume,
+                'turnover': from_paise(notional),
+                'trades': trades,
+                'vwap': from_paise(round(notional / volume)) if volume else None,
+                'price': from_paise(last) if last is not None else None,
+                'change_percent': round((last - reference) * 100 / reference, 2) if reference else None
+            }
+
+        most_active = heapq.nlargest(top, flows, key=lambda stock_id: flows[stock_id][1])
+        return {
+            'window': window,
+            'market': {
+                'volume': sum(totals[0] for totals in flows.values()),
+                'turnover': from_paise(sum(totals[1] for totals in flows.values())),
+                'trades': sum(totals[2] for totals in flows.values()),
+                'active_traders': active_traders,
+                'symbols_traded': len(flows),
+                'advancers': sum(1 for change, _ in changes if change > 0),
+                'decliners': sum(1 for change, _ in changes if change < 0)
+            },
+            'most_active': [row(stock_id) for stock_id in most_active],
+            'top_gainers': [row(stock_id) for change, stock_id in heapq.nlargest(top, changes) if change > 0],
+            'top_losers': [row(stock_id) for change, stock_id in heapq.nsmallest(top, changes) if change < 0]
+        }
+
+    def stats(self):
+        with self._lock:
+            return {'symbols': len(self._flows.keys() | self._quotes.keys()),
+                    'windows': [name for name, _ in self.windows]}
@@ -1,25 +1,65 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, g, stream_with_context
 from flask_cors import CORS
 from dotenv import load_dotenv
 import os
-from supabase import create_client, Client
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import threading
-from threading import Thread
 import time
-import random
 import logging
+import uuid
+import socket
+import math
+from zoneinfo import ZoneInfo
 from functools import wraps
 import jwt
-
-# Configure logging
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
+from price_store import PriceStore
+from price_model import create_price_model
+from ledger import AccountLedger, RiskCheckFailed
+from trade_log import TradeLog
+from order_book import OrderBook, TradeTape
+from timing_wheel import TimingWheel
+from analytics import MarketAnalytics, parse_windows
+from engine_store import create_engine_store
+from engine_lifecycle import EngineLifecycle
+from cache_bus import TopicCache, create_cache_bus
+from lazy_client import LazyClient
+from sharding import ShardMembership, create_shard_queue
+from rate_limit import RateLimiter, RateLimitRule, create_bucket_store, parse_rules
+from werkzeug.middleware.proxy_fix import ProxyFix
+from json_response import FastJSONProvider, compress_response, encode_json, rows_response
+from exports import EXPORT_FORMATS, export_chunks
+from order_events import OrderEventHub
+from onboarding import ADMIN_STARTING_SHARES, STARTING_BALANCES, auth_user_creator, onboard, parse_users_csv, validate_users
+from money import centi_to_percent, cost_of_shares, format_inr, from_paise, paise_str, percent_to_centi, to_paise
+from records import Holding, Order, Profile, Stock, decode
+from log_pipeline import LogPipeline, parse_sample_rates
 
 load_dotenv()
 
+# Configure logging: JSON lines written by a background thread through a
+# bounded queue, so a slow log sink drops records instead of stalling requests.
+# Per-tick and per-order engine logs are sampled (LOG_SAMPLE_RATES).
+log_pipeline = LogPipeline(
+    level=getattr(logging, os.getenv('LOG_LEVEL', 'INFO').upper(), logging.INFO),
+    json_format=os.getenv('LOG_FORMAT', 'json').lower() == 'json',
+    async_enabled=os.getenv('LOG_ASYNC', 'true').lower() == 'true',
+    queue_size=int(os.getenv('LOG_QUEUE_SIZE', '10000')),
+    sample_rates=parse_sample_rates(os.getenv('LOG_SAMPLE_RATES', 'app.ticks=0.01,app.matcher=0.1'))
+).install()
+logger = logging.getLogger(__name__)
+tick_logger = logging.getLogger('app.ticks')
+matcher_logger = logging.getLogger('app.matcher')
+
 app = Flask(__name__)
 
+# Encode responses with orjson when available and compress large ones
+app.json = FastJSONProvider(app)
+JSON_COMPRESS_MIN_BYTES = int(os.getenv('JSON_COMPRESS_MIN_BYTES', '1024'))
+
+@app.after_request
+def compress_large_responses(response):
+    return compress_response(response, min_size=JSON_COMPRESS_MIN_BYTES)
+
 # Enable CORS for all routes with proper configuration
 CORS(app, resources={
     r"/*": {
@@ -31,14 +71,109 @@ CORS(app, resources={
 })
 
 # Supabase Configuration
-supabase: Client = create_client(
-    os.getenv('SUPABASE_URL'),
-    os.getenv('SUPABASE_KEY')
-)
+def pooled_supabase_client(name, pool_size):
+    """
+    Create a Supabase client with its own keep-alive connection pool
+    """
+    # supabase and its httpx stack are the slowest imports in the app, so they
+    # are only loaded once a client is first used
+    from supabase_pool import create_pooled_client
+    return create_pooled_client(
+        name,
+        os.getenv('SUPABASE_URL'),
+        os.getenv('SUPABASE_KEY'),
+        max_connections=pool_size,
+        timeout=float(os.getenv('SUPABASE_TIMEOUT', '10')),
+        connect_timeout=float(os.getenv('SUPABASE_CONNECT_TIMEOUT', '3')),
+        pool_timeout=float(os.getenv('SUPABASE_POOL_TIMEOUT', '5')),
+        keepalive_expiry=float(os.getenv('SUPABASE_KEEPALIVE_EXPIRY', '30')),
+        http2=os.getenv('SUPABASE_HTTP2', 'false').lower() == 'true',
+        failure_threshold=int(os.getenv('SUPABASE_BREAKER_THRESHOLD', '5')),
+        reset_timeout=float(os.getenv('SUPABASE_BREAKER_RESET', '30'))
+    )
+
+# Request handlers and background engines get separate pools so a slow
+# engine query cannot starve request threads of connections. Both are built
+# on first use; a serverless instance never runs the engines and never builds
+# the engine client.
+supabase = LazyClient(lambda: pooled_supabase_client('api', int(os.getenv('SUPABASE_API_POOL_SIZE', '10'))))
+engine_supabase = LazyClient(lambda: pooled_supabase_client('engine', int(os.getenv('SUPABASE_ENGINE_POOL_SIZE', '4'))))
+
+# Data access for the background engines: PostgREST by default, or direct
+# SQL with ENGINE_DB_BACKEND=postgres and DATABASE_URL (connects on first use)
+engine_store = LazyClient(lambda: create_engine_store(
+    os.getenv('ENGINE_DB_BACKEND', 'postgrest'),
+    engine_supabase,
+    os.getenv('DATABASE_URL'),
+    pool_size=int(os.getenv('ENGINE_DB_POOL_SIZE', '4'))
+))
 
 # JWT Configuration
 JWT_SECRET = os.getenv('JWT_SECRET', 'your-secret-key')
 
+# Behind PROXY_COUNT reverse proxies (e.g. 1 on Vercel) the client address
+# comes from X-Forwarded-For
+PROXY_COUNT = int(os.getenv('PROXY_COUNT', '0'))
+if PROXY_COUNT:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=PROXY_COUNT)
+
+# Rate limiting: a token bucket per route and user (client IP when the
+# request has no valid token), checked before authentication so throttled
+# requests never reach the database. Buckets are shared through Redis when
+# RATE_LIMIT_REDIS_URL is set. Endpoints in ROUTE_CONCURRENCY also cap the
+# requests in flight per process and shed the rest.
+route_rules = parse_rules(
+    os.getenv('RATE_LIMITS', 'place_order=5/s:10,place_order_batch=1/s:3,buy_stock=2/s:5,'
+                             'sell_stock=2/s:5,get_leaderboard=30/m:10'),
+    os.getenv('ROUTE_CONCURRENCY', 'get_leaderboard=4,export_orders=4,export_all_orders=2,register_users_bulk=1')
+)
+
+# Each order event stream holds a gunicorn thread (Procfile) for up to
+# ORDER_EVENTS_MAX_SECONDS, so streams get a quarter of GUNICORN_THREADS by
+# default and never more than half, leaving threads for every other route
+GUNICORN_THREADS = int(os.getenv('GUNICORN_THREADS', '32'))
+stream_rule = route_rules.setdefault('order_events_stream', RateLimitRule('order_events_stream', None, None))
+stream_cap = stream_rule.max_in_flight or max(1, GUNICORN_THREADS // 4)
+if stream_cap > GUNICORN_THREADS // 2:
+    logger.warning("order_events_stream=%s would take most of the %s gunicorn threads, capping it at %s",
+                   stream_cap, GUNICORN_THREADS, max(1, GUNICORN_THREADS // 2))
+    stream_cap = max(1, GUNICORN_THREADS // 2)
+stream_rule.max_in_flight = stream_cap
+
+rate_limiter = RateLimiter(route_rules, create_bucket_store(os.getenv('RATE_LIMIT_REDIS_URL')))
+
+def rate_limit_key():
+    """User id from the bearer token, verified without a database call, else the client IP"""
+    auth = request.headers.get('Authorization', '')
+    if auth.startswith('Bearer '):
+        try:
+            return 'user:' + jwt.decode(auth[7:], JWT_SECRET, algorithms=['HS256'])['user_id']
+        except Exception:
+            pass
+    return f'ip:{request.remote_addr}'
+
+@app.before_request
+def admit_request():
+    if request.method == 'OPTIONS':
+        return None
+    decision = rate_limiter.admit(request.endpoint, rate_limit_key)
+    if decision is None:
+        return None
+    status, retry_after = decision
+    if status == 'allowed':
+        g.admitted_endpoint = request.endpoint
+        return None
+    retry_header = {'Retry-After': str(max(1, math.ceil(retry_after)))}
+    if status == 'limited':
+        return jsonify({'error': 'Too many requests, please slow down'}), 429, retry_header
+    return jsonify({'error': 'Server is busy, please try again shortly'}), 503, retry_header
+
+@app.teardown_request
+def release_admission(exc):
+    endpoint = g.pop('admitted_endpoint', None)
+    if endpoint is not None:
+        rate_limiter.release(endpoint)
+
 def token_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
@@ -52,15 +187,12 @@ def token_required(f):
         try:
             data = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
             # Get user from database
-            user = supabase.table('profiles').select('*').eq('user_id', data['user_id']).single().execute()
+            user = supabase.table('profiles').select(Profile.COLUMNS).eq('user_id', data['user_id']).single().execute()
             
             if not user.data:
                 return jsonify({'error': 'User not found'}), 401
                 
-            # Add is_admin flag to user data
-            current_user = user.data
-            current_user['user_id'] = data['user_id']
-            current_user['is_admin'] = user.data.get('is_admin', False)
+            current_user = Profile.from_row(user.data)
             
             return f(current_user, *args, **kwargs)
         except Exception as e:
@@ -93,39 +225,415 @@ def admin_required(f):
             
     return decorated
 
-# Global variable to control price update thread
-price_update_running = True
+# Matcher sharding (set up below the order book sync) runs several engine
+# processes side by side, so the price journal, engine checkpoint and trade
+# log default to per-node paths named after MATCHER_NODE_ID
+MATCHER_SHARDING = os.getenv('MATCHER_SHARDING', 'false').lower() == 'true'
+MATCHER_NODE_ID = os.getenv('MATCHER_NODE_ID') or f'{socket.gethostname()}-{os.getpid()}'
+
+def node_path(path):
+    """A default state path, made per node when sharding: trade_log -> trade_log-<node>"""
+    if not MATCHER_SHARDING:
+        return path
+    root, ext = os.path.splitext(path)
+    return f'{root}-{MATCHER_NODE_ID}{ext}'
+
+# Prices live in memory and are flushed to the stocks table in batches
+price_store = PriceStore(
+    lambda rows: engine_store.write_prices(rows),
+    os.getenv('PRICE_JOURNAL_PATH', node_path('price_ticks.journal')),
+    flush_interval=float(os.getenv('PRICE_FLUSH_INTERVAL', '30'))
+)
+price_store.recover()
+
+# Movement for stocks that saw no trades in a tick, computed for all of them
+# at once; 'correlated' moves stocks in a sector (stocks.sector) together
+price_model = create_price_model(
+    os.getenv('PRICE_MODEL', 'correlated'),
+    seed=int(os.getenv('PRICE_MODEL_SEED')) if os.getenv('PRICE_MODEL_SEED') else None,
+    volatility=float(os.getenv('PRICE_VOLATILITY', '0.003')),
+    drift=float(os.getenv('PRICE_DRIFT', '0')),
+    mean_reversion=float(os.getenv('PRICE_MEAN_REVERSION', '0.01')),
+    market_correlation=float(os.getenv('PRICE_MARKET_CORRELATION', '0.3')),
+    sector_correlation=float(os.getenv('PRICE_SECTOR_CORRELATION', '0.5'))
+)
+
+def stock_price(stock):
+    """Latest price in paise for a Stock, preferring the in-memory price store"""
+    price = price_store.get(stock.id)
+    return price if price is not None else stock.current_price
 
 # Order status constants
 ORDER_STATUS_PENDING = 'pending'
 ORDER_STATUS_COMPLETED = 'completed'
 ORDER_STATUS_CANCELLED = 'cancelled'  # Using British spelling to match database constraint
 
+# Pending orders with running per-stock buy/sell volume and price levels,
+# and a ring buffer of recent executions per stock
+order_book = OrderBook()
+trade_tape = TradeTape(int(os.getenv('TRADE_TAPE_SIZE', '200')))
+
+# Rolling volume, turnover, VWAP and price change per stock over sliding
+# windows, for /api/admin/analytics
+market_analytics = MarketAnalytics(
+    parse_windows(os.getenv('ANALYTICS_WINDOWS', '5m,1h,1d')),
+    buckets=int(os.getenv('ANALYTICS_BUCKETS', '60'))
+)
+
+# Time in force: DAY orders expire at MARKET_CLOSE_TIME in MARKET_TIMEZONE,
+# GTD orders at their expires_at, GTC orders never; IOC orders fill at once or
+# are cancelled. Expiries are aware UTC datetimes, whatever the server's zone.
+# Pending orders' expiries sit in a timing wheel that the order_cancellation
+# engine advances every ORDER_EXPIRY_TICK seconds.
+TIME_IN_FORCE = ('DAY', 'GTC', 'IOC', 'GTD')
+ORDER_DEFAULT_TIF = os.getenv('ORDER_DEFAULT_TIF', 'DAY').upper()
+MARKET_TIMEZONE = ZoneInfo(os.getenv('MARKET_TIMEZONE', 'Asia/Kolkata'))
+MARKET_CLOSE_TIME = os.getenv('MARKET_CLOSE_TIME', '15:30')
+ORDER_GTD_MAX_DAYS = int(os.getenv('ORDER_GTD_MAX_DAYS', '90'))
+ORDER_EXPIRY_TICK = float(os.getenv('ORDER_EXPIRY_TICK', '1'))
+EXPIRY_REASONS = {
+    'DAY': 'Order expired at market close',
+    'GTD': 'Order expired at its good-till date'
+}
+expiry_wheel = TimingWheel(tick=ORDER_EXPIRY_TICK)
+# Set once every pending expiry is in the wheel, by the full scan or the checkpoint
+order_expiry_sync = {'loaded': False}
+
+def market_close_after(moment):
+    """The first market close after an aware moment, in UTC"""
+    hour, minute = (int(part) for part in MARKET_CLOSE_TIME.split(':'))
+    local = moment.astimezone(MARKET_TIMEZONE)
+    close = local.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if close <= local:
+        # Wall clock arithmetic, so the close stays at HH:MM across DST changes
+        close += timedelta(days=1)
+    return close.astimezone(timezone.utc)
+
+def order_time_in_force(data, now):
+    """
+    Validate an order request's time_in_force and expires_at against an
+    aware UTC now; an expires_at without an offset is market time.
+    Returns (time_in_force, expires_at aware UTC datetime or None, error).
+    """
+    time_in_force = str(data.get('time_in_force') or ORDER_DEFAULT_TIF).upper()
+    if time_in_force not in TIME_IN_FORCE:
+        return None, None, f"time_in_force must be one of {', '.join(TIME_IN_FORCE)}"
+    if data.get('expires_at') and time_in_force != 'GTD':
+        return None, None, 'expires_at is only allowed with GTD orders'
+    if time_in_force == 'DAY':
+        return time_in_force, market_close_after(now), None
+    if time_in_force != 'GTD':
+        return time_in_force, None, None
+    try:
+        expires_at = datetime.fromisoformat(str(data.get('expires_at')))
+    except ValueError:
+        return None, None, 'GTD orders need an ISO 8601 expires_at'
+    if expires_at.tzinfo is None:
+        expires_at = expires_at.replace(tzinfo=MARKET_TIMEZONE)
+    expires_at = expires_at.astimezone(timezone.utc)
+    if expires_at <= now:
+        return None, None, 'expires_at must be in the future'
+    if expires_at > now + timedelta(days=ORDER_GTD_MAX_DAYS):
+        return None, None, f'expires_at must be within {ORDER_GTD_MAX_DAYS} days'
+    return time_in_force, expires_at, None
+
+def schedule_expiry(order):
+    """Track a pending Order's expiry; orders without expires_at never expire"""
+    if not order.expires_at:
+        return
+    reason = EXPIRY_REASONS.get(order.time_in_force, 'Order expired')
+    expiry_wheel.schedule(order.id, datetime.fromisoformat(order.expires_at).timestamp(), (order.user_id, reason))
+
+# Full order book resync interval; in between the matcher only fetches new orders
+ORDER_BOOK_RESYNC_INTERVAL = float(os.getenv('ORDER_BOOK_RESYNC_INTERVAL', '300'))
+order_book_sync = {'watermark': None, 'resynced_at': 0.0}
+
+def sync_order_book():
+    """
+    Bring the order book up to date with orders placed by other processes.
+    Rebuilds it from every pending order on first use and every
+    ORDER_BOOK_RESYNC_INTERVAL seconds, otherwise only adds orders created
+    since the newest one seen.
+    """
+    now = time.time()
+    if order_book_sync['watermark'] is None or now - order_book_sync['resynced_at'] >= ORDER_BOOK_RESYNC_INTERVAL:
+        orders = engine_store.all_pending_orders()
+        order_book.rebuild(orders)
+        order_book_sync['resynced_at'] = now
+    elif shard_queue is not None:
+        # Sharded: orders are routed to this node by place_order; the full
+        # resync picks up any that were queued while ownership was moving
+        orders = decode(Order, shard_queue.drain(shard_membership.node_id))
+        for order in orders:
+            order_book.add(order)
+    else:
+        # Inclusive, so orders sharing the watermark timestamp are not missed;
+        # the order book ignores ones it already tracks
+        orders = engine_store.pending_orders_since(order_book_sync['watermark'])
+        for order in orders:
+            order_book.add(order)
+    for order in orders:
+        schedule_expiry(order)
+        if order_book_sync['watermark'] is None or order.created_at > order_book_sync['watermark']:
+            order_book_sync['watermark'] = order.created_at
+    if order_book_sync['watermark'] is None:
+        order_book_sync['watermark'] = datetime.now(timezone.utc).isoformat()
+
+# Matcher sharding: with MATCHER_SHARDING=true the processes running the
+# engines on one machine split the stocks between them on a consistent hash
+# ring, and new orders are queued to the node that owns their stock
+shard_membership = None
+shard_queue = None
+if MATCHER_SHARDING:
+    MATCHER_SHARD_DIR = os.getenv('MATCHER_SHARD_DIR', 'matcher_shards')
+    shard_membership = ShardMembership(
+        MATCHER_SHARD_DIR,
+        MATCHER_NODE_ID,
+        ttl=float(os.getenv('MATCHER_SHARD_TTL', '15')),
+        vnodes=int(os.getenv('MATCHER_VNODES', '128'))
+    )
+    shard_queue = create_shard_queue(os.getenv('MATCHER_SHARD_QUEUE', 'spool'), MATCHER_SHARD_DIR)
+
+def owns_stock(stock_id):
+    """Whether this process matches and prices a stock"""
+    return shard_membership is None or shard_membership.owns(stock_id)
+
+def route_order(order):
+    """Queue a new order for the matcher node that owns its stock"""
+    if shard_membership is None:
+        return
+    owner = shard_membership.owner(order.stock_id)
+    if owner is not None:
+        shard_queue.put(owner, order.to_row())
+
+# In-memory cash and share reservations for pre-trade risk checks
+ledger = AccountLedger(reconcile_interval=float(os.getenv('LEDGER_RECONCILE_INTERVAL', '300')))
+
+# Event-sourced record of every balance change the app makes: fills,
+# deposits and cancellations are appended to TRADE_LOG_DIR and compacted into
+# snapshots every TRADE_LOG_SNAPSHOT_EVERY events, so on startup the ledger
+# warms up from the latest snapshot plus a short tail. One process writes a
+# directory; an empty TRADE_LOG_DIR turns the log off.
+TRADE_LOG_DIR = os.getenv('TRADE_LOG_DIR', node_path('trade_log'))
+trade_log = TradeLog(
+    TRADE_LOG_DIR,
+    segment_events=int(os.getenv('TRADE_LOG_SEGMENT_EVENTS', '1000000')),
+    snapshot_every=int(os.getenv('TRADE_LOG_SNAPSHOT_EVERY', '100000')),
+    prune=os.getenv('TRADE_LOG_PRUNE', 'false').lower() == 'true'
+) if TRADE_LOG_DIR else None
+
+def record_trade_event(event, *args, **kwargs):
+    """
+    Append a 'fill', 'deposit', 'cancel' or 'open_account' event to the trade log.
+    The database write has already happened, so a failed append is logged
+    rather than failing the request.
+    """
+    if trade_log is None:
+        return
+    try:
+        getattr(trade_log, event)(*args, **kwargs)
+    except Exception as e:
+        logger.error("Error appending %s to trade log: %s", event, e)
+
+def warm_ledger_from_trade_log():
+    """
+    Load every account the trade log knows into the ledger instead of two
+    queries per user on their first request. Pending orders to reserve come
+    from the order book when the engine checkpoint restored it, plus those
+    placed since; otherwise from one paged query for all of them.
+    """
+    if trade_log is None:
+        return 0
+    try:
+        accounts = trade_log.accounts()
+        if not accounts:
+            return 0
+        if order_book_sync['watermark'] is not None:
+            pending_orders = order_book.orders() + engine_store.pending_orders_since(order_book_sync['watermark'])
+        else:
+            pending_orders = engine_store.all_pending_orders()
+        loaded = ledger.warm(accounts, pending_orders)
+        logger.info("Warmed %s ledger accounts from the trade log", loaded)
+        return loaded
+    except Exception as e:
+        logger.error("Error warming ledger from trade log: %s", e)
+        return 0
+
+def ensure_ledger_account(current_user):
+    """
+    Load the user's account into the ledger on first use
+    Returns the ledger account
+    """
+    user_id = current_user.user_id
+    if ledger.is_stale(user_id):
+        # Another process changed the account since it was loaded here
+        ledger.reconcile(lambda user_ids: fetch_ledger_snapshot(user_ids, supabase), [user_id])
+    if not ledger.has_account(user_id):
+        holdings = supabase.table('user_stocks').select('stock_id, quantity').eq('user_id', user_id).execute()
+        pending = supabase.table('orders')\
+            .select('id, user_id, stock_id, type, quantity, price')\
+            .eq('user_id', user_id)\
+            .eq('status', ORDER_STATUS_PENDING)\
+            .execute()
+        shares = {holding.stock_id: holding.quantity for holding in decode(Holding, holdings.data)}
+        ledger.load_account(user_id, current_user.balance, shares, decode(Order, pending.data))
+        # Accounts that predate the trade log start from their database balance
+        record_trade_event('open_account', user_id, current_user.balance, shares)
+    return ledger.get_account(user_id)
+
+def fetch_ledger_snapshot(user_ids, client=None):
+    """
+    Fetch balances, holdings and pending orders for ledger reconciliation,
+    through the engine client unless another is given
+    """
+    client = client if client is not None else engine_supabase
+    balances = {}
+    holdings = {}
+    pending_orders = []
+    # Chunk the id lists to keep PostgREST URLs short
+    for i in range(0, len(user_ids), 200):
+        chunk = user_ids[i:i + 200]
+        profiles = client.table('profiles').select('user_id, balance').in_('user_id', chunk).execute()
+        for profile in decode(Profile, profiles.data):
+            balances[profile.user_id] = profile.balance
+        user_stocks = client.table('user_stocks').select('user_id, stock_id, quantity').in_('user_id', chunk).execute()
+        for holding in decode(Holding, user_stocks.data):
+            holdings.setdefault(holding.user_id, {})[holding.stock_id] = holding.quantity
+        pending = client.table('orders')\
+            .select('id, user_id, stock_id, type, quantity, price')\
+            .in_('user_id', chunk)\
+            .eq('status', ORDER_STATUS_PENDING)\
+            .execute()
+        pending_orders.extend(decode(Order, pending.data))
+    return balances, holdings, pending_orders
+
+# Cache coherence between processes: each process keeps prices, ledger
+# accounts and a few read-mostly tables in memory and tells the others what
+# it changed over the cache bus: Unix sockets between the processes on one
+# machine (CACHE_BUS=socket) or Postgres LISTEN/NOTIFY on DATABASE_URL across
+# machines (CACHE_BUS=postgres). Cached tables are reloaded after CACHE_TTL
+# seconds even without a message; with CACHE_BUS=off they are not cached.
+cache_bus = create_cache_bus(
+    os.getenv('CACHE_BUS', 'socket'),
+    os.getenv('DATABASE_URL'),
+    directory=os.getenv('CACHE_BUS_DIR', 'cache_bus'),
+    channel=os.getenv('CACHE_BUS_CHANNEL', 'cache_bus')
+)
+CACHE_TTL = float(os.getenv('CACHE_TTL', '60')) if cache_bus.coherent else 0
+market_state_cache = TopicCache(CACHE_TTL)
+stock_list_cache = TopicCache(CACHE_TTL)
+news_cache = TopicCache(CACHE_TTL)
+
+def apply_remote_prices(ticks):
+    # Prices live in the writer's memory until its next flush, so ticks
+    # carry the values; after lost messages the next tick catches up
+    if ticks is not None:
+        price_store.apply(ticks)
+
+cache_bus.subscribe('market_state', lambda payload: market_state_cache.invalidate())
+cache_bus.subscribe('stocks', lambda payload: stock_list_cache.invalidate())
+cache_bus.subscribe('news', lambda payload: news_cache.invalidate())
+cache_bus.subscribe('prices', apply_remote_prices)
+cache_bus.subscribe('accounts', ledger.mark_stale)
+cache_bus.start()
+
+def broadcast_invalidation(cache, topic, payload=None):
+    """Drop a cached table here and in the other processes"""
+    cache.invalidate()
+    cache_bus.publish(topic, payload)
+
+def publish_prices(ticks):
+    """Send (stock_id, price paise, change) ticks to the other processes' price stores"""
+    if ticks:
+        cache_bus.publish('prices', [list(tick) for tick in ticks])
+
+def publish_accounts(user_ids):
+    """Tell the other processes these users' balances, holdings or reservations changed"""
+    user_ids = sorted(set(user_ids))
+    if user_ids:
+        cache_bus.publish('accounts', user_ids)
+
+# Per-user push channel for order fills and cancellations (GET /api/orders/events).
+# A fill is often made by another process (the engine process, or another
+# matcher shard node), so events are relayed over the cache bus and each
+# process pushes them to its own streams. With CACHE_BUS=off a stream only
+# sees events made by the process serving it.
+order_events = OrderEventHub(
+    buffer_size=int(os.getenv('ORDER_EVENTS_BUFFER', '256')),
+    max_queue=int(os.getenv('ORDER_EVENTS_QUEUE', '1000'))
+)
+
+def relay_order_events(events):
+    # Events lost with a resync are gone; the hub's buffer only covers this process
+    for user_id, event, data in events or ():
+        order_events.publish(user_id, event, data)
+
+cache_bus.subscribe('order_events', relay_order_events)
+ORDER_EVENTS_HEARTBEAT = float(os.getenv('ORDER_EVENTS_HEARTBEAT', '15'))
+ORDER_EVENTS_MAX_SECONDS = float(os.getenv('ORDER_EVENTS_MAX_SECONDS', '300'))
+
+def publish_order_event(order, status, executed_price=None, error=None, executed_at=None):
+    """
+    Push an Order's new status to its owner's open event streams, in this
+    process and, over the cache bus, the others. executed_price is in paise.
+    """
+    try:
+        data = {
+            'order_id': order.id,
+            'stock_id': order.stock_id,
+            'type': order.type,
+            'quantity': order.quantity,
+            'status': status,
+            'executed_price': from_paise(executed_price) if executed_price is not None else None,
+            'executed_at': executed_at,
+            'error': error
+        }
+        order_events.publish(order.user_id, 'order', data)
+        cache_bus.publish('order_events', [[order.user_id, 'order', data]])
+    except Exception as e:
+        logger.error("Error publishing order event: %s", e)
+
+def update_order_status(order_id, status, executed_price=None, error=None):
+    """
+    Move a pending order to completed or cancelled, settle or release its
+    ledger reservation and drop it from the order book. The update only
+    applies while the order is still pending, so an order the expiry engine
+    cancelled is never filled; result.data is empty when nothing changed.
+    executed_price is in paise.
+    """
+    update = {'status': status}
+    if status == ORDER_STATUS_COMPLETED:
+        update['executed_at'] = datetime.now(timezone.utc).isoformat()
+        if executed_price is not None:
+            update['executed_price'] = paise_str(executed_price)
+    if error:
+        update['error'] = error
+    result = engine_supabase.table('orders').update(update).eq('id', order_id)\
+        .eq('status', ORDER_STATUS_PENDING).execute()
+
+    order_book.remove(order_id)
+    expiry_wheel.cancel(order_id)
+    if not result.data:
+        return result
+    if status == ORDER_STATUS_COMPLETED and executed_price is not None:
+        ledger.settle(order_id, executed_price)
+    elif status == ORDER_STATUS_CANCELLED:
+        ledger.release(order_id)
+        record_trade_event('cancel', order_id)
+    for row in result.data:
+        publish_order_event(Order.from_row(row), status, executed_price, error or row.get('error'),
+                            update.get('executed_at'))
+    publish_accounts(row['user_id'] for row in result.data)
+    return result
+
 def calculate_price_change(stock_id):
     """
     Calculate price change based on market demand and supply
     Returns the percentage change in price
     """
     try:
-        # Get pending buy orders (demand)
-        buy_orders = supabase.table('orders')\
-            .select('quantity')\
-            .eq('stock_id', stock_id)\
-            .eq('type', 'buy')\
-            .eq('status', 'pending')\
-            .execute()
-            
-        total_demand = sum(float(order['quantity']) for order in buy_orders.data) if buy_orders.data else 0
-        
-        # Get pending sell orders (supply)
-        sell_orders = supabase.table('orders')\
-            .select('quantity')\
-            .eq('stock_id', stock_id)\
-            .eq('type', 'sell')\
-            .eq('status', 'pending')\
-            .execute()
-            
-        total_supply = sum(float(order['quantity']) for order in sell_orders.data) if sell_orders.data else 0
+        # Pending demand and supply are maintained incrementally by the order book
+        total_demand, total_supply = order_book.volume(stock_id)
         
         if total_supply == 0:
             return 0  # No price change if there's no supply
@@ -142,350 +650,459 @@ def calculate_price_change(stock_id):
         return change
         
     except Exception as e:
-        print(f"Error calculating price change: {str(e)}")
+        logger.error("Error calculating price change: %s", e)
         return 0
 
 def update_stock_prices():
     """
     Background thread function to update stock prices based on trading activity
     """
-    while True:
-        try:
-            with app.app_context():  # Add Flask app context
-                # Get all stocks
-                stocks = supabase.table('stocks').select('*').execute()
-                
-                for stock in stocks.data:
-                    try:
-                        # Get recent completed orders for this stock (last 30 seconds)
-                        two_minutes_ago = (datetime.now() - timedelta(seconds=30)).isoformat()
-                        recent_orders = supabase.table('orders')\
-                            .select('*')\
-                            .eq('stock_id', stock['id'])\
-                            .eq('status', ORDER_STATUS_COMPLETED)\
-                            .gt('executed_at', two_minutes_ago)\
-                            .execute()
-                        
-                        if recent_orders.data:
-                            # Calculate price change based on buy/sell pressure
-                            total_buy_quantity = sum(order['quantity'] for order in recent_orders.data if order['type'] == 'buy')
-                            total_sell_quantity = sum(order['quantity'] for order in recent_orders.data if order['type'] == 'sell')
-                            
-                            # Calculate net pressure (-1 to 1 range)
-                            total_volume = total_buy_quantity + total_sell_quantity
-                            if total_volume > 0:
-                                pressure = (total_buy_quantity - total_sell_quantity) / total_volume
-                            else:
-                                pressure = 0
-                            
-                            # Calculate price change (up to 2% per update)
-                            max_change_percent = 0.02  # 2% maximum change
-                            change_percent = pressure * max_change_percent
-                            
-                            # Apply change to current price
-                            current_price = float(stock['current_price'])
-                            price_change = current_price * change_percent
-                            new_price = current_price + price_change
-                            
-                            # Set default min_price if not present
-                            min_price = 0.01  # Minimum 1 cent
-                            if 'min_price' in stock and stock['min_price']:
-                                try:
-                                    min_price = max(0.01, float(stock['min_price']))
-                                except (TypeError, ValueError):
-                                    pass
-                            
-                            # Set default max_price if not present
-                            max_price = float('inf')
-                            if 'max_price' in stock and stock['max_price']:
-                                try:
-                                    max_price = float(stock['max_price'])
-                                except (TypeError, ValueError):
-                                    pass
-                            
-                            # Ensure price stays within bounds
-                            new_price = max(min_price, min(max_price, new_price))
-                            
-                            # Update stock price and price change
-                            price_change_percent = ((new_price - current_price) / current_price) * 100
-                            update_result = supabase.table('stocks').update({
-                                'current_price': str(round(new_price, 2)),
-                                'price_change': round(price_change_percent, 2)
-                            }).eq('id', stock['id']).execute()
-                            
-                            if update_result.data:
-                                logger.info(f"Updated price for {stock['symbol']} to {new_price:.2f} (pressure: {pressure:.2%})")
-                            else:
-                                logger.error(f"Failed to update price for {stock['symbol']}")
-                        else:
-                            # If no recent trades, add small random movement (-0.5% to +0.5%)
-                            current_price = float(stock['current_price'])
-                            random_change = current_price * (random.uniform(-0.005, 0.005))
-                            new_price = current_price + random_change
-                            
-                            # Set default min_price if not present
-                            min_price = 0.01  # Minimum 1 cent
-                            if 'min_price' in stock and stock['min_price']:
-                                try:
-                                    min_price = max(0.01, float(stock['min_price']))
-                                except (TypeError, ValueError):
-                                    pass
-                            
-                            # Set default max_price if not present
-                            max_price = float('inf')
-                            if 'max_price' in stock and stock['max_price']:
-                                try:
-                                    max_price = float(stock['max_price'])
-                                except (TypeError, ValueError):
-                                    pass
-                            
-                            # Ensure price stays within bounds
-                            new_price = max(min_price, min(max_price, new_price))
+    while engines.running('price_update'):
+        with engines.cycle('price_update'):
+            try:
+                with app.app_context():  # Add Flask app context
+                    # Get all stocks
+                    stocks = engine_store.fetch_stocks()
+                    price_store.seed(stocks)
+                    owned = [stock for stock in stocks if owns_stock(stock.id)]
+                    simulated = price_model.step(
+                        {stock.id: stock_price(stock) for stock in owned},
+                        {stock.id: stock.sector for stock in owned}
+                    )
+                    ticks = []
+                    
+                    for stock in stocks:
+                        if not owns_stock(stock.id):
+                            continue
+                        try:
+                            # Get recent completed orders for this stock (last 30 seconds)
+                            two_minutes_ago = (datetime.now(timezone.utc) - timedelta(seconds=30)).isoformat()
+                            recent_fills = engine_store.recent_fills(stock.id, two_minutes_ago)
                             
-                            # Update stock price and price change
-                            price_change_percent = ((new_price - current_price) / current_price) * 100
-                            update_result = supabase.table('stocks').update({
-                                'current_price': str(round(new_price, 2)),
-                                'price_change': round(price_change_percent, 2)
-                            }).eq('id', stock['id']).execute()
+                            # Price bands in paise, if the stock has them
+                            min_price = max(1, stock.min_price or 1)  # Minimum 1 paisa
+                            max_price = stock.max_price
                             
-                            if update_result.data:
-                                logger.info(f"Updated price for {stock['symbol']} to {new_price:.2f} (random movement)")
+                            if recent_fills:
+                                # Calculate price change based on buy/sell pressure
+                                total_buy_quantity = sum(quantity for order_type, quantity in recent_fills if order_type == 'buy')
+                                total_sell_quantity = sum(quantity for order_type, quantity in recent_fills if order_type == 'sell')
+                                
+                                # Calculate net pressure (-1 to 1 range)
+                                total_volume = total_buy_quantity + total_sell_quantity
+                                if total_volume > 0:
+                                    pressure = (total_buy_quantity - total_sell_quantity) / total_volume
+                                else:
+                                    pressure = 0
+                                
+                                # Calculate price change (up to 2% per update)
+                                max_change_percent = 0.02  # 2% maximum change
+                                change_percent = pressure * max_change_percent
+                                
+                                # Apply change to current price (paise)
+                                current_price = stock_price(stock)
+                                price_change = round(current_price * change_percent)
+                                new_price = current_price + price_change
+                                
+                                # Ensure price stays within bounds
+                                if max_price is not None:
+                                    new_price = min(max_price, new_price)
+                                new_price = max(min_price, new_price)
+                                
+                                # Update stock price and price change (hundredths of a percent);
+                                # the price store journals the tick and writes it on the next flush
+                                price_change_centi = round((new_price - current_price) * 10000 / current_price)
+                                price_store.set(stock.id, new_price, price_change_centi)
+                                ticks.append((stock.id, new_price, price_change_centi))
+                                tick_logger.info("Updated price for %s to %s (pressure: %.2f%%)", stock.symbol, paise_str(new_price), pressure * 100)
                             else:
-                                logger.error(f"Failed to update price for {stock['symbol']}")
+                                # If no recent trades, move with the price model
+                                current_price = stock_price(stock)
+                                new_price = simulated[stock.id]
                                 
-                    except Exception as e:
-                        logger.error(f"Error updating price for stock {stock['symbol']}: {str(e)}")
-                        continue
-                    
-        except Exception as e:
-            logger.error(f"Error in update_stock_prices: {str(e)}")
+                                # Ensure price stays within bounds
+                                if max_price is not None:
+                                    new_price = min(max_price, new_price)
+                                new_price = max(min_price, new_price)
+                                
+                                # Update stock price and price change (hundredths of a percent);
+                                # the price store journals the tick and writes it on the next flush
+                                price_change_centi = round((new_price - current_price) * 10000 / current_price)
+                                price_store.set(stock.id, new_price, price_change_centi)
+                                ticks.append((stock.id, new_price, price_change_centi))
+                                tick_logger.info("Updated price for %s to %s (%s model)", stock.symbol, paise_str(new_price), price_model.name)
+                                    
+                        except Exception as e:
+                            logger.error("Error updating price for stock %s: %s", stock.symbol, e)
+                            continue
+
+                    publish_prices(ticks)
+                    market_analytics.record_prices((stock.id, stock.symbol, stock_price(stock)) for stock in stocks)
+                        
+            except Exception as e:
+                logger.error("Error in update_stock_prices: %s", e)
         
         # Update every 30 seconds
-        time.sleep(30)
+        engines.sleep('price_update', 30)
+
+def sale_pnl(holding, quantity, proceeds):
+    """
+    Cost in paise of selling quantity shares of a Holding at its average
+    cost, and the realized P&L on proceeds paise
+    """
+    sold_cost = cost_of_shares(holding.cost_basis, holding.quantity, quantity)
+    return sold_cost, proceeds - sold_cost
 
 def process_order(order_id, current_price):
     """
-    Process a single order
+    Process a single order at current_price (paise)
     Returns True if order was processed successfully, False otherwise
     """
     try:
         # Get order details
-        order = supabase.table('orders').select('*').eq('id', order_id).single().execute()
+        order = engine_supabase.table('orders').select(Order.COLUMNS).eq('id', order_id).single().execute()
         if not order.data:
             return False
             
-        order = order.data
+        order = Order.from_row(order.data)
+        # Cancelled or filled since the matcher listed it, e.g. expired
+        if order.status != ORDER_STATUS_PENDING:
+            order_book.remove(order_id)
+            return False
         
         # Get user's profile
-        user = supabase.table('profiles').select('*').eq('user_id', order['user_id']).single().execute()
+        user = engine_supabase.table('profiles').select(Profile.COLUMNS).eq('user_id', order.user_id).single().execute()
         if not user.data:
             update_order_status(order_id, ORDER_STATUS_CANCELLED)
             return False
             
-        user = user.data
-        balance = float(user['balance'])
+        user = Profile.from_row(user.data)
+        balance = user.balance
         
-        if order['type'] == 'buy':
-            total_cost = current_price * order['quantity']
+        # The user's holding of the stock, if any
+        holdings = engine_supabase.table('user_stocks').select(Holding.COLUMNS).eq('user_id', order.user_id).eq('stock_id', order.stock_id).execute()
+        holding = Holding.from_row(holdings.data[0]) if holdings.data else None
+        
+        if order.type == 'buy':
+            total_cost = current_price * order.quantity
             
             # Check if user has enough balance
             if balance < total_cost:
                 update_order_status(order_id, ORDER_STATUS_CANCELLED)
                 return False
+            # Claim the order before moving money; it may have expired meanwhile
+            claim = update_order_status(order_id, ORDER_STATUS_COMPLETED, executed_price=current_price)
+            if not claim.data:
+                return False
                 
             # Update user's balance
             new_balance = balance - total_cost
-            supabase.table('profiles').update({'balance': str(new_balance)}).eq('user_id', order['user_id']).execute()
+            engine_supabase.table('profiles').update({'balance': paise_str(new_balance)}).eq('user_id', order.user_id).execute()
             
             # Update or create user's stock holding
-            holdings = supabase.table('user_stocks').select('*').eq('user_id', order['user_id']).eq('stock_id', order['stock_id']).execute()
-            
-            if holdings.data:
-                new_quantity = holdings.data[0]['quantity'] + order['quantity']
-                supabase.table('user_stocks').update({'quantity': new_quantity}).eq('id', holdings.data[0]['id']).execute()
+            if holding is not None:
+                engine_supabase.table('user_stocks').update({
+                    'quantity': holding.quantity + order.quantity,
+                    'cost_basis': paise_str(holding.cost_basis + total_cost)
+                }).eq('id', holding.id).execute()
             else:
-                supabase.table('user_stocks').insert({
-                    'user_id': order['user_id'],
-                    'stock_id': order['stock_id'],
-                    'quantity': order['quantity']
+                engine_supabase.table('user_stocks').insert({
+                    'user_id': order.user_id,
+                    'stock_id': order.stock_id,
+                    'quantity': order.quantity,
+                    'cost_basis': paise_str(total_cost)
                 }).execute()
                 
         else:  # sell order
             # Check if user has enough stocks
-            holdings = supabase.table('user_stocks').select('*').eq('user_id', order['user_id']).eq('stock_id', order['stock_id']).execute()
-            
-            if not holdings.data or holdings.data[0]['quantity'] < order['quantity']:
+            if holding is None or holding.quantity < order.quantity:
                 update_order_status(order_id, ORDER_STATUS_CANCELLED)
                 return False
+            # Claim the order before moving shares, as for buys
+            claim = update_order_status(order_id, ORDER_STATUS_COMPLETED, executed_price=current_price)
+            if not claim.data:
+                return False
                 
-            total_value = current_price * order['quantity']
+            total_value = current_price * order.quantity
+            sold_cost, realized = sale_pnl(holding, order.quantity, total_value)
             
             # Update user's balance
             new_balance = balance + total_value
-            supabase.table('profiles').update({'balance': str(new_balance)}).eq('user_id', order['user_id']).execute()
+            engine_supabase.table('profiles').update({
+                'balance': paise_str(new_balance),
+                'realized_pnl': paise_str(user.realized_pnl + realized)
+            }).eq('user_id', order.user_id).execute()
             
             # Update holdings
-            new_quantity = holdings.data[0]['quantity'] - order['quantity']
+            new_quantity = holding.quantity - order.quantity
             if new_quantity > 0:
-                supabase.table('user_stocks').update({'quantity': new_quantity}).eq('id', holdings.data[0]['id']).execute()
+                engine_supabase.table('user_stocks').update({
+                    'quantity': new_quantity,
+                    'cost_basis': paise_str(holding.cost_basis - sold_cost),
+                    'realized_pnl': paise_str(holding.realized_pnl + realized)
+                }).eq('id', holding.id).execute()
             else:
-                supabase.table('user_stocks').delete().eq('id', holdings.data[0]['id']).execute()
+                engine_supabase.table('user_stocks').delete().eq('id', holding.id).execute()
         
-        # Mark order as completed with the current price
-        update_order_status(order_id, ORDER_STATUS_COMPLETED, executed_price=current_price)
-        
-        # Record the transaction
-        supabase.table('orders').insert({
-            'user_id': order['user_id'],
-            'stock_id': order['stock_id'],
-            'type': order['type'],
-            'quantity': order['quantity'],
-            'price': str(current_price),
-            'total_amount': str(total_value if order['type'] == 'sell' else total_cost),
-            'order_id': order_id,
-            'created_at': datetime.now().isoformat()
-        }).execute()
+        record_trade_event('fill', order.user_id, order.stock_id, order.type, order.quantity,
+                           current_price, order_id)
+        # Stamped with the executed_at the order row got, in UTC
+        trade_tape.record(order.stock_id, order.type, order.quantity, current_price,
+                          claim.data[0]['executed_at'], order_id)
+        market_analytics.record_fill(order.stock_id, order.user_id, order.type, order.quantity,
+                                     current_price)
         
+        # The completed order row itself records the execution
         return True
         
     except Exception as e:
         error_message = str(e)
-        print(f"Error processing order: {error_message}")
+        logger.error("Error processing order: %s", error_message)
         update_order_status(order_id, ORDER_STATUS_CANCELLED)
         return False
 
+def match_stock(stock_id, current_price, pending_orders):
+    """
+    Move a stock's price by the buy/sell imbalance of its pending orders
+    and settle every order at the new price.
+    Returns the number of orders filled.
+    """
+    for order in pending_orders:
+        order_book.add(order)
+    total_buy_quantity, total_sell_quantity = order_book.volume(stock_id)
+    
+    # Calculate new price based on supply and demand
+    price_change = 0
+    if total_buy_quantity > total_sell_quantity:
+        # More demand than supply, price goes up
+        price_change = 0.01 * (total_buy_quantity - total_sell_quantity) / 1000
+    elif total_sell_quantity > total_buy_quantity:
+        # More supply than demand, price goes down
+        price_change = -0.01 * (total_sell_quantity - total_buy_quantity) / 1000
+    
+    new_price = current_price + round(current_price * price_change)
+    new_price = max(100, new_price)  # Ensure price doesn't go below ₹1
+    
+    # Update stock price in the price store (flushed in batches)
+    price_change_centi = percent_to_centi(price_change * 100)
+    price_store.set(stock_id, new_price, price_change_centi)
+    publish_prices([(stock_id, new_price, price_change_centi)])
+    market_analytics.record_price(stock_id, new_price)
+    
+    # Second pass: process all orders with the new price
+    filled = 0
+    for order in pending_orders:
+        if process_order(order.id, new_price):
+            filled += 1
+            matcher_logger.info("Successfully processed order %s", order.id)
+        else:
+            matcher_logger.info("Failed to process order %s", order.id)
+    return filled
+
+def pending_orders_for(stock_id):
+    """
+    A stock's pending Orders to match. Sharded nodes take them from the
+    order book, which the shard queue keeps current and the periodic full
+    resync corrects, rather than querying the orders table for every stock;
+    process_order re-reads each order before settling it.
+    """
+    if shard_queue is None:
+        return engine_store.pending_orders(stock_id)
+    sync_order_book()
+    return order_book.orders(stock_id)
+
 def process_pending_orders():
     """
     Background thread function to process pending orders
     """
-    while True:
-        try:
-            # Check if market is active
-            market_state = get_market_state()
-            if not market_state or not market_state.get('is_active', False):
-                logger.info("Market is closed. Skipping order processing.")
-                time.sleep(5)
-                continue
-
-            # Get all stocks to process orders stock by stock
-            stocks = supabase.table('stocks').select('*').execute()
-            
-            for stock in stocks.data:
-                stock_id = stock['id']
-                current_price = float(stock['current_price'])
-                
-                # Get all pending orders for this stock
-                # Use rpc call to bypass RLS
-                pending_orders = supabase.rpc('get_pending_orders', {
-                    'stock_id_param': stock_id
-                }).execute()
-                
-                if not pending_orders.data:
-                    continue
-                
-                print(f"Processing {len(pending_orders.data)} orders for stock {stock['symbol']}")
-                
-                # Wait for 2 minutes to collect orders
-                time.sleep(120)
-                
-                # Get updated list of orders after waiting
-                pending_orders = supabase.rpc('get_pending_orders', {
-                    'stock_id_param': stock_id
-                }).execute()
-                
-                if not pending_orders.data:
+    while engines.running('order_processing'):
+        with engines.cycle('order_processing'):
+            try:
+                # Check if market is active
+                if not check_market_state():
+                    logger.info("Market is closed. Skipping order processing.")
+                    engines.sleep('order_processing', 5)
                     continue
+
+                # Pick up orders placed by other processes
+                sync_order_book()
+
+                # Get all stocks to process orders stock by stock
+                stocks = engine_store.fetch_stocks()
+                price_store.seed(stocks)
                 
-                # Process all pending orders for this stock
-                total_buy_quantity = 0
-                total_sell_quantity = 0
-                
-                # First pass: calculate total buy and sell quantities
-                for order in pending_orders.data:
-                    if order['type'] == 'buy':
-                        total_buy_quantity += order['quantity']
-                    else:
-                        total_sell_quantity += order['quantity']
-                
-                # Calculate new price based on supply and demand
-                price_change = 0
-                if total_buy_quantity > total_sell_quantity:
-                    # More demand than supply, price goes up
-                    price_change = 0.01 * (total_buy_quantity - total_sell_quantity) / 1000
-                elif total_sell_quantity > total_buy_quantity:
-                    # More supply than demand, price goes down
-                    price_change = -0.01 * (total_sell_quantity - total_buy_quantity) / 1000
-                
-                new_price = round(current_price * (1 + price_change), 2)
-                new_price = max(1.0, new_price)  # Ensure price doesn't go below 1
-                
-                # Update stock price using rpc call
-                supabase.rpc('update_stock_price', {
-                    'stock_id_param': stock_id,
-                    'new_price_param': str(new_price),
-                    'price_change_param': str(round(price_change * 100, 2))
-                }).execute()
-                
-                # Second pass: process all orders with the new price
-                for order in pending_orders.data:
-                    success = process_order(order['id'], new_price)
-                    if success:
-                        print(f"Successfully processed order {order['id']}")
-                    else:
-                        print(f"Failed to process order {order['id']}")
-                
-        except Exception as e:
-            print(f"Error in order processing thread: {str(e)}")
+                for stock in stocks:
+                    # Draining: finish the stock in flight, leave the rest pending
+                    if engines.stopping('order_processing'):
+                        break
+                    stock_id = stock.id
+                    if not owns_stock(stock_id):
+                        continue
+                    current_price = stock_price(stock)
+                    
+                    # Get all pending orders for this stock
+                    pending_orders = pending_orders_for(stock_id)
+                    
+                    if not pending_orders:
+                        continue
+                    
+                    matcher_logger.info("Processing %s orders for stock %s", len(pending_orders), stock.symbol)
+                    
+                    # Wait for 2 minutes to collect orders; nothing has been
+                    # touched yet, so a stop can abandon the wait
+                    if not engines.sleep('order_processing', 120):
+                        break
+                    
+                    # Get updated list of orders after waiting
+                    pending_orders = pending_orders_for(stock_id)
+                    
+                    # The stock may have moved to another node during the wait
+                    if not pending_orders or not owns_stock(stock_id):
+                        continue
+                    
+                    match_stock(stock_id, current_price, pending_orders)
+                    
+            except Exception as e:
+                logger.error("Error in order processing thread: %s", e)
             
-        time.sleep(5)  # Small delay before next iteration
+        engines.sleep('order_processing', 5)  # Small delay before next iteration
 
-def cancel_stale_orders():
+def cancel_expired_orders(due):
     """
-    Background thread function to cancel stale pending orders
+    Cancel orders whose time in force ran out, one bulk update per reason.
+    If the update fails they are retried on the next tick.
     """
-    while True:
+    by_reason = {}
+    for order_id, (user_id, reason) in due:
+        by_reason.setdefault(reason, {})[order_id] = user_id
+    for reason, owners in by_reason.items():
         try:
-            # Get orders that have been pending for more than 5 minutes
-            five_minutes_ago = (datetime.now() - timedelta(minutes=2)).isoformat()
-            
-            # Find stale pending orders
-            stale_orders = supabase.table('orders')\
-                .select('*')\
-                .eq('status', ORDER_STATUS_PENDING)\
-                .lt('created_at', five_minutes_ago)\
-                .execute()
-            
-            if stale_orders.data:
-                logger.info(f"Found {len(stale_orders.data)} stale orders to cancel")
-                for order in stale_orders.data:
-                    try:
-                        # Update order status to cancelled
-                        update_result = supabase.table('orders').update({
-                            'status': ORDER_STATUS_CANCELLED,
-                            'error': 'Order timed out after 5 minutes'
-                        }).eq('id', order['id']).execute()
-                        
-                        if update_result.data:
-                            logger.info(f"Successfully cancelled stale order {order['id']}")
-                        else:
-                            logger.error(f"Failed to cancel stale order {order['id']}")
-                    except Exception as e:
-                        logger.error(f"Error cancelling stale order {order['id']}: {str(e)}")
-            
+            cancelled = engine_store.cancel_orders(list(owners), reason)
         except Exception as e:
-            logger.error(f"Error in cancel_stale_orders: {str(e)}")
-        
-        # Check every minute
-        time.sleep(60)
+            logger.error("Error cancelling expired orders: %s", e)
+            for order_id, user_id in owners.items():
+                expiry_wheel.schedule(order_id, time.time() + ORDER_EXPIRY_TICK, (user_id, reason))
+            continue
+        for order_id in cancelled:
+            ledger.release(order_id)
+            order_book.remove(order_id)
+            record_trade_event('cancel', order_id)
+            publish_order_event(Order(order_id, owners[order_id]), ORDER_STATUS_CANCELLED, error=reason)
+        if cancelled:
+            publish_accounts(owners[order_id] for order_id in cancelled)
+            logger.info("Cancelled %s expired orders (%s)", len(cancelled), reason)
+
+def expire_orders():
+    """
+    Background thread function to cancel orders as their time in force runs
+    out. Every pending order with an expiry is loaded into the wheel once,
+    unless the engine checkpoint restored them; after that the wheel is fed
+    by order placement and order book syncs, and each tick only touches the
+    orders that are due.
+    """
+    while engines.running('order_cancellation'):
+        with engines.cycle('order_cancellation'):
+            try:
+                if not order_expiry_sync['loaded']:
+                    for order in engine_store.expiring_orders():
+                        schedule_expiry(order)
+                    order_expiry_sync['loaded'] = True
+                    logger.info("Tracking %s order expiries", len(expiry_wheel))
+                due = expiry_wheel.advance()
+                if due:
+                    cancel_expired_orders(due)
+            except Exception as e:
+                logger.error("Error in expire_orders: %s", e)
+
+        engines.sleep('order_cancellation', ORDER_EXPIRY_TICK)
+
+def run_shard_membership():
+    """
+    Background thread function keeping this matcher node in the ring;
+    on stop the node leaves and hands its queued orders to the new owners
+    """
+    while engines.running('shard_membership'):
+        with engines.cycle('shard_membership'):
+            try:
+                shard_membership.heartbeat()
+            except Exception as e:
+                logger.error("Error in shard heartbeat: %s", e)
+        engines.sleep('shard_membership', shard_membership.ttl / 3)
+    shard_membership.leave(shard_queue)
+
+# Background engines: started, paused and drained by the lifecycle controller
+engines = EngineLifecycle(os.getenv('ENGINE_CHECKPOINT_PATH', node_path('engine_checkpoint.json')))
+ENGINE_DRAIN_TIMEOUT = float(os.getenv('ENGINE_DRAIN_TIMEOUT', '25'))
+ENGINE_CHECKPOINT_MAX_AGE = float(os.getenv('ENGINE_CHECKPOINT_MAX_AGE', '600'))
+
+engines.register('price_update', update_stock_prices)
+engines.register('price_flush', price_store.run_flusher,
+                 lambda: engines.running('price_flush'), lambda seconds: engines.sleep('price_flush', seconds))
+engines.register('order_processing', process_pending_orders)
+engines.register('order_cancellation', expire_orders)
+engines.register('ledger_reconcile', ledger.run_reconciler, fetch_ledger_snapshot,
+                 lambda: engines.running('ledger_reconcile'), lambda seconds: engines.sleep('ledger_reconcile', seconds))
+if MATCHER_SHARDING:
+    engines.register('shard_membership', run_shard_membership)
+if trade_log is not None:
+    engines.register('trade_log_snapshot', trade_log.run_snapshotter,
+                     lambda: engines.running('trade_log_snapshot'),
+                     lambda seconds: engines.sleep('trade_log_snapshot', seconds))
+
+def restore_engine_checkpoint():
+    """
+    Resume from the checkpoint written by the previous process's drain:
+    the order book and expiry wheel are restored from it and the engines
+    only fetch orders placed since, instead of rescanning every pending order
+    """
+    state = engines.load_checkpoint(ENGINE_CHECKPOINT_MAX_AGE)
+    if not state:
+        return False
+    order_book.restore(state['order_book'])
+    order_book_sync['watermark'] = state['order_book_watermark']
+    order_book_sync['resynced_at'] = state['order_book_resynced_at']
+    logger.info("Restored %s pending orders from engine checkpoint", len(state['order_book']))
+    if 'order_expiries' in state:
+        # Orders placed since the drain reach the wheel through the order book sync
+        for order_id, deadline, user_id, reason in state['order_expiries']:
+            expiry_wheel.schedule(order_id, deadline, (user_id, reason))
+        order_expiry_sync['loaded'] = True
+        logger.info("Restored %s order expiries from engine checkpoint", len(state['order_expiries']))
+    return True
 
-# Start both price update and order processing threads
-price_update_thread = Thread(target=update_stock_prices, daemon=True)
-order_processing_thread = Thread(target=process_pending_orders, daemon=True)
-order_cancellation_thread = Thread(target=cancel_stale_orders, daemon=True)
-price_update_thread.start()
-order_processing_thread.start()
-order_cancellation_thread.start()
+def drain_engines():
+    """
+    Stop the engines after their cycles in flight, flush prices and
+    write a checkpoint for the next process
+    """
+    still_running = engines.stop(timeout=ENGINE_DRAIN_TIMEOUT)
+    price_store.flush()
+    if trade_log is not None:
+        try:
+            # The next process then replays no tail at all
+            trade_log.snapshot()
+        except Exception as e:
+            logger.error("Error writing trade log snapshot: %s", e)
+    if not still_running and order_book_sync['watermark'] is not None:
+        state = {
+            'order_book': order_book.snapshot(),
+            'order_book_watermark': order_book_sync['watermark'],
+            'order_book_resynced_at': order_book_sync['resynced_at']
+        }
+        if order_expiry_sync['loaded']:
+            # Without this the next process rescans every expiring order
+            state['order_expiries'] = [[order_id, deadline, user_id, reason]
+                                       for order_id, deadline, (user_id, reason) in expiry_wheel.entries()]
+        engines.save_checkpoint(state)
+    logger.info("Background engines drained")
+    return still_running
+
+# Tools that import the app (benchmarks, scripts) can run without the engines
+if os.getenv('START_BACKGROUND_ENGINES', 'true').lower() == 'true':
+    restore_engine_checkpoint()
+    warm_ledger_from_trade_log()
+    engines.start()
+    engines.on_shutdown(drain_engines)
 
 # Auth Routes
 @app.route('/api/auth/register', methods=['POST'])
@@ -495,7 +1112,7 @@ def register():
         if not data:
             return jsonify({'error': 'No JSON data received'}), 400
 
-        print("Received registration data:", data)
+        logger.debug("Registration request for %s as %s", data.get('email'), data.get('role', 'user'))
         
         email = data.get('email')
         if not email:
@@ -525,25 +1142,27 @@ def register():
             'user_id': response.user.id,
             'email': email,
             'role': role,
-            'balance': 10000.00 if role == 'user' else 1000000000.00,
+            'balance': paise_str(STARTING_BALANCES[role]),
             'created_at': datetime.utcnow().isoformat()
         }
         
-        print("Creating user profile:", user_data)
+        logger.debug("Creating user profile: %s", user_data)
         
         # Insert profile
         profile_response = supabase.table('profiles').insert(user_data).execute()
+        if role == 'user':
+            record_trade_event('deposit', response.user.id, STARTING_BALANCES[role])
         
         # If user is admin, add initial stock holdings
         if role == 'admin':
-            print("Adding initial stocks for admin user")
+            logger.info("Adding initial stocks for admin user")
             success = add_initial_admin_stocks(response.user.id)
             if not success:
-                print("Warning: Failed to add initial admin stocks")
+                logger.warning("Failed to add initial admin stocks")
         
         return jsonify({'message': 'Registration successful'}), 201
     except Exception as e:
-        print("Registration error:", str(e))
+        logger.error("Registration error: %s", e)
         return jsonify({'error': str(e)}), 400
 
 @app.route('/api/auth/login', methods=['POST'])
@@ -580,17 +1199,97 @@ def login():
     except Exception as e:
         return jsonify({'error': str(e)}), 401
 
+# Bulk onboarding: auth calls go through their own small pool (and client,
+# since a sign-up changes its client's session), so a competition's worth of
+# registrations cannot take the connections request handlers need
+BULK_ONBOARD_MAX = int(os.getenv('BULK_ONBOARD_MAX', '10000'))
+BULK_ONBOARD_CONCURRENCY = int(os.getenv('BULK_ONBOARD_CONCURRENCY', '4'))
+BULK_ONBOARD_BATCH_SIZE = int(os.getenv('BULK_ONBOARD_BATCH_SIZE', '500'))
+BULK_ONBOARD_AUTH = os.getenv('BULK_ONBOARD_AUTH', 'sign_up')
+onboarding_supabase = LazyClient(lambda: pooled_supabase_client('onboarding', BULK_ONBOARD_CONCURRENCY))
+
+@app.route('/api/admin/users/bulk', methods=['POST'])
+@admin_required
+def register_users_bulk():
+    """
+    Register many users at once from a CSV upload (a text/csv body or a
+    'file' form field) with email, password and optional role and balance
+    columns, or from JSON {'users': [...]}. Rows are validated up front;
+    the response then streams NDJSON progress lines while auth users are
+    created and ends with a report line listing every row not registered.
+    Rerunning the same file skips users who already have a profile.
+    """
+    try:
+        if request.mimetype == 'application/json':
+            data = request.get_json()
+            records = data.get('users') if isinstance(data, dict) else None
+            if not records or not isinstance(records, list):
+                return jsonify({'error': 'No users provided'}), 400
+            users, rejected = validate_users(
+                (index, record if isinstance(record, dict) else {}) for index, record in enumerate(records)
+            )
+        else:
+            upload = request.files.get('file')
+            body = upload.read() if upload else request.get_data()
+            try:
+                users, rejected = parse_users_csv(body.decode('utf-8-sig'))
+            except (UnicodeDecodeError, ValueError) as e:
+                return jsonify({'error': str(e)}), 400
+        if len(users) + len(rejected) > BULK_ONBOARD_MAX:
+            return jsonify({'error': f'At most {BULK_ONBOARD_MAX} users per upload'}), 400
+
+        admin_holdings = []
+        if any(user['role'] == 'admin' for user in users):
+            stocks = supabase.table('stocks').select('id, current_price').execute()
+            admin_holdings = [{
+                'stock_id': stock.id,
+                'quantity': ADMIN_STARTING_SHARES,
+                'cost_basis': paise_str(ADMIN_STARTING_SHARES * stock_price(stock))
+            } for stock in decode(Stock, stocks.data)]
+
+        def record_deposits(profiles):
+            for profile in profiles:
+                if profile['role'] == 'user':
+                    record_trade_event('deposit', profile['user_id'], to_paise(profile['balance']))
+
+        progress = onboard(
+            users,
+            auth_user_creator(onboarding_supabase, BULK_ONBOARD_AUTH),
+            supabase,
+            concurrency=BULK_ONBOARD_CONCURRENCY,
+            batch_size=BULK_ONBOARD_BATCH_SIZE,
+            admin_holdings=admin_holdings,
+            on_created=record_deposits
+        )
+
+        def stream():
+            for line in progress:
+                if line['phase'] == 'done':
+                    failures = sorted(rejected + line['failures'], key=lambda failure: failure['row'])
+                    line = dict(line, total=line['total'] + len(rejected), failed=len(failures), failures=failures)
+                    logger.info("Bulk registration: %s created, %s skipped, %s failed in %ss",
+                                line['created'], line['skipped'], line['failed'], line['seconds'])
+                yield encode_json(line) + b'\n'
+
+        return Response(stream_with_context(stream()), mimetype='application/x-ndjson')
+    except Exception as e:
+        logger.error("Bulk registration error: %s", e)
+        return jsonify({'error': str(e)}), 500
+
 # Market Control Routes (Admin Only)
 def check_market_state():
     """
     Check if the market is currently active
     Returns True if market is active, False otherwise
     """
-    try:
-        market_state = supabase.table('market_state').select('*').single().execute()
+    def load():
+        market_state = supabase.table('market_state').select('is_active').single().execute()
         return market_state.data['is_active'] if market_state.data else False
+    try:
+        # Cached until control_market runs, in this process or another
+        return market_state_cache.get('is_active', load)
     except Exception as e:
-        print(f"Error checking market state: {str(e)}")
+        logger.error("Error checking market state: %s", e)
         return False
 
 @app.route('/api/market/state', methods=['GET'])
@@ -604,7 +1303,7 @@ def get_market_state():
             'message': 'Market is currently ' + ('active' if market_state.data and market_state.data['is_active'] else 'inactive')
         })
     except Exception as e:
-        print(f"Error getting market state: {str(e)}")
+        logger.error("Error getting market state: %s", e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/market/control', methods=['POST'])
@@ -622,13 +1321,14 @@ def control_market():
         
         if not result.data:
             return jsonify({'error': 'Failed to update market state'}), 500
+        broadcast_invalidation(market_state_cache, 'market_state', {'is_active': new_state})
             
         return jsonify({
             'message': f'Market {"started" if new_state else "stopped"} successfully',
             'is_active': new_state
         })
     except Exception as e:
-        print(f"Error controlling market: {str(e)}")
+        logger.error("Error controlling market: %s", e)
         return jsonify({'error': str(e)}), 500
 
 # Stock Routes
@@ -636,8 +1336,78 @@ def control_market():
 @token_required
 def get_stocks(current_user):
     try:
-        stocks = supabase.table('stocks').select('*').execute()
-        return jsonify(stocks.data)
+        stocks = stock_list_cache.get('all', lambda: decode(Stock, supabase.table('stocks').select(Stock.COLUMNS).execute().data))
+        # Serve the latest in-memory prices, which may be ahead of the table
+        response = []
+        for stock in stocks:
+            change = price_store.get_change(stock.id)
+            response.append({
+                'id': stock.id,
+                'symbol': stock.symbol,
+                'name': stock.name,
+                'current_price': from_paise(stock_price(stock)),
+                'price_change': centi_to_percent(change if change is not None else stock.price_change),
+                'sector': stock.sector
+            })
+        return jsonify(response)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/stocks/pressure', methods=['GET'])
+@token_required
+def get_market_pressure(current_user):
+    """Pending buy/sell volume and demand-driven price change for every stock"""
+    try:
+        return jsonify([
+            {
+                'stock_id': stock_id,
+                'pending_buy_quantity': buy_quantity,
+                'pending_sell_quantity': sell_quantity,
+                'price_change': calculate_price_change(stock_id)
+            }
+            for stock_id, (buy_quantity, sell_quantity) in order_book.all_volumes().items()
+        ])
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/stocks/<stock_id>/pressure', methods=['GET'])
+@token_required
+def get_stock_pressure(current_user, stock_id):
+    """Pending buy/sell volume and demand-driven price change for one stock"""
+    try:
+        buy_quantity, sell_quantity = order_book.volume(stock_id)
+        return jsonify({
+            'stock_id': stock_id,
+            'pending_buy_quantity': buy_quantity,
+            'pending_sell_quantity': sell_quantity,
+            'price_change': calculate_price_change(stock_id)
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/stocks/<stock_id>/depth', methods=['GET'])
+@token_required
+def get_stock_depth(current_user, stock_id):
+    """Aggregated pending price levels for a stock, served from memory"""
+    try:
+        levels = request.args.get('levels', default=20, type=int)
+        bids, asks = order_book.depth(stock_id, max(1, levels))
+        return jsonify({
+            'stock_id': stock_id,
+            'bids': [{'price': from_paise(price), 'quantity': quantity, 'orders': count} for price, quantity, count in bids],
+            'asks': [{'price': from_paise(price), 'quantity': quantity, 'orders': count} for price, quantity, count in asks]
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/stocks/<stock_id>/trades', methods=['GET'])
+@token_required
+def get_stock_trades(current_user, stock_id):
+    """Recent executions for a stock, newest first, served from memory"""
+    try:
+        limit = request.args.get('limit', default=50, type=int)
+        trades = trade_tape.recent(stock_id, max(1, limit))
+        return jsonify([dict(trade, price=from_paise(trade['price'])) for trade in trades])
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -658,11 +1428,11 @@ def buy_stock(current_user):
             
         # Get stock details
         try:
-            stock = supabase.table('stocks').select('*').eq('id', stock_id).execute()
-            logger.info(f"Stock details fetched: {stock.data}")
+            stock = supabase.table('stocks').select(Stock.COLUMNS).eq('id', stock_id).execute()
+            logger.debug("Stock details fetched: %s", stock.data)
         except Exception as e:
             error_msg = str(e.args[0]) if hasattr(e, 'args') and e.args else str(e)
-            logger.error(f"Failed to fetch stock details: {error_msg}")
+            logger.error("Failed to fetch stock details: %s", error_msg)
             return jsonify({
                 'error': error_msg,
                 'showAlert': True,
@@ -676,58 +1446,47 @@ def buy_stock(current_user):
                 'alertMessage': 'The requested stock was not found.'
             }), 404
             
-        stock = stock.data[0]
-        inr_price = float(stock['current_price'])
+        stock = Stock.from_row(stock.data[0])
+        inr_price = stock_price(stock)
         total_cost = inr_price * quantity
         
-        # Get user's balance
+        # Check the balance against the in-memory ledger; the profile loaded
+        # by token_required already carries the latest balance
+        order_id = str(uuid.uuid4())
         try:
-            user = supabase.table('profiles').select('balance').eq('user_id', current_user['user_id']).execute()
-            logger.info(f"User balance fetched: {user.data}")
+            ensure_ledger_account(current_user)
         except Exception as e:
             error_msg = str(e.args[0]) if hasattr(e, 'args') and e.args else str(e)
-            logger.error(f"Failed to fetch user balance: {error_msg}")
+            logger.error("Failed to load user account: %s", error_msg)
             return jsonify({
                 'error': error_msg,
                 'showAlert': True,
                 'alertMessage': f'Failed to fetch user balance: {error_msg}'
             }), 500
             
-        if not user.data:
-            return jsonify({
-                'error': 'User not found',
-                'showAlert': True,
-                'alertMessage': 'User profile not found. Please try again.'
-            }), 404
-            
-        balance = float(user.data[0]['balance'])
-        
-        if balance < total_cost:
+        try:
+            ledger.reserve(order_id, current_user.user_id, stock_id, 'buy', quantity, inr_price)
+        except RiskCheckFailed as e:
             return jsonify({
                 'error': 'Insufficient balance',
                 'showAlert': True,
-                'alertMessage': f'Insufficient funds. Required: ₹{total_cost:.2f}, Available: ₹{balance:.2f}'
+                'alertMessage': str(e)
             }), 400
             
-        # Create buy order
-        order = {
-            'user_id': current_user['user_id'],
-            'stock_id': stock_id,
-            'type': 'buy',
-            'quantity': quantity,
-            'price': str(inr_price),
-            'status': ORDER_STATUS_PENDING,
-            'created_at': datetime.now().isoformat()
-        }
+        balance = current_user.balance
+        
+        # Create buy order, settled in this request or not at all
+        order = Order(order_id, current_user.user_id, stock_id, 'buy', quantity, inr_price,
+                      ORDER_STATUS_PENDING, 'IOC', created_at=datetime.now(timezone.utc).isoformat())
         
         new_balance = balance - total_cost
         
         # Start transaction
-        logger.info(f"Starting buy transaction for user {current_user['user_id']}, stock {stock_id}, quantity {quantity}")
+        logger.info("Starting buy transaction for user %s, stock %s, quantity %s", current_user.user_id, stock_id, quantity)
         
         try:
             # Create the order in the orders table
-            order_result = supabase.table('orders').insert(order).execute()
+            order_result = supabase.table('orders').insert(order.to_row()).execute()
             if not order_result.data:
                 error_msg = "Failed to create order: No data returned"
                 logger.error(error_msg)
@@ -736,7 +1495,7 @@ def buy_stock(current_user):
             order_id = order_result.data[0]['id']
             
             # Then update the balance
-            balance_update = supabase.table('profiles').update({'balance': str(new_balance)}).eq('user_id', current_user['user_id']).execute()
+            balance_update = supabase.table('profiles').update({'balance': paise_str(new_balance)}).eq('user_id', current_user.user_id).execute()
             if not balance_update.data:
                 error_msg = "Failed to update balance: No data returned"
                 logger.error(error_msg)
@@ -744,14 +1503,15 @@ def buy_stock(current_user):
             logger.info("Balance updated successfully")
             
             # Update holdings
-            holdings = supabase.table('user_stocks').select('*').eq('user_id', current_user['user_id']).eq('stock_id', stock_id).execute()
+            holdings = supabase.table('user_stocks').select(Holding.COLUMNS).eq('user_id', current_user.user_id).eq('stock_id', stock_id).execute()
             
             if holdings.data:
-                new_quantity = holdings.data[0]['quantity'] + quantity
+                holding = Holding.from_row(holdings.data[0])
                 try:
                     holding_update = supabase.table('user_stocks').update({
-                        'quantity': new_quantity
-                    }).eq('id', holdings.data[0]['id']).execute()
+                        'quantity': holding.quantity + quantity,
+                        'cost_basis': paise_str(holding.cost_basis + total_cost)
+                    }).eq('id', holding.id).execute()
                     
                     if not holding_update.data:
                         error_msg = "Failed to update holdings: No data returned"
@@ -760,14 +1520,15 @@ def buy_stock(current_user):
                     logger.info("Holdings updated successfully")
                 except Exception as e:
                     error_msg = str(e.args[0]) if hasattr(e, 'args') and e.args else str(e)
-                    logger.error(f"Failed to update holdings: {error_msg}")
+                    logger.error("Failed to update holdings: %s", error_msg)
                     raise Exception(f"Failed to update holdings: {error_msg}")
             else:
                 try:
                     holding_insert = supabase.table('user_stocks').insert({
-                        'user_id': current_user['user_id'],
+                        'user_id': current_user.user_id,
                         'stock_id': stock_id,
-                        'quantity': quantity
+                        'quantity': quantity,
+                        'cost_basis': paise_str(total_cost)
                     }).execute()
                     
                     if not holding_insert.data:
@@ -777,13 +1538,14 @@ def buy_stock(current_user):
                     logger.info("New holdings created successfully")
                 except Exception as e:
                     error_msg = str(e.args[0]) if hasattr(e, 'args') and e.args else str(e)
-                    logger.error(f"Failed to create holdings: {error_msg}")
+                    logger.error("Failed to create holdings: %s", error_msg)
                     raise Exception(f"Failed to create holdings: {error_msg}")
             
             # Update order status to completed
+            executed_at = datetime.now(timezone.utc).isoformat()
             order_status_update = supabase.table('orders').update({
                 'status': ORDER_STATUS_COMPLETED,
-                'executed_at': datetime.now().isoformat()
+                'executed_at': executed_at
             }).eq('id', order_id).execute()
             
             if not order_status_update.data:
@@ -791,17 +1553,24 @@ def buy_stock(current_user):
             else:
                 logger.info("Order status updated to completed")
             
+            ledger.settle(order_id, inr_price)
+            publish_accounts([current_user.user_id])
+            record_trade_event('fill', current_user.user_id, stock_id, 'buy', quantity, inr_price, order_id)
+            publish_order_event(order, ORDER_STATUS_COMPLETED, inr_price, executed_at=executed_at)
+            trade_tape.record(stock_id, 'buy', quantity, inr_price, executed_at, order_id)
+            market_analytics.record_fill(stock_id, current_user.user_id, 'buy', quantity, inr_price)
             logger.info("Buy transaction completed successfully")
             return jsonify({
                 'message': 'Stock purchased successfully',
-                'new_balance': new_balance,
+                'new_balance': from_paise(new_balance),
                 'showAlert': True,
-                'alertMessage': f'Successfully purchased {quantity} shares for ₹{total_cost:.2f}'
+                'alertMessage': f'Successfully purchased {quantity} shares for {format_inr(total_cost)}'
             })
             
         except Exception as e:
+            ledger.release(order_id)
             error_msg = str(e.args[0]) if hasattr(e, 'args') and e.args else str(e)
-            logger.error(f"Buy transaction failed: {error_msg}")
+            logger.error("Buy transaction failed: %s", error_msg)
             return jsonify({
                 'error': error_msg,
                 'showAlert': True,
@@ -810,7 +1579,7 @@ def buy_stock(current_user):
             
     except Exception as e:
         error_msg = str(e.args[0]) if hasattr(e, 'args') and e.args else str(e)
-        logger.error(f"Unexpected error in buy_stock: {error_msg}")
+        logger.error("Unexpected error in buy_stock: %s", error_msg)
         return jsonify({
             'error': error_msg,
             'showAlert': True,
@@ -834,11 +1603,11 @@ def sell_stock(current_user):
             
         # Get stock details
         try:
-            stock = supabase.table('stocks').select('*').eq('id', stock_id).execute()
-            logger.info(f"Stock details fetched: {stock.data}")
+            stock = supabase.table('stocks').select(Stock.COLUMNS).eq('id', stock_id).execute()
+            logger.debug("Stock details fetched: %s", stock.data)
         except Exception as e:
             error_msg = str(e.args[0]) if hasattr(e, 'args') and e.args else str(e)
-            logger.error(f"Failed to fetch stock details: {error_msg}")
+            logger.error("Failed to fetch stock details: %s", error_msg)
             return jsonify({
                 'error': error_msg,
                 'showAlert': True,
@@ -852,64 +1621,67 @@ def sell_stock(current_user):
                 'alertMessage': 'The requested stock was not found.'
             }), 404
             
-        stock = stock.data[0]
-        inr_price = float(stock['current_price'])
+        stock = Stock.from_row(stock.data[0])
+        inr_price = stock_price(stock)
         total_value = inr_price * quantity
         
         # Check if user has enough stocks
         try:
-            holdings = supabase.table('user_stocks').select('*').eq('user_id', current_user['user_id']).eq('stock_id', stock_id).execute()
-            logger.info(f"User holdings fetched: {holdings.data}")
+            holdings = supabase.table('user_stocks').select(Holding.COLUMNS).eq('user_id', current_user.user_id).eq('stock_id', stock_id).execute()
+            logger.debug("User holdings fetched: %s", holdings.data)
         except Exception as e:
             error_msg = str(e.args[0]) if hasattr(e, 'args') and e.args else str(e)
-            logger.error(f"Failed to fetch user holdings: {error_msg}")
+            logger.error("Failed to fetch user holdings: %s", error_msg)
             return jsonify({
                 'error': error_msg,
                 'showAlert': True,
                 'alertMessage': f'Failed to fetch user holdings: {error_msg}'
             }), 500
         
-        if not holdings.data or holdings.data[0]['quantity'] < quantity:
-            available_quantity = holdings.data[0]['quantity'] if holdings.data else 0
+        holding = Holding.from_row(holdings.data[0]) if holdings.data else None
+        if holding is None or holding.quantity < quantity:
+            available_quantity = holding.quantity if holding is not None else 0
             return jsonify({
                 'error': 'Insufficient stocks',
                 'showAlert': True,
                 'alertMessage': f'Not enough stocks available. Requested: {quantity}, Available: {available_quantity}'
             }), 400
             
-        # Get user's current balance
+        # Shares already committed to pending sell orders are not available
+        order_id = str(uuid.uuid4())
         try:
-            user = supabase.table('profiles').select('balance').eq('user_id', current_user['user_id']).execute()
-            logger.info(f"User balance fetched: {user.data}")
+            ensure_ledger_account(current_user)
+            ledger.reserve(order_id, current_user.user_id, stock_id, 'sell', quantity, inr_price)
+        except RiskCheckFailed as e:
+            return jsonify({
+                'error': 'Insufficient stocks',
+                'showAlert': True,
+                'alertMessage': str(e)
+            }), 400
         except Exception as e:
             error_msg = str(e.args[0]) if hasattr(e, 'args') and e.args else str(e)
-            logger.error(f"Failed to fetch user balance: {error_msg}")
+            logger.error("Failed to load user account: %s", error_msg)
             return jsonify({
                 'error': error_msg,
                 'showAlert': True,
                 'alertMessage': f'Failed to fetch user balance: {error_msg}'
             }), 500
             
-        current_balance = float(user.data[0]['balance'])
+        # The profile loaded by token_required carries the latest balance
+        current_balance = current_user.balance
         new_balance = current_balance + total_value
+        sold_cost, realized = sale_pnl(holding, quantity, total_value)
         
-        # Create sell order
-        order = {
-            'user_id': current_user['user_id'],
-            'stock_id': stock_id,
-            'type': 'sell',
-            'quantity': quantity,
-            'price': str(inr_price),
-            'status': ORDER_STATUS_PENDING,
-            'created_at': datetime.now().isoformat()
-        }
+        # Create sell order, settled in this request or not at all
+        order = Order(order_id, current_user.user_id, stock_id, 'sell', quantity, inr_price,
+                      ORDER_STATUS_PENDING, 'IOC', created_at=datetime.now(timezone.utc).isoformat())
         
         # Start transaction
-        logger.info(f"Starting sell transaction for user {current_user['user_id']}, stock {stock_id}, quantity {quantity}")
+        logger.info("Starting sell transaction for user %s, stock %s, quantity %s", current_user.user_id, stock_id, quantity)
         
         try:
             # First record the transaction
-            transaction = supabase.table('orders').insert(order).execute()
+            transaction = supabase.table('orders').insert(order.to_row()).execute()
             if not transaction.data:
                 error_msg = "Failed to record transaction: No data returned"
                 logger.error(error_msg)
@@ -917,7 +1689,10 @@ def sell_stock(current_user):
             logger.info("Transaction recorded successfully")
             
             # Update user's balance
-            balance_update = supabase.table('profiles').update({'balance': str(new_balance)}).eq('user_id', current_user['user_id']).execute()
+            balance_update = supabase.table('profiles').update({
+                'balance': paise_str(new_balance),
+                'realized_pnl': paise_str(current_user.realized_pnl + realized)
+            }).eq('user_id', current_user.user_id).execute()
             if not balance_update.data:
                 error_msg = "Failed to update balance: No data returned"
                 logger.error(error_msg)
@@ -925,11 +1700,13 @@ def sell_stock(current_user):
             logger.info("Balance updated successfully")
             
             # Update holdings
-            new_quantity = holdings.data[0]['quantity'] - quantity
+            new_quantity = holding.quantity - quantity
             if new_quantity > 0:
                 holding_update = supabase.table('user_stocks').update({
-                    'quantity': new_quantity
-                }).eq('id', holdings.data[0]['id']).execute()
+                    'quantity': new_quantity,
+                    'cost_basis': paise_str(holding.cost_basis - sold_cost),
+                    'realized_pnl': paise_str(holding.realized_pnl + realized)
+                }).eq('id', holding.id).execute()
                 
                 if not holding_update.data:
                     error_msg = "Failed to update holdings"
@@ -938,7 +1715,7 @@ def sell_stock(current_user):
                 logger.info("Holdings updated successfully")
             else:
                 # Delete the holding if quantity is 0
-                holding_delete = supabase.table('user_stocks').delete().eq('id', holdings.data[0]['id']).execute()
+                holding_delete = supabase.table('user_stocks').delete().eq('id', holding.id).execute()
                 if not holding_delete.data:
                     error_msg = "Failed to delete holdings"
                     logger.error(error_msg)
@@ -946,9 +1723,10 @@ def sell_stock(current_user):
                 logger.info("Holdings deleted successfully")
             
             # Update order status to completed
+            executed_at = datetime.now(timezone.utc).isoformat()
             order_status_update = supabase.table('orders').update({
                 'status': ORDER_STATUS_COMPLETED,
-                'executed_at': datetime.now().isoformat()
+                'executed_at': executed_at
             }).eq('id', transaction.data[0]['id']).execute()
             
             if not order_status_update.data:
@@ -956,17 +1734,24 @@ def sell_stock(current_user):
             else:
                 logger.info("Order status updated to completed")
             
+            ledger.settle(order_id, inr_price)
+            publish_accounts([current_user.user_id])
+            record_trade_event('fill', current_user.user_id, stock_id, 'sell', quantity, inr_price, order_id)
+            publish_order_event(order, ORDER_STATUS_COMPLETED, inr_price, executed_at=executed_at)
+            trade_tape.record(stock_id, 'sell', quantity, inr_price, executed_at, order_id)
+            market_analytics.record_fill(stock_id, current_user.user_id, 'sell', quantity, inr_price)
             logger.info("Sell transaction completed successfully")
             return jsonify({
                 'message': 'Stock sold successfully',
-                'new_balance': new_balance,
+                'new_balance': from_paise(new_balance),
                 'showAlert': True,
-                'alertMessage': f'Successfully sold {quantity} shares for ₹{total_value:.2f}'
+                'alertMessage': f'Successfully sold {quantity} shares for {format_inr(total_value)}'
             })
             
         except Exception as e:
+            ledger.release(order_id)
             error_msg = str(e.args[0]) if hasattr(e, 'args') and e.args else str(e)
-            logger.error(f"Sell transaction failed: {error_msg}")
+            logger.error("Sell transaction failed: %s", error_msg)
             return jsonify({
                 'error': error_msg,
                 'showAlert': True,
@@ -975,60 +1760,198 @@ def sell_stock(current_user):
             
     except Exception as e:
         error_msg = str(e.args[0]) if hasattr(e, 'args') and e.args else str(e)
-        logger.error(f"Unexpected error in sell_stock: {error_msg}")
+        logger.error("Unexpected error in sell_stock: %s", error_msg)
         return jsonify({
             'error': error_msg,
             'showAlert': True,
             'alertMessage': f'An unexpected error occurred: {error_msg}'
         }), 500
 
+def validate_order_request(data):
+    """
+    Validate an order payload
+    Returns (quantity, error message or None)
+    """
+    required_fields = ['stock_id', 'type', 'quantity']
+    if not isinstance(data, dict) or not all(field in data for field in required_fields):
+        return None, 'Missing required fields'
+        
+    # Validate order type
+    if data['type'] not in ['buy', 'sell']:
+        return None, 'Invalid order type'
+
+    try:
+        quantity = int(data['quantity'])
+    except (TypeError, ValueError):
+        quantity = 0
+    if quantity <= 0:
+        return None, 'Invalid quantity'
+    return quantity, None
+
 @app.route('/api/orders', methods=['POST'])
 @token_required
 def place_order(current_user):
     try:
-        # Check if market is active
-        if not check_market_state():
-            return jsonify({'error': 'Market is currently closed. Orders cannot be placed.'}), 403
-
         data = request.get_json()
         if not data:
             return jsonify({'error': 'No data provided'}), 400
             
-        required_fields = ['stock_id', 'type', 'quantity']
-        if not all(field in data for field in required_fields):
-            return jsonify({'error': 'Missing required fields'}), 400
-            
-        # Validate order type
-        if data['type'] not in ['buy', 'sell']:
-            return jsonify({'error': 'Invalid order type'}), 400
-            
-        # Get current stock price
-        stock = supabase.table('stocks').select('current_price').eq('id', data['stock_id']).single().execute()
-        if not stock.data:
-            return jsonify({'error': 'Stock not found'}), 404
-            
-        current_price = stock.data['current_price']
-            
-        # Create order
-        order = {
-            'user_id': current_user['user_id'],
-            'stock_id': data['stock_id'],
-            'type': data['type'],
-            'quantity': data['quantity'],
-            'price': current_price,  # Add current price
-            'status': ORDER_STATUS_PENDING,
-            'created_at': datetime.now().isoformat()
-        }
-        
-        result = supabase.table('orders').insert(order).execute()
+        quantity, error = validate_order_request(data)
+        if error:
+            return jsonify({'error': error}), 400
+        now = datetime.now(timezone.utc)
+        time_in_force, expires_at, error = order_time_in_force(data, now)
+        if error:
+            return jsonify({'error': error}), 400
+            
+        # Get current stock price, from memory when the price store knows it
+        current_price = price_store.get(data['stock_id'])
+        if current_price is None:
+            stock = supabase.table('stocks').select('id, current_price').eq('id', data['stock_id']).single().execute()
+            if not stock.data:
+                return jsonify({'error': 'Stock not found'}), 404
+            current_price = stock_price(Stock.from_row(stock.data))
+
+        # Reserve cash or shares before anything is written; rejected
+        # orders never reach the database
+        order_id = str(uuid.uuid4())
+        ensure_ledger_account(current_user)
+        try:
+            ledger.reserve(order_id, current_user.user_id, data['stock_id'], data['type'], quantity, current_price)
+        except RiskCheckFailed as e:
+            return jsonify({'error': str(e)}), 400
+
+        try:
+            # Check if market is active
+            if not check_market_state():
+                ledger.release(order_id)
+                return jsonify({'error': 'Market is currently closed. Orders cannot be placed.'}), 403
+                
+            # Create order at the current price
+            order = Order(order_id, current_user.user_id, data['stock_id'], data['type'], quantity, current_price,
+                          ORDER_STATUS_PENDING, time_in_force, expires_at.isoformat() if expires_at else None,
+                          now.isoformat())
+            
+            result = supabase.table('orders').insert(order.to_row()).execute()
+        except Exception:
+            ledger.release(order_id)
+            raise
+        # Other processes holding the account reserve the order on its next use
+        publish_accounts([current_user.user_id])
+
+        if time_in_force == 'IOC':
+            # Fill now at the current price or cancel; IOC orders never
+            # wait in the book for the matcher
+            filled = process_order(order_id, current_price)
+            return jsonify({
+                'message': 'Order filled' if filled else 'Order could not be filled and was cancelled',
+                'order_id': order_id,
+                'status': ORDER_STATUS_COMPLETED if filled else ORDER_STATUS_CANCELLED,
+                'time_in_force': time_in_force
+            })
+
+        order_book.add(order)
+        route_order(order)
+        schedule_expiry(order)
         
         return jsonify({
             'message': 'Order placed successfully',
-            'order_id': result.data[0]['id']
+            'order_id': result.data[0]['id'],
+            'time_in_force': time_in_force,
+            'expires_at': order.expires_at
         })
         
     except Exception as e:
-        print(f"Error placing order: {str(e)}")  # Add error logging
+        logger.error("Error placing order: %s", e)  # Add error logging
+        return jsonify({'error': str(e)}), 500
+
+ORDER_COLUMNS = ('id', 'stock_symbol', 'type', 'quantity', 'price', 'status', 'created_at')
+
+ORDER_BATCH_MAX = int(os.getenv('ORDER_BATCH_MAX', '100'))
+
+@app.route('/api/orders/batch', methods=['POST'])
+@token_required
+def place_order_batch(current_user):
+    """
+    Place up to ORDER_BATCH_MAX orders, possibly across stocks, in one request.
+    All orders are checked against one market snapshot and one account
+    snapshot and inserted with a single bulk insert.
+    Returns a result per submitted order, in submission order; IOC orders
+    are settled straight away and report completed or cancelled.
+    """
+    try:
+        data = request.get_json()
+        orders = data.get('orders') if isinstance(data, dict) else None
+        if not orders or not isinstance(orders, list):
+            return jsonify({'error': 'No orders provided'}), 400
+        if len(orders) > ORDER_BATCH_MAX:
+            return jsonify({'error': f'At most {ORDER_BATCH_MAX} orders per batch'}), 400
+
+        # One market state check for the whole batch
+        if not check_market_state():
+            return jsonify({'error': 'Market is currently closed. Orders cannot be placed.'}), 403
+
+        # One price snapshot: in-memory prices, plus a single query for the rest
+        stock_ids = {order.get('stock_id') for order in orders if isinstance(order, dict)}
+        prices = {stock_id: price_store.get(stock_id) for stock_id in stock_ids}
+        missing = [stock_id for stock_id, price in prices.items() if price is None and stock_id]
+        if missing:
+            stocks = supabase.table('stocks').select('id, current_price').in_('id', missing).execute()
+            for stock in decode(Stock, stocks.data):
+                prices[stock.id] = stock_price(stock)
+
+        # One account snapshot
+        ensure_ledger_account(current_user)
+
+        results = []
+        accepted = []
+        now = datetime.now(timezone.utc)
+        for index, order_data in enumerate(orders):
+            quantity, error = validate_order_request(order_data)
+            if not error:
+                time_in_force, expires_at, error = order_time_in_force(order_data, now)
+            current_price = prices.get(order_data.get('stock_id')) if not error else None
+            if not error and current_price is None:
+                error = 'Stock not found'
+            if not error:
+                order_id = str(uuid.uuid4())
+                try:
+                    ledger.reserve(order_id, current_user.user_id, order_data['stock_id'],
+                                   order_data['type'], quantity, current_price)
+                except RiskCheckFailed as e:
+                    error = str(e)
+            if error:
+                results.append({'index': index, 'status': 'rejected', 'error': error})
+                continue
+            accepted.append(Order(order_id, current_user.user_id, order_data['stock_id'], order_data['type'], quantity,
+                                  current_price, ORDER_STATUS_PENDING, time_in_force,
+                                  expires_at.isoformat() if expires_at else None, now.isoformat()))
+            results.append({'index': index, 'status': 'accepted', 'order_id': order_id})
+
+        if accepted:
+            try:
+                supabase.table('orders').insert([order.to_row() for order in accepted]).execute()
+            except Exception:
+                for order in accepted:
+                    ledger.release(order.id)
+                raise
+            publish_accounts([current_user.user_id])
+            for order, result in zip(accepted, (result for result in results if result['status'] == 'accepted')):
+                if order.time_in_force == 'IOC':
+                    filled = process_order(order.id, order.price)
+                    result['status'] = ORDER_STATUS_COMPLETED if filled else ORDER_STATUS_CANCELLED
+                    continue
+                order_book.add(order)
+                route_order(order)
+                schedule_expiry(order)
+
+        return jsonify({
+            'message': f'{len(accepted)} of {len(orders)} orders placed',
+            'results': results
+        })
+
+    except Exception as e:
+        logger.error("Error placing order batch: %s", e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/orders', methods=['GET'])
@@ -1037,60 +1960,149 @@ def get_user_orders(current_user):
     try:
         # Get user's orders with stock information
         response = supabase.from_('orders') \
-            .select('*, stocks(symbol)') \
-            .eq('user_id', current_user['user_id']) \
+            .select('id, type, quantity, price, status, created_at, stocks(symbol)') \
+            .eq('user_id', current_user.user_id) \
             .execute()
         
-        # Format the response
+        # Format the response as compact row tuples
         orders = []
-        for order in response.data:
-            orders.append({
-                'id': order['id'],
-                'stock_symbol': order['stocks']['symbol'],
-                'type': order['type'],
-                'quantity': order['quantity'],
-                'price': float(order['price']),
-                'status': order['status'],
-                'created_at': order['created_at']
-            })
+        for row in response.data:
+            order = Order.from_row(row)
+            orders.append((order.id, row['stocks']['symbol'], order.type, order.quantity,
+                           from_paise(order.price), order.status, order.created_at))
         
-        return jsonify(orders), 200
+        return rows_response(app, ORDER_COLUMNS, orders)
     except Exception as e:
         return jsonify({'error': str(e)}), 400
 
+# Order and fill exports stream straight from paged database reads, so
+# memory stays flat however many rows an export has
+ORDER_EXPORT_COLUMNS = ('id', 'user_id', 'stock_id', 'stock_symbol', 'type', 'quantity', 'price', 'status',
+                        'created_at', 'executed_price', 'executed_at', 'error')
+EXPORT_PAGE_SIZE = int(os.getenv('EXPORT_PAGE_SIZE', '1000'))
+
+def order_export_response(filename, user_id=None):
+    """
+    Stream orders as ?format=csv (default) or ndjson; ?status=completed
+    gives a statement of fills. Sent with chunked transfer encoding.
+    """
+    export_format = request.args.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': f"format must be one of {', '.join(EXPORT_FORMATS)}"}), 400
+    status = request.args.get('status')
+    if status not in (None, ORDER_STATUS_PENDING, ORDER_STATUS_COMPLETED, ORDER_STATUS_CANCELLED):
+        return jsonify({'error': 'Invalid status'}), 400
+    columns = ORDER_EXPORT_COLUMNS if user_id is None else tuple(c for c in ORDER_EXPORT_COLUMNS if c != 'user_id')
+    symbols = {stock.id: stock.symbol for stock in engine_store.fetch_stocks()}
+
+    def rows():
+        try:
+            for order in engine_store.export_orders(user_id, status, EXPORT_PAGE_SIZE):
+                order['stock_symbol'] = symbols.get(order['stock_id'])
+                yield order
+        except Exception as e:
+            # Headers are gone; the client sees a truncated chunked body
+            logger.error("Order export failed: %s", e)
+            raise
+
+    return Response(
+        stream_with_context(export_chunks(rows(), columns, export_format)),
+        mimetype=EXPORT_FORMATS[export_format],
+        headers={'Content-Disposition': f'attachment; filename="{filename}.{export_format}"',
+                 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/api/orders/export', methods=['GET'])
+@token_required
+def export_orders(current_user):
+    """Download the user's orders and fills"""
+    try:
+        return order_export_response('orders', current_user.user_id)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/admin/orders/export', methods=['GET'])
+@admin_required
+def export_all_orders():
+    """Download every order in the market, or one user's with ?user_id="""
+    try:
+        user_id = request.args.get('user_id')
+        if user_id:
+            try:
+                user_id = str(uuid.UUID(user_id))
+            except ValueError:
+                return jsonify({'error': 'Invalid user_id'}), 400
+        return order_export_response(f'orders-{user_id}' if user_id else 'orders-all', user_id)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/orders/events', methods=['GET'])
+@token_required
+def order_events_stream(current_user):
+    """
+    Server-sent events for the user's order fills and cancellations, in
+    place of polling GET /api/orders. Reconnects send Last-Event-ID (or
+    ?last_event_id=) to receive what they missed; a 'resync' event means
+    the gap is too old and orders should be refetched once. Streams end
+    after ORDER_EVENTS_MAX_SECONDS and the client reconnects.
+    """
+    try:
+        last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+        subscription = order_events.subscribe(current_user.user_id, last_event_id)
+
+        def stream():
+            with subscription:
+                yield 'retry: 3000\n\n'
+                yield from subscription.events(ORDER_EVENTS_HEARTBEAT, time.time() + ORDER_EVENTS_MAX_SECONDS)
+
+        return Response(
+            stream_with_context(stream()),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 # Portfolio Routes
+HOLDING_WITH_STOCK_COLUMNS = f'{Holding.COLUMNS}, stocks({Stock.COLUMNS})'
+
 @app.route('/api/portfolio/profile', methods=['GET'])
 @token_required
 def get_user_profile(current_user):
     try:
         # Get user profile with balance
         profile = supabase.table('profiles') \
-            .select('*') \
-            .eq('user_id', current_user['user_id']) \
+            .select(Profile.COLUMNS) \
+            .eq('user_id', current_user.user_id) \
             .single() \
             .execute()
+        profile = Profile.from_row(profile.data)
 
         # Get user's stock holdings with current prices
         holdings = supabase.table('user_stocks') \
-            .select('*, stocks(*)') \
-            .eq('user_id', current_user['user_id']) \
+            .select(HOLDING_WITH_STOCK_COLUMNS) \
+            .eq('user_id', current_user.user_id) \
             .execute()
 
-        # Calculate total portfolio value
-        total_portfolio_value = float(profile.data['balance'])  # Start with cash balance
+        # Calculate total portfolio value in paise
+        total_portfolio_value = profile.balance  # Start with cash balance
+        unrealized_pnl = 0
         
-        for holding in holdings.data:
-            stock_value = holding['quantity'] * float(holding['stocks']['current_price'])
+        for holding in decode(Holding, holdings.data):
+            stock_value = holding.quantity * stock_price(holding.stock)
             total_portfolio_value += stock_value
+            unrealized_pnl += stock_value - holding.cost_basis
 
         response_data = {
-            'balance': float(profile.data['balance']),
-            'total_portfolio_value': total_portfolio_value
+            'balance': from_paise(profile.balance),
+            'total_portfolio_value': from_paise(total_portfolio_value),
+            'realized_pnl': from_paise(profile.realized_pnl),
+            'unrealized_pnl': from_paise(unrealized_pnl)
         }
 
         return jsonify(response_data), 200
     except Exception as e:
-        print("Error fetching portfolio:", str(e))
+        logger.error("Error fetching portfolio: %s", e)
         return jsonify({'error': str(e)}), 400
 
 @app.route('/api/portfolio/holdings', methods=['GET'])
@@ -1099,26 +2111,35 @@ def get_user_holdings(current_user):
     try:
         # Get user's stock holdings with stock information
         holdings = supabase.table('user_stocks') \
-            .select('*, stocks(*)') \
-            .eq('user_id', current_user['user_id']) \
+            .select(HOLDING_WITH_STOCK_COLUMNS) \
+            .eq('user_id', current_user.user_id) \
             .execute()
 
-        # Format the response
+        # Cost basis and realized P&L are kept up to date by every fill, so
+        # P&L is marked to the in-memory prices without reading order history
         formatted_holdings = []
-        for holding in holdings.data:
-            stock = holding['stocks']
+        for holding in decode(Holding, holdings.data):
+            stock = holding.stock
+            price = stock_price(stock)
+            value = holding.quantity * price
+            cost_basis = holding.cost_basis
             formatted_holdings.append({
-                'stock_id': stock['id'],
-                'stock_name': stock['name'],
-                'stock_symbol': stock['symbol'],
-                'quantity': holding['quantity'],
-                'current_price': float(stock['current_price']),
-                'total_value': holding['quantity'] * float(stock['current_price'])
+                'stock_id': stock.id,
+                'stock_name': stock.name,
+                'stock_symbol': stock.symbol,
+                'quantity': holding.quantity,
+                'current_price': from_paise(price),
+                'total_value': from_paise(value),
+                'average_cost': from_paise(cost_basis // holding.quantity) if holding.quantity else 0.0,
+                'cost_basis': from_paise(cost_basis),
+                'unrealized_pnl': from_paise(value - cost_basis),
+                'unrealized_pnl_percent': round((value - cost_basis) * 100 / cost_basis, 2) if cost_basis else None,
+                'realized_pnl': from_paise(holding.realized_pnl)
             })
 
         return jsonify(formatted_holdings), 200
     except Exception as e:
-        print("Error fetching holdings:", str(e))
+        logger.error("Error fetching holdings: %s", e)
         return jsonify({'error': str(e)}), 400
 
 # News Routes
@@ -1126,8 +2147,8 @@ def get_user_holdings(current_user):
 @token_required
 def get_news(current_user):
     try:
-        news = supabase.table('news').select('*').order('created_at', desc=True).execute()
-        return jsonify(news.data)
+        news = news_cache.get('all', lambda: supabase.table('news').select('*').order('created_at', desc=True).execute().data)
+        return jsonify(news)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -1142,84 +2163,79 @@ def create_news():
             'created_at': datetime.utcnow().isoformat()
         }
         supabase.table('news').insert(news_data).execute()
+        broadcast_invalidation(news_cache, 'news')
         return jsonify({'message': 'News created successfully'})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 # Leaderboard Route (Admin Only)
+LEADERBOARD_COLUMNS = ('user_id', 'email', 'total_value')
+
 @app.route('/api/leaderboard', methods=['GET'])
 def get_leaderboard():
     """Get user leaderboard based on portfolio value"""
     try:
-        # Get all users with their stock holdings
-        users = supabase.table('profiles').select('*').execute()
-        leaderboard = []
+        # Get all users, all holdings and all prices in three queries
+        users = decode(Profile, supabase.table('profiles').select('user_id, email, balance').execute().data)
+        holdings = decode(Holding, supabase.table('user_stocks').select('user_id, stock_id, quantity').execute().data)
+        stocks = decode(Stock, supabase.table('stocks').select('id, current_price').execute().data)
+        prices = {stock.id: stock_price(stock) for stock in stocks}
         
-        for user in users.data:
-            # Get user's stock holdings
-            holdings = supabase.table('user_stocks').select('*').eq('user_id', user['user_id']).execute()
-            
-            # Get current stock prices
-            total_value = float(user['balance'])  # Start with cash balance
-            
-            for holding in holdings.data:
-                stock = supabase.table('stocks').select('current_price').eq('id', holding['stock_id']).single().execute()
-                if stock.data:
-                    stock_value = float(stock.data['current_price']) * holding['quantity']
-                    total_value += stock_value
-            
-            leaderboard.append({
-                'user_id': user['user_id'],
-                'email': user['email'],
-                'total_value': total_value
-            })
+        # Start with each user's cash balance and add their holdings, in paise
+        totals = {user.user_id: user.balance for user in users}
+        for holding in holdings:
+            if holding.user_id in totals and holding.stock_id in prices:
+                totals[holding.user_id] += prices[holding.stock_id] * holding.quantity
+        
+        leaderboard = [(user.user_id, user.email, from_paise(totals[user.user_id])) for user in users]
         
         # Sort by total value descending
-        leaderboard.sort(key=lambda x: x['total_value'], reverse=True)
+        leaderboard.sort(key=lambda row: row[2], reverse=True)
         
-        return jsonify(leaderboard)
+        return rows_response(app, LEADERBOARD_COLUMNS, leaderboard)
     except Exception as e:
-        print(f"Error fetching leaderboard: {str(e)}")
+        logger.error("Error fetching leaderboard: %s", e)
         return jsonify({'error': str(e)}), 500
 
 def add_initial_admin_stocks(user_id):
     try:
         # Get all stocks
-        stocks_response = supabase.table('stocks').select('id').execute()
+        stocks_response = supabase.table('stocks').select('id, current_price').execute()
         
         if not stocks_response.data:
-            print("No stocks found in database")
+            logger.info("No stocks found in database")
             return False
             
-        print(f"Adding {len(stocks_response.data)} stocks to admin portfolio")
+        logger.info("Adding %s stocks to admin portfolio", len(stocks_response.data))
         
         # Add 1000 shares of each stock to admin's portfolio
-        for stock in stocks_response.data:
+        for stock in decode(Stock, stocks_response.data):
             stock_data = {
                 'user_id': user_id,
-                'stock_id': stock['id'],
-                'quantity': 1000
+                'stock_id': stock.id,
+                'quantity': 1000,
+                'cost_basis': paise_str(1000 * stock_price(stock))
             }
             try:
                 insert_response = supabase.table('user_stocks').insert(stock_data).execute()
-                print(f"Added stock {stock['id']} to admin portfolio")
+                logger.info("Added stock %s to admin portfolio", stock.id)
             except Exception as e:
-                print(f"Error adding stock {stock['id']}: {str(e)}")
+                logger.error("Error adding stock %s: %s", stock.id, e)
                 # If insert fails, try to update existing holding
                 try:
                     update_response = supabase.table('user_stocks') \
-                    .update({'quantity': 1000}) \
+                    .update({'quantity': 1000, 'cost_basis': stock_data['cost_basis']}) \
                     .eq('user_id', user_id) \
-                    .eq('stock_id', stock['id']) \
+                    .eq('stock_id', stock.id) \
                     .execute()
-                    print(f"Updated existing stock {stock['id']} in admin portfolio")
+                    logger.info("Updated existing stock %s in admin portfolio", stock.id)
                 except Exception as update_error:
-                    print(f"Error updating stock {stock['id']}: {str(update_error)}")
+                    logger.error("Error updating stock %s: %s", stock.id, update_error)
                     continue
         
         return True
     except Exception as e:
-        print("Error adding initial admin stocks:", str(e))
+        logger.error("Error adding initial admin stocks: %s", e)
         return False
 
 # Admin stock management
@@ -1227,18 +2243,12 @@ def add_initial_admin_stocks(user_id):
 @token_required
 def ensure_admin_stocks(current_user):
     try:
-        # Check if user is admin
-        profile = supabase.table('profiles') \
-            .select('role') \
-            .eq('user_id', current_user['user_id']) \
-            .single() \
-            .execute()
-            
-        if not profile.data or profile.data['role'] != 'admin':
+        # Check if user is admin; token_required loaded the profile
+        if current_user.role != 'admin':
             return jsonify({'error': 'Admin access required'}), 403
             
         # Add initial stocks
-        success = add_initial_admin_stocks(current_user['user_id'])
+        success = add_initial_admin_stocks(current_user.user_id)
         
         if success:
             return jsonify({'message': 'Admin stocks verified and updated'}), 200
@@ -1246,7 +2256,7 @@ def ensure_admin_stocks(current_user):
             return jsonify({'error': 'Failed to update admin stocks'}), 500
             
     except Exception as e:
-        print("Error ensuring admin stocks:", str(e))
+        logger.error("Error ensuring admin stocks: %s", e)
         return jsonify({'error': str(e)}), 400
 
 @app.route('/api/admin/stocks/add', methods=['POST'])
@@ -1266,7 +2276,7 @@ def add_new_stock(current_user):
         new_stock = supabase.table('stocks').insert({
             'symbol': data['symbol'].upper(),
             'name': data['name'],
-            'current_price': float(data['current_price']),
+            'current_price': paise_str(to_paise(data['current_price'])),
             # 'description': data['description']
         }).execute()
         
@@ -1278,15 +2288,17 @@ def add_new_stock(current_user):
         # Add initial stock quantity to admin's portfolio
         initial_quantity = 1000
         user_stock = supabase.table('user_stocks').insert({
-            'user_id': current_user['user_id'],
+            'user_id': current_user.user_id,
             'stock_id': stock_id,
-            'quantity': initial_quantity
+            'quantity': initial_quantity,
+            'cost_basis': paise_str(initial_quantity * to_paise(new_stock.data[0]['current_price']))
         }).execute()
         
         if not user_stock.data:
             # Rollback stock creation if portfolio update fails
             supabase.table('stocks').delete().eq('id', stock_id).execute()
             return jsonify({'error': 'Failed to add stock to admin portfolio'}), 500
+        broadcast_invalidation(stock_list_cache, 'stocks')
             
         return jsonify({
             'message': 'Stock added successfully',
@@ -1297,5 +2309,121 @@ def add_new_stock(current_user):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/admin/db-pools', methods=['GET'])
+@admin_required
+def get_db_pool_metrics():
+    """Connection pool saturation, wait times and circuit breaker state"""
+    try:
+        from supabase_pool import pool_metrics
+        return jsonify(pool_metrics())
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/admin/logging', methods=['GET'])
+@admin_required
+def get_logging_stats():
+    """Log queue depth, dropped records and sampling counts"""
+    try:
+        return jsonify(log_pipeline.stats())
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/admin/rate-limits', methods=['GET'])
+@admin_required
+def get_rate_limit_stats():
+    """Requests admitted, rate limited and shed per route"""
+    try:
+        return jsonify(rate_limiter.stats())
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/admin/analytics', methods=['GET'])
+@admin_required
+def get_market_analytics():
+    """
+    Market activity over a sliding window (?window=, one of ANALYTICS_WINDOWS,
+    default the longest): volume, turnover, trades and active traders, the
+    most traded stocks with VWAP, and the top gainers and losers (?top=).
+    Served from in-memory aggregates, without querying orders.
+    """
+    try:
+        window = request.args.get('window', market_analytics.windows[-1][0])
+        if window not in dict(market_analytics.windows):
+            return jsonify({'error': f"window must be one of {', '.join(name for name, _ in market_analytics.windows)}"}), 400
+        top = min(max(1, request.args.get('top', default=10, type=int)), 100)
+        summary = market_analytics.summary(window, top)
+
+        # Stocks this process has only seen fills for have no symbol yet
+        rows = summary['most_active'] + summary['top_gainers'] + summary['top_losers']
+        unnamed = {row['stock_id'] for row in rows if row['symbol'] is None}
+        if unnamed:
+            stocks = supabase.table('stocks').select('id, symbol').in_('id', list(unnamed)).execute()
+            symbols = {stock['id']: stock['symbol'] for stock in stocks.data}
+            for row in rows:
+                if row['symbol'] is None:
+                    row['symbol'] = symbols.get(row['stock_id'])
+        summary['as_of'] = datetime.utcnow().isoformat()
+        return jsonify(summary)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/admin/engines', methods=['GET'])
+@admin_required
+def get_engine_status():
+    """State and cycle timings of the background engines"""
+    try:
+        return jsonify({
+            'engines': engines.status(),
+            'order_book_watermark': order_book_sync['watermark'],
+            'shards': shard_membership.status() if shard_membership is not None else None,
+            'trade_log': trade_log.stats() if trade_log is not None else None,
+            'order_events': order_events.stats(),
+            'order_expiry': expiry_wheel.stats(),
+            'cache_bus': dict(cache_bus.stats, backend=cache_bus.name, caches={
+                'market_state': market_state_cache.stats,
+                'stocks': stock_list_cache.stats,
+                'news': news_cache.stats
+            })
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/admin/engines/<action>', methods=['POST'])
+@admin_required
+def control_engines(action):
+    """
+    Start, pause, resume or stop background engines; all of them unless
+    the body names some, e.g. {"engines": ["order_processing"]}.
+    stop waits for cycles in flight; drain stops everything, flushes prices
+    and writes the restart checkpoint.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        names = data.get('engines')
+        if action in ('start', 'resume'):
+            changed = engines.start(names)
+            still_running = []
+        elif action == 'pause':
+            changed = engines.pause(names)
+            still_running = []
+        elif action == 'stop':
+            changed = names or list(engines.status())
+            still_running = engines.stop(names, timeout=ENGINE_DRAIN_TIMEOUT)
+        elif action == 'drain':
+            changed = list(engines.status())
+            still_running = drain_engines()
+        else:
+            return jsonify({'error': f'Unknown action: {action}'}), 400
+        return jsonify({
+            'message': f'Engines {action} requested',
+            'engines': changed,
+            'still_running': still_running,
+            'status': engines.status()
+        }), 200 if not still_running else 202
+    except KeyError as e:
+        return jsonify({'error': str(e.args[0])}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
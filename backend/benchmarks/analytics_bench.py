@@ -0,0 +1,117 @@
+"""
+Benchmark: cost and accuracy of the rolling market analytics.
+
+Feeds a day of synthetic fills and 30 second price ticks through
+MarketAnalytics on a virtual clock, then compares each window's summary
+with the same figures computed by scanning the raw fills (what a query on
+the orders table would do), and times recording and reading.
+    python benchmarks/analytics_bench.py [--symbols 2000] [--fills 500000] [--hours 24]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from analytics import MarketAnalytics, parse_windows
+from money import from_paise
+
+
+class Clock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def scan(fills, start, end):
+    """Window figures from the raw fills, as a table scan would get them"""
+    per_symbol = {}
+    users = set()
+    for at, stock_id, user_id, _, quantity, price in fills:
+        if start <= at < end:
+            totals = per_symbol.setdefault(stock_id, [0, 0, 0])
+            totals[0] += quantity
+            totals[1] += quantity * price
+            totals[2] += 1
+            users.add(user_id)
+    return per_symbol, users
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--symbols', type=int, default=2000)
+    parser.add_argument('--users', type=int, default=20000)
+    parser.add_argument('--fills', type=int, default=500_000)
+    parser.add_argument('--hours', type=float, default=24)
+    parser.add_argument('--windows', default='5m,1h,1d')
+    parser.add_argument('--seed', type=int, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    windows = parse_windows(args.windows)
+    clock = Clock(1_700_000_000.0)
+    analytics = MarketAnalytics(windows, clock=clock)
+    stocks = [f'stock-{n}' for n in range(args.symbols)]
+    prices = {stock_id: rng.randrange(5_000, 500_000) for stock_id in stocks}
+    seconds = args.hours * 3600
+    start = clock.now
+    fills = []
+    next_tick = start
+    record_time = tick_time = 0.0
+    for n in range(args.fills):
+        clock.now = start + seconds * n / args.fills
+        while next_tick <= clock.now:
+            for stock_id in stocks:
+                prices[stock_id] = max(1, round(prices[stock_id] * (1 + rng.gauss(0, 0.003))))
+            started = time.perf_counter()
+            analytics.record_prices([(stock_id, stock_id.upper(), prices[stock_id]) for stock_id in stocks])
+            tick_time += time.perf_counter() - started
+            next_tick += 30
+        stock_id = stocks[min(args.symbols - 1, int(rng.paretovariate(1.2)) - 1)]
+        fill = (clock.now, stock_id, f'user-{rng.randrange(args.users)}', rng.choice(('buy', 'sell')),
+                rng.randrange(1, 100), prices[stock_id])
+        fills.append(fill)
+        started = time.perf_counter()
+        analytics.record_fill(*fill[1:], at=fill[0])
+        record_time += time.perf_counter() - started
+
+    ticks = int(seconds // 30) + 1
+    print(f"{args.fills:,} fills and {ticks:,} price ticks over {args.hours:g} h, {args.symbols:,} stocks")
+    print(f"record_fill: {record_time / args.fills * 1e6:.1f} us; "
+          f"price tick for all stocks: {tick_time / ticks * 1000:.2f} ms")
+    print(f"\n{'window':<7} {'summary ms':>10} {'scan ms':>9} {'trades':>9} {'turnover':>16} "
+          f"{'traders':>8} {'max bucket error':>17}")
+    for name, window_seconds in windows:
+        started = time.perf_counter()
+        summary = analytics.summary(name, top=10)
+        summary_time = time.perf_counter() - started
+        width = window_seconds / analytics.buckets
+        # The window slides a bucket at a time: it starts at a bucket boundary
+        window_start = (int(clock.now // width) - analytics.buckets + 1) * width
+        started = time.perf_counter()
+        per_symbol, users = scan(fills, window_start, clock.now + 1)
+        scan_time = time.perf_counter() - started
+        trades = sum(totals[2] for totals in per_symbol.values())
+        turnover = sum(totals[1] for totals in per_symbol.values())
+        market = summary['market']
+        assert market['trades'] == trades, (market['trades'], trades)
+        assert market['turnover'] == from_paise(turnover)
+        assert market['active_traders'] == len(users)
+        for row in summary['most_active']:
+            volume, notional, count = per_symbol[row['stock_id']]
+            assert (row['volume'], row['trades']) == (volume, count)
+            assert row['vwap'] == from_paise(round(notional / volume))
+        print(f"{name:<7} {summary_time * 1000:>10.2f} {scan_time * 1000:>9.1f} {trades:>9,} "
+              f"{market['turnover']:>16,.2f} {market['active_traders']:>8,} {width:>16g}s")
+    leader = analytics.summary(windows[-1][0], top=3)
+    print(f"\ntop gainers ({windows[-1][0]}): " + ', '.join(
+        f"{row['symbol']} {row['change_percent']:+.2f}%" for row in leader['top_gainers']))
+    print("summaries match the scans: yes")
+
+
+if __name__ == '__main__':
+    main()
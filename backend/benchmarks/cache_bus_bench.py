@@ -0,0 +1,119 @@
+"""
+Benchmark: how fast cache invalidations reach the other processes.
+
+Starts worker processes, each with its own cache bus, then publishes
+invalidations and full price tick batches from this process. Workers
+record when each message arrived and report at the end, so the benchmark
+checks every worker got everything (large batches are split to fit a
+message) and reports the publish-to-receive latency.
+    python benchmarks/cache_bus_bench.py [--workers 8] [--messages 500] [--stocks 2000]
+    python benchmarks/cache_bus_bench.py --backend postgres --database-url postgresql://...
+"""
+import argparse
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from cache_bus import create_cache_bus
+
+
+def create_bus(args):
+    return create_cache_bus(args.backend, args.database_url, directory=args.directory)
+
+
+def worker(args, ready, results):
+    bus = create_bus(args)
+    received = {}      # ping n -> arrival time
+    ticks = {}         # batch -> stocks received
+    completed = {}     # batch -> time the last of its ticks arrived
+    done = multiprocessing.Event()
+
+    def on_ping(payload):
+        received[payload['n']] = time.time()
+
+    def on_prices(payload):
+        for stock_id, batch, _ in payload:
+            ticks.setdefault(batch, set()).add(stock_id)
+            if len(ticks[batch]) == args.stocks:
+                completed[batch] = time.time()
+
+    bus.subscribe('ping', on_ping)
+    bus.subscribe('prices', on_prices)
+    bus.subscribe('stop', lambda payload: done.set())
+    bus.start()
+    ready.set()
+    done.wait()
+    bus.stop()
+    results.put((received, completed))
+
+
+def percentiles(values):
+    values = sorted(values)
+    return (f"p50 {statistics.median(values):.2f} ms, p99 {values[int(len(values) * 0.99) - 1]:.2f} ms, "
+            f"max {values[-1]:.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backend', default='socket', choices=('socket', 'postgres'))
+    parser.add_argument('--database-url', default=os.getenv('DATABASE_URL'))
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--messages', type=int, default=500)
+    parser.add_argument('--interval', type=float, default=0.002, help='seconds between invalidations')
+    parser.add_argument('--stocks', type=int, default=2000, help='stocks per price tick batch')
+    parser.add_argument('--batches', type=int, default=20)
+    args = parser.parse_args()
+    args.directory = tempfile.mkdtemp(prefix='cache_bus_')
+
+    results = multiprocessing.Queue()
+    processes = []
+    for _ in range(args.workers):
+        ready = multiprocessing.Event()
+        process = multiprocessing.Process(target=worker, args=(args, ready, results), daemon=True)
+        process.start()
+        ready.wait(10)
+        processes.append(process)
+    bus = create_bus(args)
+    bus.start()
+    print(f"{args.workers} workers on the {bus.name} bus")
+
+    # One invalidation at a time, like control_market or create_news
+    sent = {}
+    for n in range(args.messages):
+        sent[n] = time.time()
+        bus.publish('ping', {'n': n})
+        time.sleep(args.interval)
+
+    # Whole price ticks, like update_stock_prices publishes every 30 seconds
+    published = {}
+    messages = bus.stats['sent']
+    time.sleep(0.2)
+    for batch in range(args.batches):
+        published[batch] = time.time()
+        bus.publish('prices', [[f'stock-{n:05d}', batch, n % 500] for n in range(args.stocks)])
+        time.sleep(0.05)
+    time.sleep(0.5)
+    messages = (bus.stats['sent'] - messages) / args.batches
+
+    bus.publish('stop')
+    reports = [results.get(timeout=30) for _ in processes]
+    for process in processes:
+        process.join(5)
+    bus.stop()
+
+    latencies = [(at - sent[n]) * 1000 for received, _ in reports for n, at in received.items()]
+    batch_latencies = [(at - published[batch]) * 1000 for _, completed in reports for batch, at in completed.items()]
+    print(f"invalidations: {len(latencies):,} of {args.messages * args.workers:,} delivered; {percentiles(latencies)}")
+    print(f"price batches of {args.stocks:,} ticks in {messages:.0f} messages: "
+          f"{len(batch_latencies)} of {args.batches * args.workers} complete; {percentiles(batch_latencies)}")
+    assert len(latencies) == args.messages * args.workers, 'invalidations were lost'
+    assert len(batch_latencies) == args.batches * args.workers, 'price ticks were lost'
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+"""
+Benchmark: serverless cold start of the wsgi.py entry point.
+
+Each sample is a fresh interpreter that imports wsgi (what a new Vercel
+function instance does), answers a CORS preflight, then builds the API
+database client the way the first database-backed request would. Also
+prints an import-time profile (python -X importtime) of the slowest
+top-level imports.
+
+Pass a git ref to compare against the tree as it was at that commit:
+    python benchmarks/cold_start_bench.py [--baseline REF] [--samples N]
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+PROBE = r'''
+import json, sys, threading, time
+started = time.perf_counter()
+import wsgi
+imported = time.perf_counter()
+import app
+client = wsgi.app.test_client()
+client.options('/api/stocks', headers={'Origin': 'https://example.com', 'Access-Control-Request-Method': 'GET'})
+preflight = time.perf_counter()
+threads = threading.active_count()
+supabase_imported = 'supabase' in sys.modules
+supabase = app.supabase
+if hasattr(supabase, 'get'):
+    supabase.get()
+supabase.table('stocks')
+db_ready = time.perf_counter()
+print('PROBE ' + json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'preflight_ms': (preflight - imported) * 1000,
+    'db_client_ms': (db_ready - preflight) * 1000,
+    'total_ms': (db_ready - started) * 1000,
+    'threads': threads,
+    'supabase_imported': supabase_imported
+}))
+sys.stdout.flush()
+'''
+
+
+def probe_env(scratch):
+    env = dict(os.environ)
+    env.update({
+        'SUPABASE_URL': env.get('SUPABASE_URL', 'http://localhost:54321'),
+        'SUPABASE_KEY': env.get('SUPABASE_KEY', 'bench.bench.bench'),
+        'PRICE_JOURNAL_PATH': os.path.join(scratch, 'price_ticks.journal'),
+        'TRADE_LOG_DIR': os.path.join(scratch, 'trade_log'),
+        'ENGINE_CHECKPOINT_PATH': os.path.join(scratch, 'engine_checkpoint.json'),
+        'PYTHONDONTWRITEBYTECODE': '1'
+    })
+    return env
+
+
+def checkout(ref, target):
+    """Extract backend/ as of a git ref into target and return its path"""
+    root = subprocess.run(['git', 'rev-parse', '--show-toplevel'], cwd=BACKEND_DIR,
+                          capture_output=True, text=True, check=True).stdout.strip()
+    archive = subprocess.run(['git', 'archive', ref, 'backend'], cwd=root, capture_output=True, check=True).stdout
+    archive_path = os.path.join(target, 'tree.tar')
+    with open(archive_path, 'wb') as f:
+        f.write(archive)
+    with tarfile.open(archive_path) as tar:
+        tar.extractall(target)
+    return os.path.join(target, 'backend')
+
+
+def run_probe(directory, env):
+    result = subprocess.run([sys.executable, '-c', PROBE], cwd=directory, env=env,
+                            capture_output=True, text=True, timeout=120)
+    for line in result.stdout.splitlines():
+        if line.startswith('PROBE '):
+            return json.loads(line[6:])
+    raise RuntimeError(f"probe failed in {directory}:\n{result.stderr[-2000:]}")
+
+
+def import_profile(directory, env, top=10):
+    """Slowest modules imported directly by app.py and wsgi.py, by cumulative ms"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import wsgi'], cwd=directory,
+                            env=env, capture_output=True, text=True, timeout=120)
+    rows = []
+    for line in result.stderr.splitlines():
+        match = re.match(r'import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)', line)
+        # Depth 1 and 2: wsgi, app and what they import themselves
+        if match and len(match.group(3)) <= 5:
+            rows.append((int(match.group(2)) / 1000, match.group(4)))
+    return sorted(rows, reverse=True)[:top]
+
+
+def report(name, samples, profile):
+    print(f"\n{name}: {len(samples)} cold starts")
+    print(f"  {'':<24} {'median ms':>10} {'min ms':>10}")
+    for key, label in (('import_ms', 'import wsgi'), ('preflight_ms', 'first preflight request'),
+                       ('db_client_ms', 'first DB client'), ('total_ms', 'total')):
+        values = [sample[key] for sample in samples]
+        print(f"  {label:<24} {statistics.median(values):>10.1f} {min(values):>10.1f}")
+    print(f"  threads after import: {samples[0]['threads']}, "
+          f"supabase imported before first DB use: {samples[0]['supabase_imported']}")
+    print("  slowest imports (cumulative ms):")
+    for ms, module in profile:
+        print(f"    {ms:>8.1f}  {module}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--baseline', help='git ref to compare against, e.g. HEAD~1')
+    parser.add_argument('--samples', type=int, default=7)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='cold-start-') as scratch:
+        env = probe_env(scratch)
+        targets = []
+        if args.baseline:
+            targets.append((f'baseline ({args.baseline})', checkout(args.baseline, scratch)))
+        targets.append(('working tree', os.path.abspath(BACKEND_DIR)))
+        # Interleave the trees so machine noise hits both alike
+        samples = {name: [] for name, _ in targets}
+        for _ in range(args.samples):
+            for name, directory in targets:
+                samples[name].append(run_probe(directory, env))
+        for name, directory in targets:
+            report(name, samples[name], import_profile(directory, env))
+
+
+if __name__ == '__main__':
+    main()
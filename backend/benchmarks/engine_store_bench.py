@@ -0,0 +1,66 @@
+"""
+Benchmark: engine queries through PostgREST vs. direct Postgres.
+
+Point both paths at the same local database (e.g. `supabase start`):
+    SUPABASE_URL=... SUPABASE_KEY=... DATABASE_URL=postgresql://... \
+        python benchmarks/engine_store_bench.py [rounds]
+
+Only idempotent writes are issued: prices are rewritten with their current values.
+"""
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from dotenv import load_dotenv
+
+from engine_store import PostgresEngineStore, PostgrestEngineStore
+from supabase_pool import create_pooled_client
+
+
+def timed(fn, rounds):
+    samples = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples), max(samples)
+
+
+def run(store, rounds):
+    stocks = store.fetch_stocks()
+    since = (datetime.now() - timedelta(seconds=30)).isoformat()
+    updates = [(stock.id, stock.current_price, stock.price_change) for stock in stocks]
+    cases = {
+        'fetch_stocks': store.fetch_stocks,
+        'pending_orders (all stocks)': lambda: [store.pending_orders(stock.id) for stock in stocks],
+        'recent_fills (all stocks)': lambda: [store.recent_fills(stock.id, since) for stock in stocks],
+        'expiring_orders': store.expiring_orders,
+        'write_prices (all stocks)': lambda: store.write_prices(updates),
+    }
+    print(f"\n{store.name}: {len(stocks)} stocks, {rounds} rounds")
+    print(f"{'operation':<30} {'median ms':>10} {'max ms':>10}")
+    for name, fn in cases.items():
+        median, worst = timed(fn, rounds)
+        print(f"{name:<30} {median:>10.2f} {worst:>10.2f}")
+
+
+def main():
+    load_dotenv()
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    if os.getenv('SUPABASE_URL') and os.getenv('SUPABASE_KEY'):
+        client = create_pooled_client('bench', os.getenv('SUPABASE_URL'), os.getenv('SUPABASE_KEY'))
+        run(PostgrestEngineStore(client), rounds)
+    else:
+        print("SUPABASE_URL / SUPABASE_KEY not set, skipping PostgREST")
+    if os.getenv('DATABASE_URL'):
+        run(PostgresEngineStore(os.getenv('DATABASE_URL')), rounds)
+    else:
+        print("DATABASE_URL not set, skipping direct Postgres")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+"""
+Benchmark: peak memory and throughput of the streaming order export.
+
+Drives GET /api/admin/orders/export through the Flask test client against
+a synthetic order table that is generated page by page, so the only memory
+that can grow is the export path itself. The same rows are then served the
+old way, loaded into a list and encoded in one response, for comparison.
+RSS is sampled every few milliseconds while each export runs.
+    python benchmarks/export_bench.py [--rows 1000000] [--skip-buffered]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(BENCH_DIR, '..'), BENCH_DIR]
+
+os.environ.setdefault('SUPABASE_URL', 'http://localhost:54321')
+os.environ.setdefault('SUPABASE_KEY', 'bench.bench.bench')
+os.environ['START_BACKGROUND_ENGINES'] = 'false'
+os.environ['LOG_LEVEL'] = 'CRITICAL'
+os.environ['RATE_LIMITS'] = ''
+os.environ['ROUTE_CONCURRENCY'] = ''
+os.environ['TRADE_LOG_DIR'] = ''
+os.environ['PRICE_JOURNAL_PATH'] = os.path.join(BENCH_DIR, '.bench_price_ticks.journal')
+
+import jwt
+
+import app as trading_app
+from json_response import encode_json
+from memory_supabase import MemorySupabase, attach
+from records import Stock
+
+PAGE_SIZE = 1000
+
+
+class SyntheticOrderStore:
+    """Engine store whose order table is generated one page at a time"""
+
+    def __init__(self, rows, symbols=200):
+        self.rows = rows
+        self.stock_ids = [str(uuid.UUID(int=n + 1)) for n in range(symbols)]
+
+    def fetch_stocks(self):
+        return [Stock(stock_id, f'SYM{n}') for n, stock_id in enumerate(self.stock_ids)]
+
+    def export_orders(self, user_id=None, status=None, page_size=1000):
+        opened = datetime(2024, 1, 1, 9, 15)
+        for start in range(0, self.rows, page_size):
+            page = []
+            for n in range(start, min(self.rows, start + page_size)):
+                created_at = opened + timedelta(milliseconds=n)
+                page.append({
+                    'id': str(uuid.UUID(int=(n + 1) << 64)),
+                    'user_id': str(uuid.UUID(int=n % 5000 + 1)),
+                    'stock_id': self.stock_ids[n % len(self.stock_ids)],
+                    'type': 'buy' if n % 2 else 'sell',
+                    'quantity': n % 50 + 1,
+                    'price': f'{100 + n % 9000}.{n % 100:02d}',
+                    'status': 'completed',
+                    'created_at': created_at.isoformat(),
+                    'executed_price': f'{100 + n % 9000}.{n % 100:02d}',
+                    'executed_at': (created_at + timedelta(seconds=120)).isoformat(),
+                    'error': None
+                })
+            yield from page
+
+
+def rss_bytes():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+class PeakRss:
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+
+    def __enter__(self):
+        self.start = rss_bytes()
+        self.peak = self.start
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, rss_bytes())
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, rss_bytes())
+
+
+def streamed(client, headers, export_format):
+    response = client.get(f'/api/admin/orders/export?format={export_format}', headers=headers, buffered=False)
+    assert response.status_code == 200, response.status_code
+    size = 0
+    for chunk in response.response:
+        size += len(chunk)
+    response.close()
+    return size
+
+
+def buffered(store):
+    # The get_user_orders pattern: every row in memory, then one JSON body
+    symbols = {stock.id: stock.symbol for stock in store.fetch_stocks()}
+    rows = []
+    for order in store.export_orders(page_size=PAGE_SIZE):
+        order['stock_symbol'] = symbols.get(order['stock_id'])
+        rows.append(order)
+    return len(encode_json(rows))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--skip-buffered', action='store_true')
+    args = parser.parse_args()
+
+    db = MemorySupabase()
+    attach(trading_app, db)
+    admin = db.add_user('admin@bench.local', 0, role='admin')
+    token = jwt.encode({'user_id': admin['user_id'], 'email': admin['email'], 'role': 'admin'},
+                       trading_app.JWT_SECRET, algorithm='HS256')
+    headers = {'Authorization': f'Bearer {token}'}
+    store = SyntheticOrderStore(args.rows)
+    trading_app.engine_store = store
+    client = trading_app.app.test_client()
+
+    runs = [('stream csv', lambda: streamed(client, headers, 'csv')),
+            ('stream ndjson', lambda: streamed(client, headers, 'ndjson'))]
+    if not args.skip_buffered:
+        runs.append(('buffered json', lambda: buffered(store)))
+
+    print(f"{args.rows:,} orders, {PAGE_SIZE} per page")
+    print(f"\n{'export':<16} {'MB':>9} {'seconds':>8} {'MB/s':>7} {'rows/s':>10} {'peak RSS +MB':>13}")
+    for name, run in runs:
+        with PeakRss() as rss:
+            started = time.perf_counter()
+            size = run()
+            elapsed = time.perf_counter() - started
+        print(f"{name:<16} {size / 1e6:>9.1f} {elapsed:>8.2f} {size / 1e6 / elapsed:>7.1f} "
+              f"{args.rows / elapsed:>10,.0f} {(rss.peak - rss.start) / 1e6:>13.1f}")
+    if os.path.exists(os.environ['PRICE_JOURNAL_PATH']):
+        os.remove(os.environ['PRICE_JOURNAL_PATH'])
+
+
+if __name__ == '__main__':
+    main()
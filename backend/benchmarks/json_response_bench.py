@@ -0,0 +1,85 @@
+"""
+Benchmark: per-endpoint CPU time to serialize large responses.
+
+Compares Flask's stdlib jsonify, the orjson-backed FastJSONProvider,
+the compact ?format=rows encoding, and gzip/brotli compression.
+    python benchmarks/json_response_bench.py
+"""
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from flask import Flask, jsonify
+from flask.json.provider import DefaultJSONProvider
+
+from json_response import FastJSONProvider, brotli, compress_response, orjson, rows_response
+
+ROUNDS = 5
+
+STOCK_ROWS = [{'id': str(uuid.uuid4()), 'name': f'Company {i}', 'symbol': f'SYM{i}',
+               'current_price': 100 + i * 0.37, 'price_change': 0.42, 'created_at': '2024-01-01T00:00:00+00:00'}
+              for i in range(2000)]
+NEWS_ROWS = [{'id': str(uuid.uuid4()), 'title': f'Headline {i}', 'content': 'Markets moved today. ' * 20,
+              'created_at': '2024-01-01T00:00:00+00:00'} for i in range(500)]
+ORDER_COLUMNS = ('id', 'stock_symbol', 'type', 'quantity', 'price', 'status', 'created_at')
+ORDER_ROWS = [(str(uuid.uuid4()), f'SYM{i % 2000}', 'buy' if i % 2 else 'sell', i % 100 + 1, 150.25 + i % 7,
+               'completed', '2024-01-01T00:00:00+00:00') for i in range(50000)]
+LEADERBOARD_COLUMNS = ('user_id', 'email', 'total_value')
+LEADERBOARD_ROWS = [(str(uuid.uuid4()), f'student{i}@example.com', 10000 + i * 1.5) for i in range(20000)]
+
+
+def make_app(provider, compact, compress):
+    app = Flask(__name__)
+    app.json = provider(app)
+    if compress:
+        app.after_request(compress_response)
+
+    def rows(columns, data):
+        if compact:
+            return rows_response(app, columns, data)
+        return jsonify([dict(zip(columns, row)) for row in data])
+
+    app.add_url_rule('/stocks', 'stocks', lambda: jsonify(STOCK_ROWS))
+    app.add_url_rule('/news', 'news', lambda: jsonify(NEWS_ROWS))
+    app.add_url_rule('/orders', 'orders', lambda: rows(ORDER_COLUMNS, ORDER_ROWS))
+    app.add_url_rule('/leaderboard', 'leaderboard', lambda: rows(LEADERBOARD_COLUMNS, LEADERBOARD_ROWS))
+    return app
+
+
+def measure(app, path, query='', headers=None):
+    client = app.test_client()
+    samples = []
+    size = 0
+    for _ in range(ROUNDS):
+        started = time.process_time()
+        response = client.get(path + query, headers=headers or {})
+        samples.append((time.process_time() - started) * 1000)
+        size = len(response.get_data())
+    return min(samples), size
+
+
+def main():
+    print(f"orjson: {'yes' if orjson else 'no'}, brotli: {'yes' if brotli else 'no'}")
+    variants = [
+        ('stdlib jsonify', make_app(DefaultJSONProvider, False, False), '', None),
+        ('fast provider', make_app(FastJSONProvider, False, False), '', None),
+        ('fast + rows builder', make_app(FastJSONProvider, True, False), '', None),
+        ('fast + ?format=rows', make_app(FastJSONProvider, True, False), '?format=rows', None),
+        ('fast + rows + gzip', make_app(FastJSONProvider, True, True), '?format=rows', {'Accept-Encoding': 'gzip'}),
+    ]
+    if brotli:
+        variants.append(('fast + rows + br', make_app(FastJSONProvider, True, True), '?format=rows',
+                         {'Accept-Encoding': 'br'}))
+    for path in ('/stocks', '/news', '/orders', '/leaderboard'):
+        print(f"\n{path}")
+        print(f"{'variant':<22} {'cpu ms':>8} {'bytes':>10}")
+        for name, app, query, headers in variants:
+            cpu_ms, size = measure(app, path, query, headers)
+            print(f"{name:<22} {cpu_ms:>8.1f} {size:>10}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""
+Benchmark: request latency with logging off, synchronous and through the
+async pipeline.
+
+A small Flask route logs the way buy_stock does (a couple of INFO lines per
+request) while a background thread logs price ticks the way the price
+ticker does. Each mode is run against a fast sink (/dev/null) and a slow
+one that blocks on every write, like a full stdout pipe or a slow log
+collector. Reports p50/p99 request latency and, for the async pipeline,
+records dropped by the bounded queue and ticks removed by sampling.
+    python benchmarks/logging_bench.py [requests]
+"""
+import io
+import logging
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from flask import Flask, jsonify
+
+from log_pipeline import LogPipeline
+
+TICKS_PER_SECOND = 2000
+SLOW_WRITE_SECONDS = 0.0002
+
+logger = logging.getLogger('app')
+tick_logger = logging.getLogger('app.ticks')
+
+
+class SlowSink(io.TextIOBase):
+    """Discards output but blocks on every write"""
+
+    def write(self, text):
+        time.sleep(SLOW_WRITE_SECONDS)
+        return len(text)
+
+
+def make_app():
+    app = Flask(__name__)
+
+    @app.route('/api/stocks/<stock_id>/buy', methods=['POST'])
+    def buy(stock_id):
+        logger.info("Starting buy transaction for user %s, stock %s, quantity %s", 'user-1', stock_id, 10)
+        logger.debug("Stock details fetched: %s", {'id': stock_id, 'current_price': '123.45'})
+        logger.info("Buy completed for user %s, stock %s", 'user-1', stock_id)
+        return jsonify({'message': 'ok'})
+
+    return app
+
+
+def tick(stop):
+    # The price ticker: a steady stream of per-stock INFO lines
+    n = 0
+    while not stop.is_set():
+        tick_logger.info("Updated price for %s to %s (random movement)", f'SYM{n % 50}', '123.45')
+        n += 1
+        time.sleep(1 / TICKS_PER_SECOND)
+
+
+def configure(mode, stream):
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    if mode == 'off':
+        root.setLevel(logging.WARNING)
+        return None
+    if mode == 'sync text':
+        handler = logging.StreamHandler(stream)
+        handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+        root.addHandler(handler)
+        root.setLevel(logging.INFO)
+        return None
+    return LogPipeline(
+        json_format=True,
+        async_enabled=mode.startswith('async'),
+        queue_size=10000,
+        sample_rates={'app.ticks': 0.01} if 'sampled' in mode else None,
+        stream=stream
+    ).install()
+
+
+def run(mode, stream, requests):
+    pipeline = configure(mode, stream)
+    client = make_app().test_client()
+    stop = threading.Event()
+    ticker = threading.Thread(target=tick, args=(stop,), daemon=True)
+    ticker.start()
+    latencies = []
+    for n in range(requests):
+        started = time.perf_counter()
+        client.post(f'/api/stocks/stock-{n % 50}/buy')
+        latencies.append(time.perf_counter() - started)
+    stop.set()
+    ticker.join()
+    stats = None
+    if pipeline is not None:
+        stats = pipeline.stats()
+        pipeline.stop()
+    latencies.sort()
+    return latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)], stats
+
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    modes = ['off', 'sync text', 'sync json', 'async json', 'async json sampled']
+    with open(os.devnull, 'w') as devnull:
+        for sink_name, stream in (('fast sink', devnull), ('slow sink', SlowSink())):
+            print(f"\n{sink_name}: {requests} requests, {TICKS_PER_SECOND} tick logs/s in the background")
+            print(f"  {'mode':<20} {'p50 ms':>8} {'p99 ms':>8} {'dropped':>8} {'sampled out':>12}")
+            for mode in modes:
+                p50, p99, stats = run(mode, stream, requests)
+                dropped = stats['dropped'] if stats else '-'
+                sampled_out = stats['sampled_out'] if stats else '-'
+                print(f"  {mode:<20} {p50 * 1000:>8.3f} {p99 * 1000:>8.3f} {dropped:>8} {sampled_out:>12}")
+
+
+if __name__ == '__main__':
+    main()
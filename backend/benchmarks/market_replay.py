@@ -0,0 +1,306 @@
+"""
+Offline market simulation: replay order flow through app.py's engines.
+
+Synthetic flow (or a recorded flow file) is placed through POST /api/orders
+while the real background engines (price ticker, matcher, order expiry,
+price flusher and ledger reconciler) run against the in-memory
+Supabase stand-in. Time is
+virtual: sleeps and simulated DB latency advance a shared clock instead of
+the wall clock, so an hour of trading replays in seconds. Same seed, same run.
+
+Reports fills per second, latency distributions, final price paths and
+database calls, so engine changes can be compared run against run.
+
+    python benchmarks/market_replay.py --users 2000 --symbols 200 --minutes 30
+    python benchmarks/market_replay.py --record flow.jsonl     # save the generated flow
+    python benchmarks/market_replay.py --replay flow.jsonl     # replay a saved flow
+
+Flow files are JSON lines: {"t": seconds from open, "user": name,
+"symbol": symbol, "type": "buy"|"sell", "quantity": n}.
+"""
+import argparse
+import csv
+import itertools
+import json
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(BENCH_DIR, '..'), BENCH_DIR]
+
+JOURNAL_DIR = tempfile.mkdtemp(prefix='market-replay-')
+os.environ.setdefault('SUPABASE_URL', 'http://localhost:54321')
+os.environ.setdefault('SUPABASE_KEY', 'bench.bench.bench')
+os.environ['START_BACKGROUND_ENGINES'] = 'false'
+os.environ['PRICE_JOURNAL_PATH'] = os.path.join(JOURNAL_DIR, 'price_ticks.journal')
+os.environ['TRADE_LOG_DIR'] = os.path.join(JOURNAL_DIR, 'trade_log')
+
+import jwt
+
+import app as trading_app
+from price_model import create_price_model
+from memory_supabase import MemorySupabase, attach
+from money import from_paise, to_paise
+from timing_wheel import TimingWheel
+from virtual_clock import VirtualClock, virtualized
+
+MARKET_OPEN = datetime(2024, 1, 1, 9, 15, tzinfo=trading_app.MARKET_TIMEZONE).timestamp()
+STARTING_BALANCE = 1_000_000
+HOLDINGS_PER_USER = 5
+STARTING_SHARES = 100
+
+
+def generate_flow(seed, users, symbols, rate, seconds):
+    """
+    Poisson order arrivals. Symbol popularity is skewed (1/rank) and sells
+    come from the seller's starting holdings so most of them can fill.
+    """
+    rng = random.Random(seed)
+    holdings = starting_holdings(seed, users, symbols)
+    weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(symbols))))
+    events = []
+    t = rng.expovariate(rate)
+    while t < seconds:
+        user = rng.choice(users)
+        if rng.random() < 0.5:
+            order_type, symbol = 'buy', rng.choices(symbols, cum_weights=weights)[0]
+        else:
+            order_type, symbol = 'sell', rng.choice(holdings[user])
+        events.append({'t': round(t, 3), 'user': user, 'symbol': symbol, 'type': order_type,
+                       'quantity': rng.randint(1, 10)})
+        t += rng.expovariate(rate)
+    return events
+
+
+def starting_holdings(seed, users, symbols):
+    # Seeded per user so a replayed flow rebuilds the same holdings
+    return {user: random.Random(f'{seed}-{user}').sample(symbols, min(HOLDINGS_PER_USER, len(symbols)))
+            for user in users}
+
+
+def build_market(db, seed, users, symbols):
+    rng = random.Random(f'prices-{seed}')
+    stocks = {symbol: db.add_stock(symbol, round(rng.uniform(50, 3000), 2)) for symbol in symbols}
+    headers = {}
+    for user, held in starting_holdings(seed, users, symbols).items():
+        profile = db.add_user(f'{user}@replay.local', STARTING_BALANCE)
+        for symbol in held:
+            db.add_holding(profile['user_id'], stocks[symbol]['id'], STARTING_SHARES)
+        token = jwt.encode({'user_id': profile['user_id'], 'email': profile['email'], 'role': 'user'},
+                           trading_app.JWT_SECRET, algorithm='HS256')
+        headers[user] = {'Authorization': f'Bearer {token}'}
+    return stocks, headers
+
+
+def percentiles(samples):
+    if not samples:
+        return [0.0] * 4
+    samples = sorted(samples)
+    return [samples[int(q * (len(samples) - 1))] for q in (0.5, 0.9, 0.99)] + [samples[-1]]
+
+
+class ErrorCounter(logging.Handler):
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.messages = Counter()
+
+    def emit(self, record):
+        self.messages[record.getMessage().split(':')[0]] += 1
+
+
+def simulate(args, events, users, symbols):
+    # The price ticker's movement for stocks without trades
+    trading_app.price_model = create_price_model(os.getenv('PRICE_MODEL', 'correlated'), seed=args.seed,
+                                                 mean_reversion=0.01)
+
+    end = MARKET_OPEN + (events[-1]['t'] if events else 0) + args.drain_minutes * 60
+    clock = VirtualClock(MARKET_OPEN, end)
+    # Order expiries run on the simulated day, not the wall clock
+    trading_app.expiry_wheel = TimingWheel(tick=trading_app.ORDER_EXPIRY_TICK, clock=clock.time)
+    db = MemorySupabase(latency=args.latency_ms / 1000, now=clock.now, sleep=clock.sleep)
+    attach(trading_app, db)
+    stocks, headers = build_market(db, args.seed, users, symbols)
+    db.calls.clear()
+
+    stats = {'responses': Counter(), 'request_latency': [], 'settle_latency': [], 'samples': []}
+
+    def place_orders():
+        client = trading_app.app.test_client()
+        for event in events:
+            clock.sleep(max(0.0, MARKET_OPEN + event['t'] - clock.time()))
+            placed_at = clock.time()
+            response = client.post('/api/orders', headers=headers[event['user']], json={
+                'stock_id': stocks[event['symbol']]['id'],
+                'type': event['type'],
+                'quantity': event['quantity']
+            })
+            stats['request_latency'].append(clock.time() - placed_at)
+            stats['responses'][response.status_code] += 1
+
+    def sample_prices():
+        while True:
+            stats['samples'].append((clock.time() - MARKET_OPEN, [
+                trading_app.price_store.get(stocks[symbol]['id']) for symbol in symbols]))
+            clock.sleep(args.sample_seconds)
+
+    process_order = trading_app.process_order
+
+    def timed_process_order(order_id, current_price):
+        started = clock.time()
+        try:
+            return process_order(order_id, current_price)
+        finally:
+            stats['settle_latency'].append(clock.time() - started)
+
+    clock.spawn('order_flow', place_orders)
+    clock.spawn('price_sampler', sample_prices)
+    trading_app.engines.start(spawn=clock.spawn)
+
+    errors = ErrorCounter()
+    root = logging.getLogger()
+    level = root.level
+    handlers = root.handlers[:]
+    root.handlers = [errors]
+    root.setLevel(logging.ERROR)
+    modules = [trading_app, sys.modules['price_store'], sys.modules['ledger'], sys.modules['engine_lifecycle'],
+               sys.modules['rate_limit']]
+    trading_app.process_order = timed_process_order
+    started = time.perf_counter()
+    try:
+        with virtualized(clock, modules):
+            clock.run()
+    finally:
+        wall = time.perf_counter() - started
+        trading_app.process_order = process_order
+        root.handlers = handlers
+        root.setLevel(level)
+    return db, clock, stats, errors.messages, wall
+
+
+def report(args, events, symbols, db, clock, stats, errors, wall):
+    simulated = clock.time() - MARKET_OPEN
+    orders = db.tables['orders']
+    by_status = Counter(order['status'] for order in orders)
+    fill_latency = [
+        (datetime.fromisoformat(order['executed_at']) - datetime.fromisoformat(order['created_at'])).total_seconds()
+        for order in orders if order['status'] == 'completed' and order.get('executed_at')
+    ]
+    fills = len(fill_latency)
+    cancel_reasons = Counter(order.get('error') or 'no reason recorded'
+                             for order in orders if order['status'] == 'cancelled')
+
+    print(f"{len(events)} orders from {len({event['user'] for event in events})} users on {len(symbols)} symbols, "
+          f"seed {args.seed}, {args.latency_ms} ms simulated DB latency")
+    print(f"simulated {simulated / 60:.1f} min in {wall:.2f} s wall ({simulated / wall:,.0f}x real time)")
+    responses = ', '.join(f'{status}: {count}' for status, count in sorted(stats['responses'].items()))
+    print(f"order requests: {responses}")
+    print(f"orders: {by_status['completed']} completed, {by_status['cancelled']} cancelled, "
+          f"{by_status['pending']} still pending")
+    for reason, count in cancel_reasons.most_common(3):
+        print(f"  cancelled: {count:>7}  {reason}")
+    print(f"fills: {fills / wall:,.0f} per wall second, {fills / max(simulated, 1) * 60:,.1f} per simulated minute")
+
+    print(f"\n{'latency (simulated s)':<28} {'p50':>9} {'p90':>9} {'p99':>9} {'max':>9} {'n':>8}")
+    for name, samples in (('place order request', stats['request_latency']),
+                          ('placement -> fill', fill_latency),
+                          ('settlement (process_order)', stats['settle_latency'])):
+        p50, p90, p99, top = percentiles(samples)
+        print(f"{name:<28} {p50:>9.3f} {p90:>9.3f} {p99:>9.3f} {top:>9.3f} {len(samples):>8}")
+
+    total_calls = db.total_calls()
+    print(f"\nDB calls: {total_calls} ({total_calls / max(fills, 1):.1f} per fill, "
+          f"{total_calls / max(len(events), 1):.1f} per order)")
+    for call, count in db.calls.most_common(8):
+        print(f"  {call:<28} {count:>9}")
+
+    # Every balance change went through the trade log, so replaying it must
+    # land on the database's balances and holdings
+    trade_log = trading_app.trade_log
+    holdings = {}
+    for row in db.tables['user_stocks']:
+        if row['quantity']:
+            holdings.setdefault(row['user_id'], {})[row['stock_id']] = row['quantity']
+    accounts = trade_log.accounts()
+    differ = sum(1 for profile in db.tables['profiles'] if profile['user_id'] in accounts and
+                 accounts[profile['user_id']] != (to_paise(profile['balance']), holdings.get(profile['user_id'], {})))
+    print(f"\ntrade log: {trade_log.stats()['seq']} events, {len(accounts)} accounts, "
+          f"{differ} differ from the database")
+
+    samples = stats['samples']
+    if samples:
+        paths = list(zip(*(prices for _, prices in samples)))
+        moves = []
+        for symbol, path in zip(symbols, paths):
+            path = [price for price in path if price is not None]
+            if path:
+                moves.append((path[-1] / path[0] - 1, symbol, path))
+        moves.sort(key=lambda move: abs(move[0]), reverse=True)
+        print(f"\nprice paths ({len(samples)} samples every {args.sample_seconds}s), biggest movers:")
+        print(f"  {'symbol':<10} {'open':>10} {'close':>10} {'low':>10} {'high':>10} {'change':>8}")
+        for change, symbol, path in moves[:args.movers]:
+            print(f"  {symbol:<10} {from_paise(path[0]):>10.2f} {from_paise(path[-1]):>10.2f} "
+                  f"{from_paise(min(path)):>10.2f} {from_paise(max(path)):>10.2f} {change:>+8.2%}")
+        if args.prices_csv:
+            with open(args.prices_csv, 'w', newline='') as out:
+                writer = csv.writer(out)
+                writer.writerow(['seconds'] + symbols)
+                for offset, prices in samples:
+                    writer.writerow([round(offset, 3)] + [from_paise(p) if p is not None else '' for p in prices])
+            print(f"  full paths written to {args.prices_csv}")
+
+    if errors or clock.errors:
+        print("\nerrors:")
+        for message, count in errors.most_common(8):
+            print(f"  {count:>7}  {message}")
+        for name, error in clock.errors:
+            print(f"  thread {name} died: {error!r}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--symbols', type=int, default=100)
+    parser.add_argument('--rate', type=float, default=5.0, help='orders per simulated second')
+    parser.add_argument('--minutes', type=float, default=30.0, help='minutes of order flow')
+    parser.add_argument('--drain-minutes', type=float, default=10.0, help='engine time after the last order')
+    parser.add_argument('--latency-ms', type=float, default=5.0, help='simulated round trip per DB call')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--sample-seconds', type=float, default=60.0)
+    parser.add_argument('--movers', type=int, default=5)
+    parser.add_argument('--prices-csv')
+    flow = parser.add_mutually_exclusive_group()
+    flow.add_argument('--record', help='write the generated flow to this file')
+    flow.add_argument('--replay', help='replay a flow file instead of generating one')
+    args = parser.parse_args()
+
+    if args.replay:
+        with open(args.replay) as flow_file:
+            events = sorted((json.loads(line) for line in flow_file if line.strip()), key=lambda event: event['t'])
+        # Shortest first keeps generated names (SYM2 < SYM10) in generation order
+        users = sorted({event['user'] for event in events}, key=lambda name: (len(name), name))
+        symbols = sorted({event['symbol'] for event in events}, key=lambda name: (len(name), name))
+    else:
+        users = [f'user-{i}' for i in range(args.users)]
+        symbols = [f'SYM{i}' for i in range(args.symbols)]
+        events = generate_flow(args.seed, users, symbols, args.rate, args.minutes * 60)
+        if args.record:
+            with open(args.record, 'w') as flow_file:
+                for event in events:
+                    flow_file.write(json.dumps(event) + '\n')
+
+    try:
+        report(args, events, symbols, *simulate(args, events, users, symbols))
+    finally:
+        trading_app.trade_log.close()
+        shutil.rmtree(JOURNAL_DIR, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,382 @@
+"""
+In-memory stand-in for the subset of the Supabase client used by app.py.
+
+Tables are lists of dict rows. Every execute() counts as one database call
+and can optionally sleep to simulate a PostgREST round trip. Writes to
+columns that are not in schema.sql (plus migrations) fail like PostgREST
+does, as does a second order() on one query, and eq filters on key
+columns use hash lookups so large simulated order books stay fast.
+"""
+import threading
+import time
+import uuid
+from collections import Counter
+from types import SimpleNamespace
+
+
+# Columns from schema.sql and migrations/, plus the optional ones app.py reads
+COLUMNS = {
+    'profiles': {'user_id', 'email', 'role', 'is_admin', 'balance', 'realized_pnl', 'created_at'},
+    'stocks': {'id', 'name', 'symbol', 'current_price', 'price_change', 'min_price', 'max_price', 'sector',
+               'created_at'},
+    'orders': {'id', 'user_id', 'stock_id', 'type', 'quantity', 'price', 'status', 'created_at',
+               'executed_price', 'executed_at', 'error', 'time_in_force', 'expires_at'},
+    'user_stocks': {'id', 'user_id', 'stock_id', 'quantity', 'cost_basis', 'realized_pnl', 'created_at'},
+    'news': {'id', 'title', 'content', 'created_at'},
+    'market_state': {'id', 'is_active', 'updated_at'},
+}
+
+# Columns the app never updates, so hash lookups on them stay valid across updates
+KEY_COLUMNS = ('id', 'user_id', 'stock_id')
+
+
+class Result:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+
+def _compare(value, other):
+    # PostgREST compares timestamps and numbers as text in this app's queries
+    return (str(value) > str(other)) - (str(value) < str(other))
+
+
+class Query:
+    def __init__(self, db, table):
+        self.db = db
+        self.table = table
+        self.op = 'select'
+        self.payload = None
+        self.columns = '*'
+        self.filters = []
+        self.keys = []       # (column, value) from eq filters on key columns
+        self.ordering = []
+        self.row_range = None
+        self.row_limit = None
+        self.single_row = False
+        self.negate_next = False
+
+    def select(self, columns='*', count=None):
+        self.op = 'select'
+        self.columns = columns
+        return self
+
+    def insert(self, payload):
+        self.op = 'insert'
+        self.payload = payload
+        return self
+
+    def upsert(self, payload, **kwargs):
+        self.op = 'upsert'
+        self.payload = payload
+        return self
+
+    def update(self, payload):
+        self.op = 'update'
+        self.payload = payload
+        return self
+
+    def delete(self):
+        self.op = 'delete'
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda row: row.get(column) == value)
+        if column in KEY_COLUMNS:
+            self.keys.append((column, value))
+        return self
+
+    def neq(self, column, value):
+        self.filters.append(lambda row: row.get(column) != value)
+        return self
+
+    def gt(self, column, value):
+        self.filters.append(lambda row: row.get(column) is not None and _compare(row[column], value) > 0)
+        return self
+
+    def gte(self, column, value):
+        self.filters.append(lambda row: row.get(column) is not None and _compare(row[column], value) >= 0)
+        return self
+
+    def lt(self, column, value):
+        self.filters.append(lambda row: row.get(column) is not None and _compare(row[column], value) < 0)
+        return self
+
+    def lte(self, column, value):
+        self.filters.append(lambda row: row.get(column) is not None and _compare(row[column], value) <= 0)
+        return self
+
+    @property
+    def not_(self):
+        self.negate_next = True
+        return self
+
+    def is_(self, column, value):
+        # Only is null / not null are used
+        negate, self.negate_next = self.negate_next, False
+        self.filters.append(lambda row: (row.get(column) is None) != negate)
+        return self
+
+    def in_(self, column, values):
+        values = set(values)
+        self.filters.append(lambda row: row.get(column) in values)
+        return self
+
+    def order(self, column, desc=False):
+        # postgrest-py sends one order=col[.desc] parameter per call, and
+        # PostgREST reads only one of them: several keys go comma separated
+        if self.ordering:
+            raise Exception('A query takes one order parameter; pass the columns as "a,b"')
+        for key in f"{column}{'.desc' if desc else ''}".split(','):
+            name, _, direction = key.strip().partition('.')
+            self.ordering.append((name, direction == 'desc'))
+        return self
+
+    def range(self, start, end):
+        self.row_range = (start, end)
+        return self
+
+    def limit(self, count):
+        self.row_limit = count
+        return self
+
+    def single(self):
+        self.single_row = True
+        return self
+
+    def _matching(self, rows):
+        if self.keys:
+            rows = self.db.lookup(self.table, *self.keys[0])
+        return [row for row in rows if all(f(row) for f in self.filters)]
+
+    def _check_columns(self, items):
+        for item in items:
+            for column in item:
+                if column not in COLUMNS[self.table]:
+                    raise Exception(f"Could not find the '{column}' column of '{self.table}' in the schema cache")
+
+    def _projection(self):
+        """(set of columns or None for all of them, {embedded table: its select list})"""
+        items, depth, start = [], 0, 0
+        for position, char in enumerate(self.columns + ','):
+            if char == '(':
+                depth += 1
+            elif char == ')':
+                depth -= 1
+            elif char == ',' and not depth:
+                items.append(self.columns[start:position].strip())
+                start = position + 1
+        columns, embeds = set(), {}
+        for item in filter(None, items):
+            if '(' in item:
+                table, _, inner = item.partition('(')
+                embeds[table.strip()] = inner[:-1]
+            else:
+                columns.add(item)
+        if '*' in columns:
+            return None, embeds
+        for column in columns:
+            if column not in COLUMNS[self.table]:
+                raise Exception(f"column {self.table}.{column} does not exist")
+        return columns, embeds
+
+    def _project(self, row, projection):
+        columns, embeds = projection
+        projected = dict(row) if columns is None else {column: row.get(column) for column in columns}
+        # Only the stocks(...) embedding is used by the app
+        if 'stocks' in embeds:
+            stock = self.db.index('stocks').get(row.get('stock_id'))
+            embedded = Query(self.db, 'stocks').select(embeds['stocks'])
+            projected['stocks'] = embedded._project(stock, embedded._projection()) if stock else None
+        return projected
+
+    def execute(self):
+        self.db.record(self.table, self.op)
+        with self.db.lock:
+            rows = self.db.tables.setdefault(self.table, [])
+            if self.op == 'select':
+                projection = self._projection()
+                result = [self._project(row, projection) for row in self._matching(rows)]
+                for column, desc in reversed(self.ordering):
+                    result.sort(key=lambda row: str(row.get(column)), reverse=desc)
+                if self.row_range:
+                    result = result[self.row_range[0]:self.row_range[1] + 1]
+                if self.row_limit is not None:
+                    result = result[:self.row_limit]
+                if self.single_row:
+                    if len(result) != 1:
+                        raise Exception('JSON object requested, multiple (or no) rows returned')
+                    return Result(result[0])
+                return Result(result, len(result))
+
+            if self.op in ('insert', 'upsert'):
+                items = self.payload if isinstance(self.payload, list) else [self.payload]
+                self._check_columns(items)
+                inserted = []
+                for item in items:
+                    row = dict(item)
+                    row.setdefault('id', str(uuid.uuid4()))
+                    if self.table == 'orders':
+                        row.setdefault('status', 'pending')
+                        row.setdefault('time_in_force', 'DAY')
+                    row.setdefault('created_at', self.db.now().isoformat())
+                    rows.append(row)
+                    self.db.add_to_lookups(self.table, row)
+                    inserted.append(dict(row))
+                self.db.invalidate(self.table)
+                return Result(inserted)
+
+            if self.op == 'update':
+                self._check_columns([self.payload])
+                updated = []
+                for row in self._matching(rows):
+                    row.update(self.payload)
+                    updated.append(dict(row))
+                self.db.invalidate(self.table)
+                return Result(updated)
+
+            matching = self._matching(rows)
+            ids = {id(row) for row in matching}
+            self.db.tables[self.table] = [row for row in rows if id(row) not in ids]
+            self.db.invalidate(self.table)
+            self.db.drop_lookups(self.table)
+            return Result([dict(row) for row in matching])
+
+
+class RpcCall:
+    def __init__(self, db, fn, params):
+        self.db = db
+        self.fn = fn
+        self.params = params
+
+    def execute(self):
+        self.db.record('rpc', self.fn)
+        with self.db.lock:
+            if self.fn == 'get_pending_orders':
+                orders = [dict(order) for order in self.db.lookup('orders', 'stock_id', self.params['stock_id_param'])
+                          if order['status'] == 'pending']
+                orders.sort(key=lambda order: str(order['created_at']))
+                return Result(orders)
+            if self.fn == 'update_stock_price':
+                stock = self.db.index('stocks').get(self.params['stock_id_param'])
+                if stock:
+                    stock['current_price'] = self.params['new_price_param']
+                    stock['price_change'] = self.params['price_change_param']
+                return Result(None)
+        raise Exception(f'Unknown function {self.fn}')
+
+
+class MemorySupabase:
+    """
+    Drop-in replacement for the supabase Client used by app.py
+    """
+
+    def __init__(self, latency=0.0, now=None, sleep=None, auth_latency=None):
+        self.latency = latency
+        self.auth_latency = latency if auth_latency is None else auth_latency
+        self.now = now or __import__('datetime').datetime.now
+        self.sleep = sleep or time.sleep
+        self.lock = threading.RLock()
+        self.tables = {name: [] for name in ('profiles', 'stocks', 'orders', 'user_stocks', 'news')}
+        self.tables['market_state'] = [{'id': 1, 'is_active': True}]
+        self.calls = Counter()
+        self._indexes = {}
+        self._lookups = {}   # (table, column) -> {value: [rows]}
+        self.auth_users = {}   # email -> auth user id
+        self.auth = SimpleNamespace(sign_up=self._sign_up, sign_in_with_password=self._sign_in,
+                                    admin=SimpleNamespace(create_user=self._sign_up))
+
+    def record(self, table, op):
+        self.calls[f'{table}.{op}'] += 1
+        if self.latency:
+            self.sleep(self.latency)
+
+    def total_calls(self):
+        return sum(self.calls.values())
+
+    def index(self, table):
+        if table not in self._indexes:
+            self._indexes[table] = {row['id']: row for row in self.tables[table]}
+        return self._indexes[table]
+
+    def invalidate(self, table):
+        self._indexes.pop(table, None)
+
+    def lookup(self, table, column, value):
+        """Rows whose key column equals value"""
+        lookup = self._lookups.get((table, column))
+        if lookup is None:
+            lookup = self._lookups[(table, column)] = {}
+            for row in self.tables.setdefault(table, []):
+                lookup.setdefault(row.get(column), []).append(row)
+        return lookup.get(value, ())
+
+    def add_to_lookups(self, table, row):
+        for (lookup_table, column), lookup in self._lookups.items():
+            if lookup_table == table:
+                lookup.setdefault(row.get(column), []).append(row)
+
+    def drop_lookups(self, table):
+        for key in [key for key in self._lookups if key[0] == table]:
+            del self._lookups[key]
+
+    def table(self, table):
+        return Query(self, table)
+
+    from_ = table
+
+    def rpc(self, fn, params):
+        return RpcCall(self, fn, params)
+
+    def _sign_up(self, credentials):
+        # Auth calls sleep outside the table lock, like concurrent requests
+        self.calls['auth.sign_up'] += 1
+        if self.auth_latency:
+            self.sleep(self.auth_latency)
+        with self.lock:
+            if credentials['email'] in self.auth_users:
+                raise Exception('User already registered')
+            user_id = self.auth_users[credentials['email']] = str(uuid.uuid4())
+        return SimpleNamespace(user=SimpleNamespace(id=user_id))
+
+    def _sign_in(self, credentials):
+        self.record('auth', 'sign_in')
+        for profile in self.tables['profiles']:
+            if profile['email'] == credentials['email']:
+                return SimpleNamespace(user=SimpleNamespace(id=profile['user_id']))
+        raise Exception('Invalid login credentials')
+
+    def add_stock(self, symbol, price, stock_id=None):
+        stock = {'id': stock_id or str(uuid.uuid4()), 'symbol': symbol, 'name': symbol, 'current_price': f'{price:.2f}',
+                 'price_change': 0, 'created_at': self.now().isoformat()}
+        self.tables['stocks'].append(stock)
+        self.add_to_lookups('stocks', stock)
+        self.invalidate('stocks')
+        return stock
+
+    def add_user(self, email, balance, role='user', user_id=None):
+        profile = {'user_id': user_id or str(uuid.uuid4()), 'email': email, 'role': role, 'is_admin': role == 'admin',
+                   'balance': f'{balance:.2f}', 'created_at': self.now().isoformat()}
+        self.tables['profiles'].append(profile)
+        self.add_to_lookups('profiles', profile)
+        return profile
+
+    def add_holding(self, user_id, stock_id, quantity):
+        holding = {'id': str(uuid.uuid4()), 'user_id': user_id, 'stock_id': stock_id, 'quantity': quantity}
+        self.tables['user_stocks'].append(holding)
+        self.add_to_lookups('user_stocks', holding)
+
+    def add_order(self, order):
+        """Store an order row as if another process had inserted it"""
+        Query(self, 'orders')._check_columns([order])
+        self.tables['orders'].append(order)
+        self.add_to_lookups('orders', order)
+        self.invalidate('orders')
+
+
+def attach(app_module, client):
+    """Point every client the app module uses at the in-memory store"""
+    app_module.supabase = client
+    app_module.engine_supabase = client
+    app_module.onboarding_supabase = client
+    app_module.engine_store.get().client = client
@@ -0,0 +1,124 @@
+"""
+Property check: cash and shares are conserved across simulated trades.
+
+Random buy/sell pairs are reserved and settled through the AccountLedger in
+integer paise. After every checkpoint the total cash and the total shares
+per stock must equal the starting totals exactly, and no reservation may be
+left behind. The same trades are replayed with float rupees, the way
+balances used to be updated, to show the drift the integer path avoids.
+Also checks that paise survive a round trip through the DECIMAL string
+format used at the database boundary.
+The settlement routes themselves (buy_stock, sell_stock, process_order)
+are covered by tests/test_money_conservation.py.
+
+    python benchmarks/money_conservation_check.py [trades]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from ledger import AccountLedger, RiskCheckFailed
+from money import from_paise, paise_str, to_paise
+
+ACCOUNTS = 1000
+STOCKS = 50
+CHECKPOINTS = 10
+
+
+def check_round_trip(rng, samples=200000):
+    for _ in range(samples):
+        paise = rng.randrange(-10 ** 12, 10 ** 12)
+        assert to_paise(paise_str(paise)) == paise, paise
+        assert to_paise(from_paise(paise)) == paise, paise
+    # Half-paisa inputs round away from zero, as NUMERIC(15, 2) does
+    assert to_paise('0.005') == 1 and to_paise('10.994') == 1099 and to_paise('-1.255') == -126
+    return samples
+
+
+def totals(ledger, user_ids):
+    cash = 0
+    shares = {}
+    for user_id in user_ids:
+        account = ledger.get_account(user_id)
+        assert account.reserved_cash == 0 and not account.reserved_shares, user_id
+        cash += account.cash
+        for stock_id, quantity in account.shares.items():
+            shares[stock_id] = shares.get(stock_id, 0) + quantity
+    return cash, shares
+
+
+def main():
+    trades = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    rng = random.Random(7)
+
+    started = time.perf_counter()
+    print(f"round trip: {check_round_trip(rng)} random amounts ok ({time.perf_counter() - started:.1f}s)")
+
+    ledger = AccountLedger()
+    user_ids = [f'user-{i}' for i in range(ACCOUNTS)]
+    stock_ids = [f'stock-{i}' for i in range(STOCKS)]
+    prices = [rng.randrange(100, 300000) for _ in stock_ids]
+    float_cash = {}
+    for user_id in user_ids:
+        balance = f'{rng.randrange(10000, 10000000)}.{rng.randrange(100):02d}'
+        holdings = {stock_id: rng.randrange(0, 500) for stock_id in stock_ids}
+        ledger.load_account(user_id, to_paise(balance), holdings)
+        float_cash[user_id] = float(balance)
+    start_cash, start_shares = totals(ledger, user_ids)
+
+    filled = rejected = 0
+    started = time.perf_counter()
+    for n in range(1, trades + 1):
+        buyer, seller = rng.sample(user_ids, 2)
+        index = rng.randrange(STOCKS)
+        stock_id = stock_ids[index]
+        # Prices wander by whole paise, like the price ticker
+        prices[index] = max(1, prices[index] + rng.randrange(-50, 51))
+        price = prices[index]
+        quantity = rng.randrange(1, 20)
+
+        try:
+            ledger.reserve(f'b{n}', buyer, stock_id, 'buy', quantity, price)
+        except RiskCheckFailed:
+            rejected += 1
+            continue
+        try:
+            ledger.reserve(f's{n}', seller, stock_id, 'sell', quantity, price)
+        except RiskCheckFailed:
+            ledger.release(f'b{n}')
+            rejected += 1
+            continue
+        ledger.settle(f'b{n}', price)
+        ledger.settle(f's{n}', price)
+        filled += 1
+
+        float_price = price / 100
+        float_cash[buyer] = float_cash[buyer] - float_price * quantity
+        float_cash[seller] = float_cash[seller] + float_price * quantity
+
+        if n % (trades // CHECKPOINTS or 1) == 0:
+            cash, shares = totals(ledger, user_ids)
+            assert cash == start_cash, (n, cash, start_cash)
+            assert shares == start_shares, n
+    elapsed = time.perf_counter() - started
+
+    cash, shares = totals(ledger, user_ids)
+    assert cash == start_cash and shares == start_shares
+    # The old code wrote str(balance) straight back to the profiles table
+    noisy = sum(1 for user_id in user_ids if len(str(float_cash[user_id]).partition('.')[2]) > 2)
+    wrong = sum(1 for user_id in user_ids if to_paise(float_cash[user_id]) != ledger.get_account(user_id).cash)
+    float_total = sum(float_cash.values())
+
+    print(f"{trades} trades: {filled} filled, {rejected} rejected by risk checks, "
+          f"{elapsed:.1f}s ({trades / elapsed:,.0f} trades/s)")
+    print(f"paise ledger: total cash {paise_str(cash)} == start {paise_str(start_cash)}, "
+          f"shares conserved for {len(shares)} stocks")
+    print(f"float replay: total cash {float_total!r} (off by {float_total - start_cash / 100:+.10f}), "
+          f"{noisy} of {ACCOUNTS} balances carry sub-paisa noise, {wrong} round to the wrong paisa")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+Benchmark: registering a competition's worth of users.
+
+Builds a CSV of --users students (plus a few bad rows and users who are
+already registered) and uploads it to POST /api/admin/users/bulk against
+the in-memory Supabase stand-in, with every auth call and table request
+taking a fixed latency. For comparison, a sample of users goes through
+/api/auth/register one by one, and that time is extrapolated to the whole file.
+    python benchmarks/onboarding_bench.py [--users 5000] [--auth-latency 0.05] [--db-latency 0.02]
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(BENCH_DIR, '..'), BENCH_DIR]
+
+os.environ.setdefault('SUPABASE_URL', 'http://localhost:54321')
+os.environ.setdefault('SUPABASE_KEY', 'bench.bench.bench')
+os.environ['START_BACKGROUND_ENGINES'] = 'false'
+os.environ['LOG_LEVEL'] = 'CRITICAL'
+os.environ['RATE_LIMITS'] = ''
+os.environ['ROUTE_CONCURRENCY'] = ''
+os.environ['TRADE_LOG_DIR'] = ''
+os.environ['PRICE_JOURNAL_PATH'] = os.path.join(BENCH_DIR, '.bench_price_ticks.journal')
+
+import jwt
+
+import app as trading_app
+from memory_supabase import MemorySupabase, attach
+
+
+def users_csv(count, registered):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(['email', 'password', 'role', 'balance'])
+    for n in range(count):
+        writer.writerow([f'student{n}@contest.local', f'pass-{n:06d}', 'user', '' if n % 10 else '25000'])
+    writer.writerow(['judge@contest.local', 'judge-pass', 'admin', ''])
+    writer.writerow(['not-an-email', 'password1', 'user', ''])
+    writer.writerow(['student0@contest.local', 'pass-again', 'user', ''])
+    writer.writerow(['short@contest.local', 'abc', 'user', ''])
+    for email in registered:
+        writer.writerow([email, 'password1', 'user', ''])
+    return buffer.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--auth-latency', type=float, default=0.05)
+    parser.add_argument('--db-latency', type=float, default=0.02)
+    parser.add_argument('--concurrency', type=int, default=trading_app.BULK_ONBOARD_CONCURRENCY)
+    parser.add_argument('--sequential-sample', type=int, default=50)
+    args = parser.parse_args()
+    trading_app.BULK_ONBOARD_CONCURRENCY = args.concurrency
+
+    db = MemorySupabase(latency=args.db_latency, auth_latency=args.auth_latency)
+    attach(trading_app, db)
+    for n in range(20):
+        db.add_stock(f'SYM{n}', 100 + n)
+    admin = db.add_user('admin@contest.local', 0, role='admin')
+    registered = [db.add_user(f'returning{n}@contest.local', 10000)['email'] for n in range(5)]
+    token = jwt.encode({'user_id': admin['user_id'], 'email': admin['email'], 'role': 'admin'},
+                       trading_app.JWT_SECRET, algorithm='HS256')
+    client = trading_app.app.test_client()
+    body = users_csv(args.users, registered)
+
+    started = time.perf_counter()
+    response = client.post('/api/admin/users/bulk', data=body, content_type='text/csv',
+                           headers={'Authorization': f'Bearer {token}'})
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    bulk = time.perf_counter() - started
+    report = lines[-1]
+    assert response.status_code == 200 and report['phase'] == 'done', lines[-1]
+    profiles = {profile['email']: profile for profile in db.tables['profiles']}
+    expected = args.users + 1
+    assert report['created'] == expected, report
+    assert all(f'student{n}@contest.local' in profiles for n in range(args.users))
+    assert profiles['student0@contest.local']['balance'] == '25000.00'
+    assert profiles['student1@contest.local']['balance'] == '10000.00'
+    assert sum(1 for holding in db.tables['user_stocks'] if holding['user_id'] == profiles['judge@contest.local']['user_id']) == 20
+
+    calls = dict(db.calls)
+    sample = args.sequential_sample
+    started = time.perf_counter()
+    for n in range(sample):
+        client.post('/api/auth/register', json={'email': f'single{n}@contest.local', 'password': 'password1'})
+    sequential = (time.perf_counter() - started) / sample * (args.users + 1)
+
+    print(f"{args.users:,} users + 1 admin, auth call {args.auth_latency * 1000:.0f} ms, "
+          f"table request {args.db_latency * 1000:.0f} ms, concurrency {args.concurrency}")
+    print(f"bulk upload: {bulk:.1f} s ({expected / bulk:,.0f} users/s), {len(lines) - 1} progress lines, "
+          f"{calls.get('profiles.insert', 0)} profile inserts, {calls.get('auth.sign_up', 0)} auth calls")
+    print(f"one by one (from {sample} registrations): {sequential:.1f} s, {sequential / bulk:.1f}x slower")
+    print(f"report: {report['created']} created, {report['skipped']} already registered, {report['failed']} failed")
+    for failure in report['failures']:
+        print(f"  row {failure['row']} {failure['email']}: {failure['error']}")
+    if os.path.exists(os.environ['PRICE_JOURNAL_PATH']):
+        os.remove(os.environ['PRICE_JOURNAL_PATH'])
+
+
+if __name__ == '__main__':
+    main()
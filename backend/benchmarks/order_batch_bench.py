@@ -0,0 +1,75 @@
+"""
+Benchmark: per-order overhead of POST /api/orders vs. POST /api/orders/batch.
+
+Drives the real Flask routes against the in-memory Supabase stand-in, with
+a simulated round-trip latency per database call.
+    python benchmarks/order_batch_bench.py [orders] [latency_ms]
+"""
+import os
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(BENCH_DIR, '..'), BENCH_DIR]
+
+os.environ.setdefault('SUPABASE_URL', 'http://localhost:54321')
+os.environ.setdefault('SUPABASE_KEY', 'bench.bench.bench')
+os.environ['START_BACKGROUND_ENGINES'] = 'false'
+os.environ['RATE_LIMITS'] = ''    # one user places every order back to back
+os.environ['PRICE_JOURNAL_PATH'] = os.path.join(BENCH_DIR, '.bench_price_ticks.journal')
+os.environ['TRADE_LOG_DIR'] = ''    # not measured here
+
+import jwt
+
+import app as trading_app
+from memory_supabase import MemorySupabase, attach
+
+
+def setup(latency):
+    db = MemorySupabase(latency=latency)
+    attach(trading_app, db)
+    stocks = [db.add_stock(f'SYM{i}', 100 + i) for i in range(20)]
+    user = db.add_user('bench@example.com', 10_000_000)
+    token = jwt.encode({'user_id': user['user_id'], 'email': user['email'], 'role': 'user'},
+                       trading_app.JWT_SECRET, algorithm='HS256')
+    return db, stocks, {'Authorization': f'Bearer {token}'}
+
+
+def run_single(count, latency):
+    db, stocks, headers = setup(latency)
+    client = trading_app.app.test_client()
+    started = time.perf_counter()
+    for i in range(count):
+        response = client.post('/api/orders', headers=headers, json={
+            'stock_id': stocks[i % len(stocks)]['id'], 'type': 'buy', 'quantity': 1})
+        assert response.status_code == 200, response.json
+    return time.perf_counter() - started, db.total_calls()
+
+
+def run_batch(count, latency):
+    db, stocks, headers = setup(latency)
+    client = trading_app.app.test_client()
+    batch_size = trading_app.ORDER_BATCH_MAX
+    started = time.perf_counter()
+    for offset in range(0, count, batch_size):
+        orders = [{'stock_id': stocks[i % len(stocks)]['id'], 'type': 'buy', 'quantity': 1}
+                  for i in range(offset, min(count, offset + batch_size))]
+        response = client.post('/api/orders/batch', headers=headers, json={'orders': orders})
+        assert response.status_code == 200, response.json
+    return time.perf_counter() - started, db.total_calls()
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    latency_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 5
+    print(f"{count} orders, {latency_ms} ms simulated latency per DB call, batch size {trading_app.ORDER_BATCH_MAX}")
+    print(f"{'path':<8} {'total s':>8} {'ms/order':>9} {'DB calls':>9} {'calls/order':>12}")
+    for name, fn in (('single', run_single), ('batch', run_batch)):
+        elapsed, calls = fn(count, latency_ms / 1000)
+        print(f"{name:<8} {elapsed:>8.2f} {elapsed / count * 1000:>9.3f} {calls:>9} {calls / count:>12.3f}")
+    if os.path.exists(os.environ['PRICE_JOURNAL_PATH']):
+        os.remove(os.environ['PRICE_JOURNAL_PATH'])
+
+
+if __name__ == '__main__':
+    main()
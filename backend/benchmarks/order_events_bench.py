@@ -0,0 +1,82 @@
+"""
+Benchmark: publish-to-delivery latency of the order event hub.
+
+Opens one stream for each of --streams users, with the hub holding
+channels for --users users in total, and publishes fills to random users
+from one thread while the stream threads consume them. Reports how long a
+publish takes and how long an event takes to reach its stream.
+    python benchmarks/order_events_bench.py [--users 100000] [--streams 200] [--events 20000]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from order_events import OrderEventHub
+
+
+def percentile(values, q):
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=100_000)
+    parser.add_argument('--streams', type=int, default=200)
+    parser.add_argument('--events', type=int, default=20_000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    hub = OrderEventHub(max_channels=args.users * 2)
+    users = [f'user-{n}' for n in range(args.users)]
+    for user_id in users:
+        hub.publish(user_id, 'order', {'sent': 0})
+    listening = users[:args.streams]
+    latencies = []
+    done = threading.Event()
+
+    def consume(user_id):
+        with hub.subscribe(user_id) as subscription:
+            for line in subscription.events(heartbeat=0.2):
+                if done.is_set():
+                    return
+                if line.startswith('id:'):
+                    sent = float(line.rsplit('"sent":', 1)[1].rstrip('}\n'))
+                    latencies.append(time.perf_counter() - sent)
+
+    threads = [threading.Thread(target=consume, args=(user_id,), daemon=True) for user_id in listening]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.5)
+
+    publish_times = []
+    for _ in range(args.events):
+        user_id = listening[rng.randrange(len(listening))] if rng.random() < 0.5 else users[rng.randrange(len(users))]
+        started = time.perf_counter()
+        hub.publish(user_id, 'order', {'sent': started})
+        publish_times.append(time.perf_counter() - started)
+        time.sleep(0.0001)
+    time.sleep(0.5)
+    done.set()
+    for thread in threads:
+        thread.join()
+
+    publish_times.sort()
+    latencies.sort()
+    print(f"{args.users:,} users, {args.streams} open streams, {args.events:,} events "
+          f"({len(latencies):,} to open streams)")
+    print(f"\n{'':<10} {'p50 us':>8} {'p99 us':>8} {'max us':>8}")
+    for name, values in (('publish', publish_times), ('delivery', latencies)):
+        print(f"{name:<10} {statistics.median(values) * 1e6:>8.0f} {percentile(values, 0.99) * 1e6:>8.0f} "
+              f"{values[-1] * 1e6:>8.0f}")
+    print(f"\n{hub.stats()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+Benchmark: database writes per minute for price ticks, direct vs. price store.
+
+Run from the backend directory:
+    python benchmarks/price_journal_bench.py [flush_interval_seconds]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from price_store import PriceStore
+from records import Stock, decode
+
+TICK_INTERVAL = 30      # update_stock_prices period in seconds
+SIMULATED_MINUTES = 10
+SYMBOL_COUNTS = [10, 100, 1000, 10000]
+
+
+def simulate(symbols, flush_interval, journal_path):
+    writes = []
+    store = PriceStore(lambda batch: writes.append(len(batch)), journal_path, flush_interval)
+    store.recover()
+    rng = random.Random(42)
+    stocks = [{'id': f'stock-{i}', 'current_price': f'{rng.uniform(5, 3000):.2f}', 'price_change': 0}
+              for i in range(symbols)]
+    store.seed(decode(Stock, stocks))
+
+    direct_writes = 0
+    started = time.perf_counter()
+    for second in range(0, SIMULATED_MINUTES * 60):
+        if second % TICK_INTERVAL == 0:
+            for stock in stocks:
+                price = store.get(stock['id'])
+                new_price = price + round(price * rng.uniform(-0.005, 0.005))
+                store.set(stock['id'], new_price, round((new_price - price) * 10000 / price))
+                direct_writes += 1  # the old loop wrote every symbol on every tick
+        if second and second % flush_interval == 0:
+            store.flush()
+    store.flush()
+    elapsed = time.perf_counter() - started
+    return direct_writes / SIMULATED_MINUTES, sum(writes) / SIMULATED_MINUTES, \
+        len(writes) / SIMULATED_MINUTES, elapsed
+
+
+def main():
+    flush_interval = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+    print(f"tick every {TICK_INTERVAL}s, flush every {flush_interval}s, {SIMULATED_MINUTES} simulated minutes")
+    print(f"{'symbols':>8} {'direct rows/min':>16} {'store rows/min':>15} {'batches/min':>12} {'cpu ms':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for symbols in SYMBOL_COUNTS:
+            journal_path = os.path.join(tmp, f'ticks-{symbols}.journal')
+            direct, stored, batches, elapsed = simulate(symbols, flush_interval, journal_path)
+            print(f"{symbols:>8} {direct:>16.0f} {stored:>15.0f} {batches:>12.1f} {elapsed * 1000:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+Benchmark: time per tick of the price models, and the statistics they produce.
+
+Times one tick for every stock at several universe sizes, with NumPy when
+it is installed and in plain Python, then simulates a few hundred stocks
+in a handful of sectors and reports the realised per-tick volatility and
+the average return correlation within and across sectors, and checks that
+a seed reproduces the same path.
+    python benchmarks/price_model_bench.py [--sizes 100,1000,10000] [--ticks 1000]
+"""
+import argparse
+import math
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import price_model
+from price_model import FactorPriceModel, UniformPriceModel
+
+
+def universe(size, sectors=10):
+    prices = {f'stock-{n:05d}': 10_000 + (n * 7919) % 500_000 for n in range(size)}
+    return prices, {stock_id: f'sector-{n % sectors}' for n, stock_id in enumerate(prices)}
+
+
+def time_ticks(model, prices, sectors, repeat):
+    model.step(prices, sectors)
+    started = time.perf_counter()
+    for _ in range(repeat):
+        prices = model.step(prices, sectors)
+    return (time.perf_counter() - started) / repeat
+
+
+def correlation(xs, ys):
+    mean_x, mean_y = statistics.fmean(xs), statistics.fmean(ys)
+    cov = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys))
+    return cov / math.sqrt(sum((x - mean_x) ** 2 for x in xs) * sum((y - mean_y) ** 2 for y in ys))
+
+
+def simulate(model, prices, sectors, ticks):
+    path = [prices]
+    for _ in range(ticks):
+        path.append(model.step(path[-1], sectors))
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='100,1000,10000')
+    parser.add_argument('--ticks', type=int, default=1000)
+    parser.add_argument('--stocks', type=int, default=60)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    backends = [('python', False)] + ([('numpy', True)] if price_model.np is not None else [])
+    print(f"ms per tick{'' if price_model.np is not None else ' (NumPy not installed)'}")
+    print(f"{'stocks':>8} {'uniform':>9} " + ' '.join(f"{'correlated ' + name:>18}" for name, _ in backends))
+    for size in (int(size) for size in args.sizes.split(',')):
+        prices, sectors = universe(size)
+        repeat = max(3, 20_000 // size)
+        row = [time_ticks(UniformPriceModel(seed=args.seed), prices, sectors, repeat)]
+        row += [time_ticks(FactorPriceModel(seed=args.seed, use_numpy=use_numpy), prices, sectors, repeat)
+                for _, use_numpy in backends]
+        print(f"{size:>8,} {row[0] * 1000:>9.2f} " + ' '.join(f"{value * 1000:>18.2f}" for value in row[1:]))
+
+    prices, sectors = universe(args.stocks, sectors=4)
+    for name, use_numpy in backends:
+        model = FactorPriceModel(seed=args.seed, use_numpy=use_numpy)
+        path = simulate(model, prices, sectors, args.ticks)
+        replay = simulate(FactorPriceModel(seed=args.seed, use_numpy=use_numpy), prices, sectors, args.ticks)
+        returns = {stock_id: [math.log(path[t + 1][stock_id] / path[t][stock_id]) for t in range(args.ticks)]
+                   for stock_id in prices}
+        ids = sorted(prices)
+        same, across = [], []
+        for i, first in enumerate(ids):
+            for second in ids[i + 1:]:
+                (same if sectors[first] == sectors[second] else across).append(
+                    correlation(returns[first], returns[second]))
+        volatility = statistics.fmean(statistics.pstdev(series) for series in returns.values())
+        print(f"\n{name}: {args.stocks} stocks in 4 sectors, {args.ticks} ticks, "
+              f"volatility {model.volatility}, sector correlation {model.sector_correlation}, "
+              f"market correlation {model.market_correlation}")
+        print(f"  realised volatility per tick: {volatility:.5f}")
+        print(f"  mean correlation within sectors: {statistics.fmean(same):.3f} "
+              f"(expected {model.sector_correlation:.3f})")
+        print(f"  mean correlation across sectors: {statistics.fmean(across):.3f} "
+              f"(expected {model.sector_correlation * model.market_correlation:.3f})")
+        print(f"  same seed, same path: {'yes' if path == replay else 'NO'}")
+
+
+if __name__ == '__main__':
+    main()
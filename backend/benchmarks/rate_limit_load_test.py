@@ -0,0 +1,142 @@
+"""
+Load test: does the API stay responsive for ordinary users while a few
+clients hammer it?
+
+Drives the real Flask routes against the in-memory Supabase stand-in. The
+database gets a fixed number of concurrent connections (the Supabase
+quota) and a simulated round trip per call. Abusive clients post orders
+and fetch the unauthenticated leaderboard in tight loops; regular users
+place an order or read their profile every half second. The run is
+repeated with the rate limiter off and with the default limits.
+    python benchmarks/rate_limit_load_test.py [seconds] [abusive clients]
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(BENCH_DIR, '..'), BENCH_DIR]
+
+os.environ.setdefault('SUPABASE_URL', 'http://localhost:54321')
+os.environ.setdefault('SUPABASE_KEY', 'bench.bench.bench')
+os.environ['START_BACKGROUND_ENGINES'] = 'false'
+os.environ['LOG_LEVEL'] = 'CRITICAL'
+os.environ['PRICE_JOURNAL_PATH'] = os.path.join(BENCH_DIR, '.bench_price_ticks.journal')
+os.environ['TRADE_LOG_DIR'] = ''    # not measured here
+
+import jwt
+
+import app as trading_app
+from memory_supabase import MemorySupabase, attach
+from rate_limit import MemoryBucketStore, RateLimiter, parse_rules
+
+DB_CONNECTIONS = 4
+DB_LATENCY = 0.005
+REGULAR_USERS = 20
+REGULAR_INTERVAL = 0.5
+
+
+class QuotaSupabase(MemorySupabase):
+    """In-memory store that serves at most DB_CONNECTIONS calls at a time"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.connections = threading.BoundedSemaphore(DB_CONNECTIONS)
+
+    def record(self, table, op):
+        with self.connections:
+            super().record(table, op)
+
+
+def setup(abusers):
+    db = QuotaSupabase(latency=DB_LATENCY)
+    attach(trading_app, db)
+    stocks = [db.add_stock(f'SYM{i}', 100 + i) for i in range(20)]
+    headers = []
+    for i in range(REGULAR_USERS + abusers):
+        user = db.add_user(f'user{i}@example.com', 10_000_000)
+        token = jwt.encode({'user_id': user['user_id'], 'email': user['email'], 'role': 'user'},
+                           trading_app.JWT_SECRET, algorithm='HS256')
+        headers.append({'Authorization': f'Bearer {token}'})
+    return db, stocks, headers[:REGULAR_USERS], headers[REGULAR_USERS:]
+
+
+def percentile(samples, q):
+    samples = sorted(samples)
+    return samples[int(q * (len(samples) - 1))] if samples else 0.0
+
+
+def run(seconds, abusers, limits):
+    db, stocks, regular, abusive = setup(abusers)
+    trading_app.rate_limiter = RateLimiter(parse_rules(*limits), MemoryBucketStore())
+    stop = threading.Event()
+    latencies, regular_statuses, abusive_statuses = [], Counter(), Counter()
+    lock = threading.Lock()
+
+    def regular_user(n, headers):
+        client = trading_app.app.test_client()
+        i = 0
+        while not stop.is_set():
+            started = time.perf_counter()
+            if i % 2 == 0:
+                response = client.post('/api/orders', headers=headers, json={
+                    'stock_id': stocks[(n + i) % len(stocks)]['id'], 'type': 'buy', 'quantity': 1})
+            else:
+                response = client.get('/api/portfolio/profile', headers=headers)
+            with lock:
+                latencies.append(time.perf_counter() - started)
+                regular_statuses[response.status_code] += 1
+            i += 1
+            stop.wait(REGULAR_INTERVAL)
+
+    def abusive_client(n, headers):
+        client = trading_app.app.test_client()
+        i = 0
+        while not stop.is_set():
+            if i % 2 == 0:
+                response = client.post('/api/orders', headers=headers, json={
+                    'stock_id': stocks[i % len(stocks)]['id'], 'type': 'buy', 'quantity': 1})
+            else:
+                response = client.get('/api/leaderboard')
+            with lock:
+                abusive_statuses[response.status_code] += 1
+            i += 1
+
+    threads = [threading.Thread(target=regular_user, args=(n, headers)) for n, headers in enumerate(regular)]
+    threads += [threading.Thread(target=abusive_client, args=(n, headers)) for n, headers in enumerate(abusive)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return latencies, regular_statuses, abusive_statuses, db.total_calls(), trading_app.rate_limiter.stats()
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 10
+    abusers = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    default_limits = (os.getenv('RATE_LIMITS', 'place_order=5/s:10,place_order_batch=1/s:3,buy_stock=2/s:5,'
+                                               'sell_stock=2/s:5,get_leaderboard=30/m:10'),
+                      os.getenv('ROUTE_CONCURRENCY', 'get_leaderboard=4,export_orders=4,export_all_orders=2,order_events_stream=64,register_users_bulk=1'))
+    print(f"{seconds:.0f}s per run: {REGULAR_USERS} regular users every {REGULAR_INTERVAL}s, {abusers} abusive "
+          f"clients in tight loops; DB: {DB_CONNECTIONS} connections, {DB_LATENCY * 1000:.0f} ms per call")
+    print(f"\n{'limiter':<8} {'regular p50':>12} {'p99 ms':>8} {'ok':>7} {'abusive req':>12} {'429':>7} "
+          f"{'503':>6} {'DB calls/s':>11}")
+    for name, limits in (('off', ('', '')), ('on', default_limits)):
+        latencies, regular, abusive, calls, stats = run(seconds, abusers, limits)
+        ok = regular[200] / max(1, sum(regular.values()))
+        print(f"{name:<8} {percentile(latencies, 0.5) * 1000:>12.1f} {percentile(latencies, 0.99) * 1000:>8.1f} "
+              f"{ok:>7.1%} {sum(abusive.values()):>12} {abusive[429]:>7} {abusive[503]:>6} {calls / seconds:>11.0f}")
+    print("\nlimiter counters (on):")
+    for endpoint, counters in stats['routes'].items():
+        print(f"  {endpoint:<18} allowed {counters['allowed']:>6}  limited {counters['limited']:>6}  "
+              f"shed {counters['shed']:>5}")
+    if os.path.exists(os.environ['PRICE_JOURNAL_PATH']):
+        os.remove(os.environ['PRICE_JOURNAL_PATH'])
+
+
+if __name__ == '__main__':
+    main()
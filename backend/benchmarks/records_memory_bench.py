@@ -0,0 +1,121 @@
+"""
+Benchmark: memory held by in-flight orders as PostgREST rows versus records.
+
+Builds pages of pending orders the way PostgREST returns them (parsed
+JSON, so every id, enum and price is its own string object), then
+measures with tracemalloc what the rows cost against the same orders
+decoded to Order records with the narrow projection. Also times the
+decode and loading the records into the OrderBook.
+    python benchmarks/records_memory_bench.py [--orders 1000000] [--users 20000] [--stocks 500]
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from order_book import OrderBook
+from records import Order, decode
+
+# What all_pending_orders selected before it had a projection
+FULL_ROW_EXTRAS = {'executed_price': None, 'executed_at': None, 'error': None}
+
+
+def fake_pages(args, rng, full_rows):
+    users = [str(uuid.UUID(int=rng.getrandbits(128))) for _ in range(args.users)]
+    stocks = [str(uuid.UUID(int=rng.getrandbits(128))) for _ in range(args.stocks)]
+    for start in range(0, args.orders, args.page_size):
+        page = []
+        for n in range(start, min(start + args.page_size, args.orders)):
+            row = {
+                'id': str(uuid.UUID(int=rng.getrandbits(128))),
+                'user_id': rng.choice(users),
+                'stock_id': rng.choice(stocks),
+                'type': rng.choice(('buy', 'sell')),
+                'quantity': rng.randint(1, 500),
+                'price': f"{rng.randint(1000, 500000) / 100:.2f}",
+                'status': 'pending',
+                'time_in_force': rng.choice(('GTC', 'DAY', 'GTD')),
+                'expires_at': '2026-10-19T15:30:00+00:00',
+                'created_at': f'2026-10-19T09:{n // 60000 % 60:02d}:{n // 1000 % 60:02d}.{n % 1000:03d}000+00:00'
+            }
+            if full_rows:
+                row.update(FULL_ROW_EXTRAS)
+            # Round-trip through JSON so strings are not shared, as off the wire
+            page.append(json.dumps(row))
+        yield json.loads('[' + ', '.join(page) + ']')
+
+
+def measure(build):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    started = time.perf_counter()
+    held = build()
+    elapsed = time.perf_counter() - started
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return held, used, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--orders', type=int, default=1_000_000)
+    parser.add_argument('--users', type=int, default=20_000)
+    parser.add_argument('--stocks', type=int, default=500)
+    parser.add_argument('--page-size', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    def rows(full_rows):
+        rng = random.Random(args.seed)
+        held = []
+        for page in fake_pages(args, rng, full_rows):
+            held.extend(page)
+        return held
+
+    def records():
+        # Each page is decoded and dropped, as all_pending_orders does
+        rng = random.Random(args.seed)
+        held = []
+        for page in fake_pages(args, rng, False):
+            held.extend(decode(Order, page))
+        return held
+
+    full, full_bytes, _ = measure(lambda: rows(True))
+    del full
+    narrow, narrow_bytes, _ = measure(lambda: rows(False))
+    decoded, record_bytes, _ = measure(records)
+
+    started = time.perf_counter()
+    check = decode(Order, narrow)
+    decode_time = time.perf_counter() - started
+    for row, order in zip(narrow, check):
+        assert order.id == row['id'] and order.quantity == row['quantity']
+        assert order.price == int(row['price'].replace('.', '')), (order.price, row['price'])
+    del check, narrow
+
+    book = OrderBook()
+    started = time.perf_counter()
+    book.rebuild(decoded)
+    load_time = time.perf_counter() - started
+    assert sum(sum(volume) for volume in book.all_volumes().values()) == sum(o.quantity for o in decoded)
+
+    print(f"{args.orders:,} pending orders, {args.users:,} users, {args.stocks:,} stocks")
+    print(f"full rows:        {full_bytes / 2**20:8.1f} MiB  {full_bytes / args.orders:6.0f} B/order")
+    print(f"projected rows:   {narrow_bytes / 2**20:8.1f} MiB  {narrow_bytes / args.orders:6.0f} B/order")
+    print(f"Order records:    {record_bytes / 2**20:8.1f} MiB  {record_bytes / args.orders:6.0f} B/order "
+          f"({full_bytes / record_bytes:.1f}x smaller than full rows)")
+    print(f"decode: {decode_time / args.orders * 1e6:.2f} us/order; "
+          f"order book load: {load_time / args.orders * 1e6:.2f} us/order")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,234 @@
+"""
+Benchmark: matching throughput with the stocks sharded over 1, 2, 4...
+matcher processes on one machine.
+
+Each node is a separate process running app.py with MATCHER_SHARDING on,
+its own in-memory database (same market in every node) with a simulated
+round trip per call, and a heartbeat in a shared shard directory. The
+parent routes a fixed order stream to the owning nodes through the spool
+queue, the way place_order does, and each node settles its orders with
+app.match_stock. Reports orders settled per second for each shard count
+and checks that every order was settled exactly once.
+
+With --churn one node leaves halfway through its share at the largest
+shard count; its queued orders must be handed to the remaining nodes.
+    python benchmarks/shard_matching_bench.py [--shards 1,2,4] [--orders N] [--churn]
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from records import Order, Stock, decode
+from sharding import HashRing, ShardMembership, SpoolShardQueue
+
+SHARD_TTL = 2.0
+STARTING_SHARES = 10_000
+
+
+def market(seed, users, symbols):
+    """The same stocks, users and holdings in every node"""
+    rng = random.Random(f'market-{seed}')
+    stocks = [(f'SYM{i}', str(uuid.UUID(int=rng.getrandbits(128))), round(rng.uniform(50, 3000), 2))
+              for i in range(symbols)]
+    user_ids = [str(uuid.UUID(int=rng.getrandbits(128))) for _ in range(users)]
+    return stocks, user_ids
+
+
+def order_stream(seed, stocks, user_ids, count):
+    rng = random.Random(f'orders-{seed}')
+    orders = []
+    for n in range(count):
+        symbol, stock_id, price = rng.choice(stocks)
+        orders.append({
+            'id': str(uuid.UUID(int=rng.getrandbits(128))),
+            'user_id': rng.choice(user_ids),
+            'stock_id': stock_id,
+            'type': rng.choice(('buy', 'sell')),
+            'quantity': rng.randrange(1, 10),
+            'price': f'{price:.2f}',
+            'status': 'pending',
+            'created_at': f'2024-01-01T09:15:00.{n:06d}'
+        })
+    return orders
+
+
+def node(node_id, shard_dir, args, nodes, settled, ready, stop, leave_after, results):
+    scratch = os.path.join(shard_dir, 'scratch', node_id)
+    os.makedirs(scratch)
+    os.environ.update({
+        'SUPABASE_URL': 'http://localhost:54321',
+        'SUPABASE_KEY': 'bench.bench.bench',
+        'START_BACKGROUND_ENGINES': 'false',
+        'LOG_LEVEL': 'WARNING',
+        'LOG_ASYNC': 'false',
+        'MATCHER_SHARDING': 'true',
+        'MATCHER_NODE_ID': node_id,
+        'MATCHER_SHARD_DIR': shard_dir,
+        'MATCHER_SHARD_TTL': str(SHARD_TTL),
+        'PRICE_JOURNAL_PATH': os.path.join(scratch, 'price_ticks.journal'),
+        'TRADE_LOG_DIR': os.path.join(scratch, 'trade_log'),
+        'ENGINE_CHECKPOINT_PATH': os.path.join(scratch, 'engine_checkpoint.json')
+    })
+    import app as trading_app
+    from memory_supabase import MemorySupabase, attach
+
+    db = MemorySupabase(latency=args.latency_ms / 1000)
+    attach(trading_app, db)
+    stocks, user_ids = market(args.seed, args.users, args.symbols)
+    stock_rows = {stock_id: db.add_stock(symbol, price, stock_id=stock_id) for symbol, stock_id, price in stocks}
+    for user_id in user_ids:
+        db.add_user(f'{user_id}@bench.local', 10_000_000, user_id=user_id)
+        for stock_id in stock_rows:
+            db.add_holding(user_id, stock_id, STARTING_SHARES)
+    membership = trading_app.shard_membership
+    shard_queue = trading_app.shard_queue
+
+    # Join and wait until every node sees the full ring and the handoff is over
+    while True:
+        membership.heartbeat()
+        status = membership.status()
+        if len(status['nodes']) == nodes and time.time() - status['changed_at'] >= status['handoff_delay']:
+            break
+        time.sleep(0.1)
+    beating = threading.Event()
+
+    def heartbeat():
+        while not beating.wait(SHARD_TTL / 3):
+            membership.heartbeat()
+
+    threading.Thread(target=heartbeat, daemon=True).start()
+    with ready.get_lock():
+        ready.value += 1
+
+    processed, filled, left = [], 0, False
+    db.calls.clear()
+    while not stop.is_set():
+        if leave_after and len(processed) >= leave_after:
+            beating.set()
+            membership.leave(shard_queue)
+            left = True
+            break
+        orders = shard_queue.drain(node_id, limit=200)
+        if not orders:
+            time.sleep(0.002)
+            continue
+        by_stock = defaultdict(list)
+        for order in orders:
+            by_stock[order['stock_id']].append(order)
+        for stock_id, stock_orders in by_stock.items():
+            if not trading_app.owns_stock(stock_id):
+                # Moved away, or gained and still in the handoff delay
+                for order in stock_orders:
+                    shard_queue.put(membership.owner(stock_id) or node_id, order)
+                time.sleep(0.01)
+                continue
+            for order in stock_orders:
+                db.add_order(dict(order))
+            filled += trading_app.match_stock(stock_id, trading_app.stock_price(Stock.from_row(stock_rows[stock_id])),
+                                              decode(Order, stock_orders))
+            processed.extend(order['id'] for order in stock_orders)
+            with settled.get_lock():
+                settled.value += len(stock_orders)
+    beating.set()
+    results.put({'node': node_id, 'processed': processed, 'filled': filled,
+                 'db_calls': db.total_calls(), 'left': left})
+
+
+def run(args, shards, orders, churn=False):
+    shard_dir = tempfile.mkdtemp(prefix='shard-bench-')
+    context = multiprocessing.get_context('spawn')
+    settled, ready = context.Value('i', 0), context.Value('i', 0)
+    stop, results = context.Event(), context.Queue()
+    node_ids = [f'node-{i}' for i in range(shards)]
+    share = len(orders) // shards
+    processes = [
+        context.Process(target=node, args=(node_id, shard_dir, args, shards, settled, ready, stop,
+                                           share // 2 if churn and i == shards - 1 else 0, results))
+        for i, node_id in enumerate(node_ids)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        while ready.value < shards:
+            time.sleep(0.05)
+        router = ShardMembership(shard_dir, 'router', ttl=SHARD_TTL)
+        shard_queue = SpoolShardQueue(os.path.join(shard_dir, 'queues'))
+        started = time.perf_counter()
+        for order in orders:
+            shard_queue.put(router.owner(order['stock_id']), order)
+        routed = time.perf_counter() - started
+        deadline = time.time() + args.timeout
+        while settled.value < len(orders) and time.time() < deadline:
+            time.sleep(0.01)
+        elapsed = time.perf_counter() - started
+        stop.set()
+        reports = [results.get(timeout=60) for _ in processes]
+    finally:
+        stop.set()
+        for process in processes:
+            process.join(timeout=30)
+        shutil.rmtree(shard_dir, ignore_errors=True)
+    return elapsed, routed, reports
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--shards', default='1,2,4')
+    parser.add_argument('--orders', type=int, default=1500)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--symbols', type=int, default=256)
+    parser.add_argument('--latency-ms', type=float, default=2.0, help='simulated round trip per DB call')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--timeout', type=float, default=600)
+    parser.add_argument('--churn', action='store_true', help='one node leaves mid-run at the largest shard count')
+    args = parser.parse_args()
+
+    stocks, user_ids = market(args.seed, args.users, args.symbols)
+    orders = order_stream(args.seed, stocks, user_ids, args.orders)
+    counts = [int(n) for n in args.shards.split(',')]
+    print(f"{len(orders)} orders on {args.symbols} symbols, {args.latency_ms} ms per DB call, "
+          f"{os.cpu_count()} CPU(s)")
+    print(f"\n{'nodes':>5} {'orders/s':>10} {'speedup':>8} {'routing ms':>11} {'filled':>7} "
+          f"{'DB calls':>9}  orders per node")
+
+    runs = [(shards, False) for shards in counts]
+    if args.churn:
+        runs.append((counts[-1], True))
+    baseline = None
+    for shards, churn in runs:
+        elapsed, routed, reports = run(args, shards, orders, churn)
+        processed = Counter(order_id for report in reports for order_id in report['processed'])
+        missing = len({order['id'] for order in orders} - set(processed))
+        duplicates = sum(1 for count in processed.values() if count > 1)
+        throughput = sum(processed.values()) / elapsed
+        baseline = baseline or throughput
+        per_node = ', '.join(f"{report['node']}{' (left)' if report['left'] else ''}: {len(report['processed'])}"
+                             for report in sorted(reports, key=lambda report: report['node']))
+        label = f'{shards}*' if churn else str(shards)
+        print(f"{label:>5} {throughput:>10.1f} {throughput / baseline:>7.2f}x {routed * 1000:>11.1f} "
+              f"{sum(report['filled'] for report in reports):>7} {sum(report['db_calls'] for report in reports):>9}"
+              f"  {per_node}")
+        if missing or duplicates:
+            print(f"      {missing} orders never settled, {duplicates} settled more than once")
+
+    ring = HashRing([f'node-{i}' for i in range(counts[-1])])
+    spread = Counter(ring.owner(stock_id) for _, stock_id, _ in stocks)
+    print(f"\nsymbols per node with {counts[-1]} nodes: {dict(sorted(spread.items()))}")
+    if args.churn:
+        print("* one node left halfway through its share")
+
+
+if __name__ == '__main__':
+    main()
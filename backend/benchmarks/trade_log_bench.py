@@ -0,0 +1,91 @@
+"""
+Benchmark: rebuilding balances and positions from the trade log.
+
+Appends a synthetic stream of fills, deposits and cancellations, then times
+a cold rebuild by replaying every event against one from the latest
+snapshot plus a short tail, and checks both land on the same state.
+    python benchmarks/trade_log_bench.py [--events 10000000] [--tail 10000]
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from trade_log import TradeLog
+
+
+def append_events(log, count, users, stocks, rng):
+    for user_id in users:
+        log.deposit(user_id, 1_000_000_00)
+    for n in range(count - len(users)):
+        roll = rng.random()
+        user_id = users[rng.randrange(len(users))]
+        if roll < 0.9:
+            log.fill(user_id, stocks[rng.randrange(len(stocks))], 'buy' if roll < 0.5 else 'sell',
+                     rng.randrange(1, 20), rng.randrange(5_000, 300_000), uuid.UUID(int=rng.getrandbits(128)))
+        elif roll < 0.98:
+            log.cancel(uuid.UUID(int=rng.getrandbits(128)), user_id)
+        else:
+            log.deposit(user_id, rng.randrange(100_00, 10_000_00))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--events', type=int, default=10_000_000)
+    parser.add_argument('--tail', type=int, default=10_000, help='events appended after the snapshot')
+    parser.add_argument('--users', type=int, default=10_000)
+    parser.add_argument('--stocks', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--dir', help='log directory to use (default: a temporary one)')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    users = [str(uuid.UUID(int=rng.getrandbits(128))) for _ in range(args.users)]
+    stocks = [str(uuid.UUID(int=rng.getrandbits(128))) for _ in range(args.stocks)]
+    directory = args.dir or tempfile.mkdtemp(prefix='trade-log-bench-')
+    try:
+        log = TradeLog(directory, snapshot_every=args.events * 2)
+        log.recover()
+        started = time.perf_counter()
+        append_events(log, args.events - args.tail, users, stocks, rng)
+        appended = time.perf_counter() - started
+        log.close()
+
+        full = TradeLog(directory)
+        started = time.perf_counter()
+        full.recover()
+        full_replay = time.perf_counter() - started
+        started = time.perf_counter()
+        full.snapshot()
+        snapshot = time.perf_counter() - started
+        append_events(full, args.tail, users[:100], stocks, rng)
+        expected = full.accounts()
+        full.close()
+
+        warm = TradeLog(directory)
+        started = time.perf_counter()
+        warm.recover()
+        warm_replay = time.perf_counter() - started
+        matches = warm.accounts() == expected
+        warm.close()
+
+        size = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+        print(f"{args.events:,} events, {args.users:,} users, {args.stocks} stocks, {size / 1e6:,.0f} MB on disk")
+        print(f"append: {(args.events - args.tail) / appended:,.0f} events/s")
+        print(f"\n{'rebuild':<28} {'seconds':>8} {'events replayed':>16}")
+        print(f"{'full replay':<28} {full_replay:>8.2f} {full.recovery['replayed']:>16,}")
+        print(f"{'snapshot + tail':<28} {warm_replay:>8.2f} {warm.recovery['replayed']:>16,}")
+        print(f"\nsnapshot write: {snapshot:.2f} s; same balances and positions: {'yes' if matches else 'NO'}")
+    finally:
+        if not args.dir:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""
+Virtual clock for running app.py's background engines faster than real time.
+
+Simulated threads run one at a time. When the running thread sleeps, the
+clock jumps straight to the earliest pending wake-up and hands control to
+that thread, so a two-minute matching wait costs no wall time and a run
+with the same seed replays the same interleaving.
+"""
+import heapq
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+
+class SimulationStopped(BaseException):
+    """
+    Raised in simulated threads once the clock passes its end time.
+    A BaseException so the engines' `except Exception` handlers let it through.
+    """
+
+
+class VirtualClock:
+    """
+    Drop-in for the time module (sleep, time, monotonic) shared by
+    cooperatively scheduled threads
+    """
+
+    def __init__(self, start, until):
+        self._now = start
+        self.until = until
+        self.stopped = False
+        self.errors = []        # (thread name, exception) for threads that died
+        self._cond = threading.Condition()
+        self._queue = []        # heap of [wake_at, seq, released]
+        self._seq = itertools.count()
+        self._threads = []
+
+    def time(self):
+        return self._now
+
+    monotonic = time
+
+    def __getattr__(self, name):
+        # Anything else the patched modules need comes from the real time module
+        return getattr(time, name)
+
+    def now(self, tz=None):
+        return datetime.fromtimestamp(self._now, tz)
+
+    def datetime_class(self):
+        """A datetime subclass whose now() and utcnow() read this clock"""
+        clock = self
+
+        class VirtualDatetime(datetime):
+            @classmethod
+            def now(cls, tz=None):
+                return datetime.fromtimestamp(clock._now, tz)
+
+            @classmethod
+            def utcnow(cls):
+                return datetime.fromtimestamp(clock._now, timezone.utc).replace(tzinfo=None)
+
+        return VirtualDatetime
+
+    def sleep(self, seconds):
+        with self._cond:
+            entry = self._schedule(self._now + max(0.0, seconds))
+            self._switch()
+            self._wait(entry)
+
+    def spawn(self, name, target, *args):
+        """Register a simulated thread; it first runs when run() starts the clock"""
+        with self._cond:
+            entry = self._schedule(self._now)
+
+        def run():
+            try:
+                with self._cond:
+                    self._wait(entry)
+                target(*args)
+            except SimulationStopped:
+                pass
+            except BaseException as e:
+                self.errors.append((name, e))
+            finally:
+                with self._cond:
+                    self._switch()
+
+        thread = threading.Thread(target=run, name=name, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def run(self):
+        """Run the simulated threads until they finish or the clock reaches its end"""
+        with self._cond:
+            self._switch()
+        for thread in self._threads:
+            thread.join()
+
+    def _schedule(self, wake_at):
+        entry = [wake_at, next(self._seq), False]
+        heapq.heappush(self._queue, entry)
+        return entry
+
+    def _wait(self, entry):
+        while not entry[2]:
+            self._cond.wait()
+        if self.stopped:
+            raise SimulationStopped()
+
+    def _switch(self):
+        # Hand control to the next thread due, advancing the clock to its wake-up
+        if not self._queue:
+            return
+        if self._queue[0][0] > self.until:
+            self.stopped = True
+            for entry in self._queue:
+                entry[2] = True
+            self._queue = []
+        else:
+            entry = heapq.heappop(self._queue)
+            self._now = max(self._now, entry[0])
+            entry[2] = True
+        self._cond.notify_all()
+
+
+@contextmanager
+def virtualized(clock, modules):
+    """Point each module's `time` and `datetime` globals at the clock"""
+    replacements = {'time': (time, clock), 'datetime': (datetime, clock.datetime_class())}
+    saved = []
+    for module in modules:
+        for name, (real, virtual) in replacements.items():
+            if getattr(module, name, None) is real:
+                saved.append((module, name, real))
+                setattr(module, name, virtual)
+    try:
+        yield clock
+    finally:
+        for module, name, value in saved:
+            setattr(module, name, value)
@@ -0,0 +1,358 @@
+import glob
+import json
+import logging
+import os
+import queue
+import select
+import socket
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# pg_notify rejects payloads of 8000 bytes or more; socket messages are held
+# to the same size so both backends split payloads the same way
+MAX_MESSAGE_BYTES = 7900
+
+
+class CacheBus:
+    """
+    Tells the other processes serving the app that cached data changed.
+    Messages carry a topic and a JSON payload; list payloads too large for
+    one message are split. publish() queues the message and returns, a
+    sender thread writes it. A process never receives its own messages:
+    writers update their own caches before publishing.
+
+    Handlers are called on the listener thread with the payload, or with
+    None when messages may have been lost (e.g. after a reconnect) and
+    everything cached under the topic should be treated as stale.
+
+    This base class has no transport: nothing is sent and caches must not
+    rely on it (coherent is False).
+    """
+
+    name = 'off'
+    coherent = False
+
+    def __init__(self):
+        self.origin = uuid.uuid4().hex[:12]
+        self._handlers = {}      # topic -> [handler]
+        self._outbox = queue.SimpleQueue()
+        self._threads = []
+        self._running = False
+        self.stats = {'published': 0, 'sent': 0, 'received': 0, 'resyncs': 0, 'errors': 0}
+
+    def subscribe(self, topic, handler):
+        self._handlers.setdefault(topic, []).append(handler)
+
+    def publish(self, topic, payload=None):
+        if not self.coherent:
+            return
+        self.stats['published'] += 1
+        self._outbox.put((topic, payload))
+
+    def start(self):
+        if not self.coherent or self._running:
+            return
+        self._running = True
+        for target, name in ((self._send_loop, 'cache-bus-send'), (self._listen_loop, 'cache-bus-listen')):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=2):
+        if not self._running:
+            return
+        self._running = False
+        self._outbox.put(None)
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _send_loop(self):
+        while True:
+            item = self._outbox.get()
+            batch = [item]
+            # Coalesce whatever queued up behind it into fewer messages
+            while True:
+                try:
+                    batch.append(self._outbox.get_nowait())
+                except queue.Empty:
+                    break
+            stopping = None in batch
+            for message in self._encode([item for item in batch if item is not None]):
+                try:
+                    self._send(message)
+                    self.stats['sent'] += 1
+                except Exception as e:
+                    self.stats['errors'] += 1
+                    logger.error("Cache bus send failed: %s", e)
+            if stopping:
+                return
+
+    def _encode(self, batch):
+        """Merge list payloads per topic and split them into messages that fit"""
+        merged = []
+        lists = {}
+        for topic, payload in batch:
+            if isinstance(payload, list):
+                if topic not in lists:
+                    lists[topic] = []
+                    merged.append((topic, lists[topic]))
+                lists[topic].extend(payload)
+            else:
+                merged.append((topic, payload))
+        messages = []
+        for topic, payload in merged:
+            self._split(topic, payload, messages)
+        return messages
+
+    def _split(self, topic, payload, messages):
+        message = json.dumps({'o': self.origin, 't': topic, 'd': payload}, separators=(',', ':'))
+        if len(message.encode()) <= MAX_MESSAGE_BYTES or not isinstance(payload, list) or len(payload) < 2:
+            messages.append(message)
+            return
+        half = len(payload) // 2
+        self._split(topic, payload[:half], messages)
+        self._split(topic, payload[half:], messages)
+
+    def _deliver(self, raw):
+        try:
+            message = json.loads(raw)
+        except ValueError:
+            logger.warning("Skipping malformed cache bus message")
+            return
+        if message.get('o') == self.origin:
+            return
+        self.stats['received'] += 1
+        self._dispatch(message.get('t'), message.get('d'))
+
+    def _dispatch(self, topic, payload):
+        for handler in self._handlers.get(topic, ()):
+            try:
+                handler(payload)
+            except Exception as e:
+                self.stats['errors'] += 1
+                logger.error("Cache bus handler for %s failed: %s", topic, e)
+
+    def _resync(self):
+        """Messages may have been missed: every topic is stale"""
+        self.stats['resyncs'] += 1
+        for topic in list(self._handlers):
+            self._dispatch(topic, None)
+
+    def _send(self, message):
+        pass
+
+    def _listen_loop(self):
+        pass
+
+
+class SocketCacheBus(CacheBus):
+    """
+    Bus between the processes on one machine, e.g. gunicorn workers: each
+    process binds a Unix datagram socket in a shared directory and a message
+    is sent to every socket there. Sockets left by dead processes are removed
+    by the first sender that finds nobody listening.
+    """
+
+    name = 'socket'
+    coherent = True
+
+    def __init__(self, directory, send_timeout=0.1):
+        super().__init__()
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f'{self.origin}.sock')
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sock.bind(self.path)
+        self._sock.settimeout(1)
+        self._out = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        # A peer whose queue stays full for this long loses the message
+        # rather than stalling the sender; its caches fall back on their ttl
+        self._out.settimeout(send_timeout)
+        self.stats['dropped'] = 0
+
+    def _send(self, message):
+        data = message.encode()
+        for path in glob.glob(os.path.join(self.directory, '*.sock')):
+            if path == self.path:
+                continue
+            try:
+                self._out.sendto(data, path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            except socket.timeout:
+                self.stats['dropped'] += 1
+
+    def _listen_loop(self):
+        while self._running:
+            try:
+                data = self._sock.recv(65536)
+            except socket.timeout:
+                continue
+            except OSError as e:
+                if self._running:
+                    logger.error("Cache bus socket failed: %s", e)
+                return
+            self._deliver(data.decode())
+
+    def stop(self, timeout=2):
+        super().stop(timeout)
+        self._sock.close()
+        self._out.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class PostgresCacheBus(CacheBus):
+    """
+    Bus between processes on any number of machines through Postgres
+    LISTEN/NOTIFY on DATABASE_URL. Needs a session connection: transaction
+    mode poolers (e.g. Supabase on port 6543) do not deliver notifications.
+    The listener reconnects with backoff and then resyncs every topic,
+    since notifications sent while it was away are gone.
+    """
+
+    name = 'postgres'
+    coherent = True
+
+    def __init__(self, database_url, channel='cache_bus'):
+        super().__init__()
+        # psycopg2 is optional and only needed for this backend
+        import psycopg2
+        import psycopg2.extensions
+
+        self._psycopg2 = psycopg2
+        self._database_url = database_url
+        self.channel = channel
+        self._sender = None
+        # Fail now rather than on the listener thread if the database is unreachable
+        self._listener = self._listen_connection()
+
+    def _connect(self):
+        conn = self._psycopg2.connect(self._database_url)
+        conn.set_isolation_level(self._psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        return conn
+
+    def _listen_connection(self):
+        conn = self._connect()
+        with conn.cursor() as cur:
+            cur.execute(f'LISTEN "{self.channel}"')
+        return conn
+
+    def _send(self, message):
+        for attempt in (1, 2):
+            try:
+                if self._sender is None or self._sender.closed:
+                    self._sender = self._connect()
+                with self._sender.cursor() as cur:
+                    cur.execute("SELECT pg_notify(%s, %s)", (self.channel, message))
+                return
+            except self._psycopg2.OperationalError:
+                # The connection dropped; reconnect once before giving up on the message
+                self._sender = None
+                if attempt == 2:
+                    raise
+
+    def _listen_loop(self):
+        backoff = 1
+        while self._running:
+            conn = self._listener
+            try:
+                if conn is None:
+                    conn = self._listener = self._listen_connection()
+                    logger.info("Cache bus reconnected to Postgres")
+                    self._resync()
+                if select.select([conn], [], [], 1)[0]:
+                    conn.poll()
+                    while conn.notifies:
+                        self._deliver(conn.notifies.pop(0).payload)
+                backoff = 1
+            except Exception as e:
+                self.stats['errors'] += 1
+                logger.error("Cache bus listener lost its connection, retrying in %ss: %s", backoff, e)
+                self._close(conn)
+                self._listener = None
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+        self._close(self._listener)
+
+    def _close(self, conn):
+        try:
+            if conn is not None:
+                conn.close()
+        except Exception:
+            pass
+
+    def stop(self, timeout=2):
+        super().stop(timeout)
+        self._close(self._sender)
+
+
+class TopicCache:
+    """
+    Values loaded from the database and kept until the bus says they
+    changed, with ttl seconds as a backstop against lost messages. A ttl
+    of 0 turns caching off, for processes without a coherent bus.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = {}      # key -> (value, loaded_at)
+        self._generation = 0    # bumped by every invalidation
+        self.stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def get(self, key, load):
+        if self.ttl <= 0:
+            return load()
+        entry = self._entries.get(key)
+        now = time.monotonic()
+        if entry is not None and now - entry[1] < self.ttl:
+            self.stats['hits'] += 1
+            return entry[0]
+        self.stats['misses'] += 1
+        generation = self._generation
+        value = load()
+        with self._lock:
+            # An invalidation that arrived while loading may postdate the value
+            if generation == self._generation:
+                self._entries[key] = (value, now)
+        return value
+
+    def invalidate(self, keys=None):
+        """Drop the given keys, or everything when keys is None"""
+        with self._lock:
+            self._generation += 1
+            self.stats['invalidations'] += 1
+            if keys is None:
+                self._entries.clear()
+            else:
+                for key in keys:
+                    self._entries.pop(key, None)
+
+
+def create_cache_bus(backend, database_url=None, directory='cache_bus', channel='cache_bus'):
+    """
+    Create the cache bus: 'socket' for processes on one machine, 'postgres'
+    for LISTEN/NOTIFY across machines (falling back to 'socket' when the
+    database is unavailable) or 'off'
+    """
+    if backend == 'off':
+        return CacheBus()
+    if backend == 'postgres':
+        if not database_url:
+            logger.warning("CACHE_BUS=postgres but DATABASE_URL is not set, using sockets")
+        else:
+            try:
+                return PostgresCacheBus(database_url, channel)
+            except Exception as e:
+                logger.error(f"Postgres cache bus unavailable, using sockets: {str(e)}")
+    return SocketCacheBus(directory)
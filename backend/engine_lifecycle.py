@@ -0,0 +1,246 @@
+import atexit
+import json
+import logging
+import os
+import signal
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+ENGINE_STOPPED = 'stopped'
+ENGINE_RUNNING = 'running'
+ENGINE_PAUSED = 'paused'
+ENGINE_STOPPING = 'stopping'
+
+
+class Engine:
+    __slots__ = ('name', 'target', 'args', 'state', 'thread', 'cycles', 'in_cycle',
+                 'last_cycle_at', 'last_cycle_seconds')
+
+    def __init__(self, name, target, args):
+        self.name = name
+        self.target = target
+        self.args = args
+        self.state = ENGINE_STOPPED
+        self.thread = None
+        self.cycles = 0
+        self.in_cycle = False
+        self.last_cycle_at = None
+        self.last_cycle_seconds = None
+
+
+class EngineLifecycle:
+    """
+    Starts, pauses and stops the background engines.
+    Engine loops ask running() before each cycle and use sleep() between
+    cycles, so pausing and stopping take effect between cycles: a stop lets
+    the cycle in flight finish (drain) instead of killing it mid-settlement.
+    Sleeps are taken in short ticks so a stop is noticed within one tick.
+    """
+
+    def __init__(self, checkpoint_path, tick=1.0):
+        self.checkpoint_path = checkpoint_path
+        self.tick = tick
+        self._lock = threading.Lock()
+        self._engines = {}          # name -> Engine, in registration order
+        self._shutdown_done = False
+
+    def register(self, name, target, *args):
+        self._engines[name] = Engine(name, target, args)
+
+    def start(self, names=None, spawn=None):
+        """
+        Start stopped engines (all by default) and resume paused ones.
+        spawn(name, target, *args) replaces thread creation, e.g. for simulations.
+        Returns the names that were started or resumed.
+        """
+        started = []
+        with self._lock:
+            for engine in self._select(names):
+                if engine.state == ENGINE_PAUSED:
+                    engine.state = ENGINE_RUNNING
+                    started.append(engine.name)
+                elif engine.state == ENGINE_STOPPED and not (engine.thread and engine.thread.is_alive()):
+                    engine.state = ENGINE_RUNNING
+                    if spawn is not None:
+                        spawn(engine.name, engine.target, *engine.args)
+                    else:
+                        engine.thread = threading.Thread(target=self._run, args=(engine,),
+                                                         name=engine.name, daemon=True)
+                        engine.thread.start()
+                    started.append(engine.name)
+        return started
+
+    def pause(self, names=None):
+        """Hold running engines before their next cycle"""
+        with self._lock:
+            paused = [engine for engine in self._select(names) if engine.state == ENGINE_RUNNING]
+            for engine in paused:
+                engine.state = ENGINE_PAUSED
+        return [engine.name for engine in paused]
+
+    def stop(self, names=None, timeout=30):
+        """
+        Ask engines to exit after their current cycle and wait up to timeout
+        seconds for them. Returns the names of engines still running.
+        """
+        with self._lock:
+            engines = [engine for engine in self._select(names)
+                       if engine.state in (ENGINE_RUNNING, ENGINE_PAUSED)]
+            for engine in engines:
+                engine.state = ENGINE_STOPPING
+        deadline = time.time() + timeout
+        for engine in engines:
+            if engine.thread is not None:
+                engine.thread.join(max(0.0, deadline - time.time()))
+        still_running = [engine.name for engine in engines if engine.thread and engine.thread.is_alive()]
+        with self._lock:
+            for engine in engines:
+                if engine.name not in still_running:
+                    engine.state = ENGINE_STOPPED
+        if still_running:
+            logger.error(f"Engines still running after {timeout}s drain: {', '.join(still_running)}")
+        return still_running
+
+    def running(self, name):
+        """
+        Called by an engine before each cycle: blocks while the engine is
+        paused and returns False once it should exit
+        """
+        engine = self._engines[name]
+        while engine.state == ENGINE_PAUSED:
+            time.sleep(self.tick)
+        return engine.state == ENGINE_RUNNING
+
+    def stopping(self, name):
+        return self._engines[name].state == ENGINE_STOPPING
+
+    def sleep(self, name, seconds):
+        """
+        Sleep between or inside cycles.
+        Returns False early if the engine is asked to stop.
+        """
+        engine = self._engines[name]
+        deadline = time.time() + seconds
+        while engine.state != ENGINE_STOPPING:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return True
+            time.sleep(min(self.tick, remaining))
+        return False
+
+    @contextmanager
+    def cycle(self, name):
+        """Mark one engine cycle as in flight"""
+        engine = self._engines[name]
+        engine.in_cycle = True
+        started = time.time()
+        try:
+            yield
+        finally:
+            engine.in_cycle = False
+            engine.cycles += 1
+            engine.last_cycle_at = started
+            engine.last_cycle_seconds = round(time.time() - started, 3)
+
+    def status(self):
+        return {
+            engine.name: {
+                'state': engine.state,
+                'alive': bool(engine.thread and engine.thread.is_alive()),
+                'in_cycle': engine.in_cycle,
+                'cycles': engine.cycles,
+                'last_cycle_at': engine.last_cycle_at,
+                'last_cycle_seconds': engine.last_cycle_seconds
+            }
+            for engine in self._engines.values()
+        }
+
+    def save_checkpoint(self, state):
+        """Atomically write a JSON checkpoint"""
+        state = dict(state, written_at=time.time())
+        directory = os.path.dirname(self.checkpoint_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = self.checkpoint_path + '.tmp'
+        with open(tmp_path, 'w') as checkpoint:
+            json.dump(state, checkpoint, separators=(',', ':'))
+            checkpoint.flush()
+            os.fsync(checkpoint.fileno())
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def load_checkpoint(self, max_age):
+        """
+        Read and remove the checkpoint left by the previous process.
+        Returns None when there is none or it is older than max_age seconds.
+        """
+        try:
+            with open(self.checkpoint_path, 'r') as checkpoint:
+                state = json.load(checkpoint)
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            logger.warning("Ignoring unreadable engine checkpoint")
+            state = None
+        # A checkpoint is only valid for the restart right after it was written
+        os.remove(self.checkpoint_path)
+        if state is None:
+            return None
+        age = time.time() - state.get('written_at', 0)
+        if age > max_age:
+            logger.info(f"Ignoring engine checkpoint written {age:.0f}s ago")
+            return None
+        return state
+
+    def on_shutdown(self, callback):
+        """
+        Run callback once when the process is told to stop (SIGTERM, SIGINT)
+        or exits, then hand the signal to the handler that was installed before
+        """
+        def shutdown():
+            with self._lock:
+                if self._shutdown_done:
+                    return
+                self._shutdown_done = True
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"Error during engine shutdown: {str(e)}")
+
+        def handle(signum, frame, previous):
+            shutdown()
+            if callable(previous):
+                previous(signum, frame)
+            elif previous == signal.SIG_DFL:
+                signal.signal(signum, signal.SIG_DFL)
+                os.kill(os.getpid(), signum)
+
+        atexit.register(shutdown)
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            try:
+                previous = signal.getsignal(signum)
+                signal.signal(signum, lambda s, f, previous=previous: handle(s, f, previous))
+            except ValueError:
+                # Signal handlers can only be installed from the main thread
+                logger.warning("Engine shutdown hooked to process exit only, not signals")
+                break
+
+    def _select(self, names):
+        if names is None:
+            return list(self._engines.values())
+        unknown = [name for name in names if name not in self._engines]
+        if unknown:
+            raise KeyError(f"Unknown engine: {', '.join(unknown)}")
+        return [self._engines[name] for name in names]
+
+    def _run(self, engine):
+        try:
+            engine.target(*engine.args)
+        except Exception as e:
+            logger.error(f"Engine {engine.name} crashed: {str(e)}")
+        finally:
+            with self._lock:
+                if engine.state != ENGINE_STOPPING:
+                    engine.state = ENGINE_STOPPED
@@ -0,0 +1,329 @@
+import io
+import logging
+import threading
+import weakref
+from contextlib import contextmanager
+
+from money import paise_str
+from records import Order, Stock, decode
+
+logger = logging.getLogger(__name__)
+
+EXPORT_ORDER_COLUMNS = ('id', 'user_id', 'stock_id', 'type', 'quantity', 'price', 'status',
+                        'created_at', 'executed_price', 'executed_at', 'error')
+
+
+class PostgrestEngineStore:
+    """
+    Data access for the background engines (matcher, price ticker and
+    order expiry) through PostgREST. Stocks and orders come back as
+    records; order exports stay rows, which are streamed as they are.
+    """
+
+    name = 'postgrest'
+
+    def __init__(self, client):
+        self.client = client
+
+    def fetch_stocks(self):
+        return decode(Stock, self.client.table('stocks').select(Stock.COLUMNS).execute().data)
+
+    def pending_orders(self, stock_id):
+        # Use rpc call to bypass RLS
+        return decode(Order, self.client.rpc('get_pending_orders', {
+            'stock_id_param': stock_id
+        }).execute().data)
+
+    def _keyset_pages(self, query, key, page_size):
+        """
+        Yield the rows of query() in pages ordered by (key, id). PostgREST
+        caps rows per request; each page continues after the last row of the
+        one before rather than at an offset, so rows leaving the result set
+        meanwhile (fills, cancels) cannot shift a page past a row.
+        """
+        last = None
+        tied = False    # the next rows may share the last row's key
+        while True:
+            if last is None:
+                page = query().order(f'{key},id').limit(page_size).execute().data
+            elif tied:
+                # Finish the rows sharing the last key, then move past it
+                page = query().eq(key, last[key]).gt('id', last['id']).order('id').limit(page_size).execute().data
+            else:
+                page = query().gt(key, last[key]).order(f'{key},id').limit(page_size).execute().data
+            if page:
+                yield page
+                last = page[-1]
+            if len(page) == page_size:
+                tied = True
+            elif tied:
+                tied = False
+            else:
+                return
+
+    def all_pending_orders(self, page_size=1000):
+        query = lambda: self.client.table('orders').select(Order.COLUMNS).eq('status', 'pending')
+        return [order for page in self._keyset_pages(query, 'created_at', page_size) for order in decode(Order, page)]
+
+    def pending_orders_since(self, since, page_size=1000):
+        # After a long pause or a restart from an old watermark there can be
+        # more than one response's worth
+        query = lambda: self.client.table('orders').select(Order.COLUMNS).eq('status', 'pending')\
+            .gte('created_at', since)
+        return [order for page in self._keyset_pages(query, 'created_at', page_size) for order in decode(Order, page)]
+
+    def recent_fills(self, stock_id, since):
+        """(type, quantity) of the stock's fills since a timestamp"""
+        rows = self.client.table('orders')\
+            .select('type, quantity')\
+            .eq('stock_id', stock_id)\
+            .eq('status', 'completed')\
+            .gt('executed_at', since)\
+            .execute().data
+        return [(row['type'], row['quantity']) for row in rows]
+
+    def write_prices(self, updates):
+        # Prices are paise and changes hundredths of a percent: both two implied decimals
+        for stock_id, price, price_change in updates:
+            self.client.rpc('update_stock_price', {
+                'stock_id_param': stock_id,
+                'new_price_param': paise_str(price),
+                'price_change_param': paise_str(price_change)
+            }).execute()
+
+    def expiring_orders(self, page_size=1000):
+        """Pending orders that have an expiry, for the expiry timing wheel"""
+        query = lambda: self.client.table('orders').select('id, user_id, time_in_force, expires_at')\
+            .eq('status', 'pending').not_.is_('expires_at', 'null')
+        return [order for page in self._keyset_pages(query, 'expires_at', page_size) for order in decode(Order, page)]
+
+    def cancel_orders(self, order_ids, error):
+        """
+        Cancel pending orders in bulk
+        Returns the ids that were actually cancelled
+        """
+        cancelled = []
+        # Chunk the id list to keep PostgREST URLs short
+        for i in range(0, len(order_ids), 200):
+            result = self.client.table('orders').update({
+                'status': 'cancelled',
+                'error': error
+            }).in_('id', order_ids[i:i + 200]).eq('status', 'pending').execute()
+            cancelled.extend(order['id'] for order in result.data)
+        return cancelled
+
+    def export_orders(self, user_id=None, status=None, page_size=1000):
+        """
+        Yield order rows oldest first, one page in memory at a time. Pages
+        are keyed on (created_at, id) rather than offsets, so each page is
+        an index range scan however deep the export goes.
+        """
+        def query():
+            q = self.client.table('orders').select(', '.join(EXPORT_ORDER_COLUMNS))
+            if user_id:
+                q = q.eq('user_id', user_id)
+            if status:
+                q = q.eq('status', status)
+            return q
+
+        for page in self._keyset_pages(query, 'created_at', page_size):
+            yield from page
+
+
+# Server-side prepared statements, created once per pooled connection
+PREPARED_STATEMENTS = {
+    'engine_fetch_stocks': (
+        "SELECT id::text, symbol, name, current_price, price_change, sector FROM stocks"
+    ),
+    'engine_pending_orders': (
+        "SELECT id::text, user_id::text, stock_id::text, type, quantity, price, status, time_in_force, "
+        "expires_at, created_at FROM orders WHERE status = 'pending' AND stock_id = $1::uuid ORDER BY created_at"
+    ),
+    'engine_all_pending_orders': (
+        "SELECT id::text, user_id::text, stock_id::text, type, quantity, price, status, time_in_force, "
+        "expires_at, created_at FROM orders WHERE status = 'pending' ORDER BY created_at"
+    ),
+    'engine_pending_orders_since': (
+        "SELECT id::text, user_id::text, stock_id::text, type, quantity, price, status, time_in_force, "
+        "expires_at, created_at FROM orders WHERE status = 'pending' AND created_at >= $1::timestamptz "
+        "ORDER BY created_at"
+    ),
+    'engine_recent_fills': (
+        "SELECT type, quantity FROM orders "
+        "WHERE stock_id = $1::uuid AND status = 'completed' AND executed_at > $2::timestamptz"
+    ),
+    'engine_expiring_orders': (
+        "SELECT id::text, user_id::text, time_in_force, expires_at FROM orders "
+        "WHERE status = 'pending' AND expires_at IS NOT NULL ORDER BY expires_at"
+    ),
+    'engine_cancel_orders': (
+        "UPDATE orders SET status = 'cancelled', error = $2 "
+        "WHERE id = ANY($1::text[]::uuid[]) AND status = 'pending' RETURNING id::text"
+    ),
+}
+
+
+class PostgresEngineStore:
+    """
+    Direct SQL data access for the background engines. Uses a pooled
+    psycopg2 connection with server-side prepared statements, NUMERIC
+    columns left as their exact text, and COPY for bulk price writes.
+    """
+
+    name = 'postgres'
+
+    def __init__(self, database_url, pool_size=4):
+        # psycopg2 is optional and only needed for this backend
+        import psycopg2
+        import psycopg2.extensions
+        from psycopg2.pool import ThreadedConnectionPool
+
+        self._psycopg2 = psycopg2
+        self._database_url = database_url
+        self._pool = ThreadedConnectionPool(1, pool_size, database_url)
+        # Connections with statements prepared; weak, so a connection the pool
+        # replaced is forgotten rather than mistaken for its successor
+        self._prepared = weakref.WeakSet()
+        self._lock = threading.Lock()
+        # Keep NUMERIC as text instead of building Decimal objects; the
+        # engines parse it straight to integer paise
+        self._numeric = psycopg2.extensions.new_type(
+            psycopg2.extensions.DECIMAL.values,
+            'ENGINE_NUMERIC',
+            lambda value, cursor: value
+        )
+
+    @contextmanager
+    def _connection(self):
+        conn = self._pool.getconn()
+        try:
+            if conn not in self._prepared:
+                self._prepare(conn)
+            yield conn
+            conn.commit()
+        except Exception:
+            # A broken connection cannot roll back; the pool discards it
+            if not conn.closed:
+                try:
+                    conn.rollback()
+                except Exception as e:
+                    logger.warning("Rollback failed: %s", e)
+            raise
+        finally:
+            self._pool.putconn(conn)
+
+    def _prepare(self, conn):
+        self._psycopg2.extensions.register_type(self._numeric, conn)
+        with conn.cursor() as cur:
+            for name, sql in PREPARED_STATEMENTS.items():
+                cur.execute(f"PREPARE {name} AS {sql}")
+        conn.commit()
+        with self._lock:
+            self._prepared.add(conn)
+
+    def _execute(self, statement, params=(), record=None):
+        """Run a prepared statement; rows come back as dicts, or as record instances"""
+        placeholders = ', '.join(['%s'] * len(params))
+        call = f"EXECUTE {statement}({placeholders})" if params else f"EXECUTE {statement}"
+        with self._connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(call, params)
+                columns = [column.name for column in cur.description]
+                rows = [dict(zip(columns, row)) for row in cur.fetchall()]
+        return decode(record, rows) if record is not None else rows
+
+    def fetch_stocks(self):
+        return self._execute('engine_fetch_stocks', record=Stock)
+
+    def pending_orders(self, stock_id):
+        return self._execute('engine_pending_orders', (stock_id,), Order)
+
+    def all_pending_orders(self):
+        return self._execute('engine_all_pending_orders', record=Order)
+
+    def pending_orders_since(self, since):
+        return self._execute('engine_pending_orders_since', (since,), Order)
+
+    def recent_fills(self, stock_id, since):
+        return [(row['type'], row['quantity']) for row in self._execute('engine_recent_fills', (stock_id, since))]
+
+    def write_prices(self, updates):
+        """
+        Write a batch of prices with COPY into a temporary table and one UPDATE
+        """
+        if not updates:
+            return
+        buffer = io.StringIO()
+        for stock_id, price, price_change in updates:
+            buffer.write(f"{stock_id}\t{paise_str(price)}\t{paise_str(price_change)}\n")
+        buffer.seek(0)
+        with self._connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "CREATE TEMP TABLE IF NOT EXISTS engine_price_ticks "
+                    "(stock_id uuid, current_price numeric(15, 2), price_change numeric(5, 2)) "
+                    "ON COMMIT DELETE ROWS"
+                )
+                cur.copy_expert(
+                    "COPY engine_price_ticks (stock_id, current_price, price_change) FROM STDIN",
+                    buffer
+                )
+                cur.execute(
+                    "UPDATE stocks SET current_price = t.current_price, price_change = t.price_change "
+                    "FROM engine_price_ticks t WHERE stocks.id = t.stock_id"
+                )
+
+    def expiring_orders(self):
+        return self._execute('engine_expiring_orders', record=Order)
+
+    def cancel_orders(self, order_ids, error):
+        if not order_ids:
+            return []
+        rows = self._execute('engine_cancel_orders', (list(order_ids), error))
+        return [row['id'] for row in rows]
+
+    def export_orders(self, user_id=None, status=None, page_size=1000):
+        """
+        Yield order rows oldest first from a server-side cursor, page_size
+        rows per round trip. Exports can outlive a client's patience, so they
+        get their own connection instead of holding one of the engines'.
+        """
+        conditions, params = [], []
+        if user_id:
+            conditions.append('user_id = %s::uuid')
+            params.append(user_id)
+        if status:
+            conditions.append('status = %s')
+            params.append(status)
+        where = f"WHERE {' AND '.join(conditions)} " if conditions else ''
+        conn = self._psycopg2.connect(self._database_url)
+        try:
+            self._psycopg2.extensions.register_type(self._numeric, conn)
+            with conn.cursor(name='order_export') as cur:
+                cur.itersize = page_size
+                cur.execute(
+                    "SELECT id::text, user_id::text, stock_id::text, type, quantity, price, status, "
+                    f"created_at, executed_price, executed_at, error FROM orders {where}"
+                    "ORDER BY created_at, id",
+                    params
+                )
+                for row in cur:
+                    yield dict(zip(EXPORT_ORDER_COLUMNS, row))
+        finally:
+            conn.close()
+
+
+def create_engine_store(backend, client, database_url=None, pool_size=4):
+    """
+    Create the engine data store for the configured backend, falling back
+    to PostgREST when the direct Postgres path is unavailable
+    """
+    if backend == 'postgres':
+        if not database_url:
+            logger.warning("ENGINE_DB_BACKEND=postgres but DATABASE_URL is not set, using PostgREST")
+        else:
+            try:
+                return PostgresEngineStore(database_url, pool_size)
+            except Exception as e:
+                logger.error(f"Direct Postgres engine store unavailable, using PostgREST: {str(e)}")
+    return PostgrestEngineStore(client)
@@ -0,0 +1,58 @@
+import csv
+import io
+from datetime import date, datetime
+from decimal import Decimal
+
+from json_response import encode_json
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson'
+}
+
+
+# Types the database drivers return that CSV and JSON need as text; a type
+# lookup per value is much cheaper than isinstance checks on every cell
+_CONVERTERS = {
+    datetime: datetime.isoformat,
+    date: date.isoformat,
+    Decimal: str
+}
+
+
+def _export_value(value):
+    convert = _CONVERTERS.get(type(value))
+    return value if convert is None else convert(value)
+
+
+def export_chunks(rows, columns, export_format, chunk_size=64 * 1024):
+    """
+    Encode rows (dicts) as CSV with a header line or as JSON lines, yielding
+    bytes about chunk_size long, so an export of any length holds one
+    chunk and the database page behind it in memory
+    """
+    if export_format == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        for row in rows:
+            writer.writerow([_export_value(row.get(column)) for column in columns])
+            if buffer.tell() >= chunk_size:
+                yield buffer.getvalue().encode()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue().encode()
+        return
+
+    chunk = []
+    size = 0
+    for row in rows:
+        line = encode_json({column: _export_value(row.get(column)) for column in columns}) + b'\n'
+        chunk.append(line)
+        size += len(line)
+        if size >= chunk_size:
+            yield b''.join(chunk)
+            chunk = []
+            size = 0
+    if chunk:
+        yield b''.join(chunk)
@@ -0,0 +1,89 @@
+import gzip
+import json
+
+from flask import request
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    Flask JSON provider that encodes with orjson when it is installed and
+    falls back to the stdlib encoder otherwise.
+    """
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default).decode()
+
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=self.default),
+            mimetype=self.mimetype
+        )
+
+
+def encode_json(obj):
+    """Encode an object to JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=DefaultJSONProvider.default)
+    return json.dumps(obj, default=DefaultJSONProvider.default, separators=(',', ':')).encode()
+
+
+def rows_response(app, columns, rows, status=200):
+    """
+    Build a JSON response from row tuples.
+    Clients that pass ?format=rows get {"columns": [...], "rows": [[...], ...]},
+    which is encoded straight from the tuples; everyone else gets the usual
+    list of objects.
+    """
+    if request.args.get('format') == 'rows':
+        body = encode_json({'columns': columns, 'rows': rows})
+    else:
+        body = encode_json([dict(zip(columns, row)) for row in rows])
+    return app.response_class(body, status=status, mimetype='application/json')
+
+
+def compress_response(response, min_size=1024, gzip_level=1, brotli_quality=4):
+    """
+    after_request hook: brotli or gzip encode large responses when the
+    client accepts it. Low levels keep compression cheap next to encoding.
+    """
+    if (response.direct_passthrough or response.is_streamed
+            or response.status_code < 200 or response.status_code >= 300
+            or 'Content-Encoding' in response.headers):
+        return response
+
+    accept_encoding = request.headers.get('Accept-Encoding', '')
+    if brotli is not None and 'br' in accept_encoding:
+        encoding = 'br'
+    elif 'gzip' in accept_encoding:
+        encoding = 'gzip'
+    else:
+        return response
+
+    data = response.get_data()
+    if len(data) < min_size:
+        return response
+
+    if encoding == 'br':
+        response.set_data(brotli.compress(data, quality=brotli_quality))
+    else:
+        response.set_data(gzip.compress(data, compresslevel=gzip_level))
+    response.headers['Content-Encoding'] = encoding
+    response.headers['Content-Length'] = len(response.get_data())
+    response.vary.add('Accept-Encoding')
+    return response
@@ -0,0 +1,28 @@
+import threading
+
+
+class LazyClient:
+    """
+    Stands in for a client that is slow to import or construct and builds
+    it on first attribute access, so module import (a serverless cold start)
+    does not pay for clients the request never uses
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def built(self):
+        return self._client is not None
+
+    def get(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._factory()
+        return self._client
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
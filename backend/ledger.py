@@ -0,0 +1,255 @@
+import logging
+import threading
+import time
+
+from money import format_inr
+
+logger = logging.getLogger(__name__)
+
+
+class RiskCheckFailed(Exception):
+    """Raised when an order would exceed the account's available cash or shares"""
+
+
+class Account:
+    __slots__ = ('cash', 'reserved_cash', 'shares', 'reserved_shares')
+
+    def __init__(self, cash, shares):
+        self.cash = cash                   # paise
+        self.reserved_cash = 0             # paise reserved by pending buys
+        self.shares = shares               # stock_id -> quantity held
+        self.reserved_shares = {}          # stock_id -> quantity reserved by pending sells
+
+    def available_cash(self):
+        return self.cash - self.reserved_cash
+
+    def available_shares(self, stock_id):
+        return self.shares.get(stock_id, 0) - self.reserved_shares.get(stock_id, 0)
+
+
+class AccountLedger:
+    """
+    In-memory cash and share balances with reservations for pending orders.
+    Orders reserve funds when they are placed, so risk checks never touch
+    the database once an account is loaded. The ledger is periodically
+    reconciled with profiles, user_stocks and pending orders, and accounts
+    marked stale by other processes are reconciled on their next use.
+    All amounts are integer paise.
+    """
+
+    def __init__(self, reconcile_interval=300):
+        self.reconcile_interval = reconcile_interval
+        self._lock = threading.Lock()
+        self._accounts = {}       # user_id -> Account
+        self._reservations = {}   # order_id -> (user_id, stock_id, type, quantity, amount, reserved_at)
+        self._stale = set()       # user_ids changed by other processes since they were loaded
+
+    def has_account(self, user_id):
+        return user_id in self._accounts
+
+    def load_account(self, user_id, balance, holdings, pending_orders=()):
+        """
+        Load an account from a profile balance in paise, {stock_id: quantity}
+        holdings and the user's pending Orders, which are reserved as-is.
+        """
+        now = time.time()
+        with self._lock:
+            if user_id in self._accounts:
+                return
+            account = Account(balance, dict(holdings))
+            self._accounts[user_id] = account
+            for order in pending_orders:
+                if order.id not in self._reservations:
+                    self._add_reservation(account, order.id, self._order_reservation(order, now))
+
+    def warm(self, accounts, pending_orders=()):
+        """
+        Load accounts rebuilt elsewhere, e.g. from the trade log, as
+        {user_id: (cash paise, {stock_id: quantity})} and reserve their
+        pending Orders. Accounts already loaded are left alone.
+        Returns the number of accounts loaded.
+        """
+        now = time.time()
+        loaded = 0
+        with self._lock:
+            for user_id, (cash, holdings) in accounts.items():
+                if user_id not in self._accounts:
+                    self._accounts[user_id] = Account(cash, dict(holdings))
+                    loaded += 1
+            for order in pending_orders:
+                account = self._accounts.get(order.user_id)
+                if account is not None and order.id not in self._reservations:
+                    self._add_reservation(account, order.id, self._order_reservation(order, now))
+        return loaded
+
+    def get_account(self, user_id):
+        return self._accounts.get(user_id)
+
+    def reserve(self, order_id, user_id, stock_id, order_type, quantity, price):
+        """
+        Reserve cash for a buy or shares for a sell at a price in paise.
+        Raises RiskCheckFailed if the account cannot cover the order.
+        """
+        amount = price * quantity
+        with self._lock:
+            account = self._accounts.get(user_id)
+            if account is None:
+                raise RiskCheckFailed('Account not loaded')
+            if order_type == 'buy':
+                available = account.available_cash()
+                if amount > available:
+                    raise RiskCheckFailed(
+                        f'Insufficient funds. Required: {format_inr(amount)}, Available: {format_inr(available)}')
+                account.reserved_cash += amount
+            else:
+                available = account.available_shares(stock_id)
+                if quantity > available:
+                    raise RiskCheckFailed(
+                        f'Not enough stocks available. Requested: {quantity}, Available: {available}')
+                account.reserved_shares[stock_id] = account.reserved_shares.get(stock_id, 0) + quantity
+            self._reservations[order_id] = (user_id, stock_id, order_type, quantity, amount, time.time())
+
+    def release(self, order_id):
+        """Drop an order's reservation, e.g. when it is cancelled"""
+        with self._lock:
+            return self._release(order_id) is not None
+
+    def settle(self, order_id, price):
+        """Release an order's reservation and apply its fill at the given price in paise"""
+        with self._lock:
+            reservation = self._release(order_id)
+            if reservation is None:
+                return False
+            user_id, stock_id, order_type, quantity, _, _ = reservation
+            self._apply_fill(user_id, stock_id, order_type, quantity, price)
+            return True
+
+    def apply_fill(self, user_id, stock_id, order_type, quantity, price):
+        """Apply a fill that never had a reservation"""
+        with self._lock:
+            self._apply_fill(user_id, stock_id, order_type, quantity, price)
+
+    def mark_stale(self, user_ids=None):
+        """
+        Note that loaded accounts changed elsewhere (all of them when
+        user_ids is None); is_stale() tells callers to reconcile them
+        """
+        with self._lock:
+            if user_ids is None:
+                self._stale.update(self._accounts)
+            else:
+                self._stale.update(user_id for user_id in user_ids if user_id in self._accounts)
+
+    def is_stale(self, user_id):
+        return user_id in self._stale
+
+    def reconcile(self, fetch_snapshot, user_ids=None):
+        """
+        Replace loaded balances, holdings and reservations with database state,
+        for every loaded account or only the given ones.
+        fetch_snapshot(user_ids) returns (balances, holdings, pending_orders)
+        where balances is {user_id: balance paise}, holdings is {user_id: {stock_id: quantity}}
+        and pending_orders is a list of Orders.
+        """
+        started = time.time()
+        with self._lock:
+            if user_ids is None:
+                user_ids = list(self._accounts.keys())
+            else:
+                user_ids = [user_id for user_id in user_ids if user_id in self._accounts]
+            # Marks that arrive while the snapshot is fetched stay for the next pass
+            self._stale.difference_update(user_ids)
+        if not user_ids:
+            return 0
+        balances, holdings, pending_orders = fetch_snapshot(user_ids)
+
+        with self._lock:
+            refreshed = set(user_ids)
+            # Other accounts keep their reservations untouched; reservations
+            # made while the snapshot was being fetched are not in it yet
+            kept = {}
+            reservations = {}
+            for order_id, r in self._reservations.items():
+                if r[0] not in refreshed:
+                    if r[0] in self._accounts:
+                        kept[order_id] = r
+                elif r[5] >= started:
+                    reservations[order_id] = r
+            for order in pending_orders:
+                if order.id not in reservations:
+                    reservations[order.id] = self._order_reservation(order, started)
+
+            for user_id in user_ids:
+                if user_id not in balances:
+                    self._accounts.pop(user_id, None)
+                    continue
+                self._accounts[user_id] = Account(balances[user_id], holdings.get(user_id, {}))
+
+            self._reservations = kept
+            for order_id, reservation in reservations.items():
+                account = self._accounts.get(reservation[0])
+                if account is not None:
+                    self._add_reservation(account, order_id, reservation)
+        return len(user_ids)
+
+    def run_reconciler(self, fetch_snapshot, should_run=lambda: True, wait=None):
+        """
+        Background thread function to reconcile the ledger with the database.
+        wait(seconds) replaces time.sleep and returns False to stop early.
+        """
+        while should_run():
+            if wait is None:
+                time.sleep(self.reconcile_interval)
+            elif not wait(self.reconcile_interval):
+                break
+            try:
+                count = self.reconcile(fetch_snapshot)
+                if count:
+                    logger.info(f"Reconciled {count} ledger accounts")
+            except Exception as e:
+                logger.error(f"Error reconciling ledger: {str(e)}")
+
+    @staticmethod
+    def _order_reservation(order, reserved_at):
+        return (order.user_id, order.stock_id, order.type, order.quantity, order.price * order.quantity, reserved_at)
+
+    def _add_reservation(self, account, order_id, reservation):
+        _, stock_id, order_type, quantity, amount, _ = reservation
+        if order_type == 'buy':
+            account.reserved_cash += amount
+        else:
+            account.reserved_shares[stock_id] = account.reserved_shares.get(stock_id, 0) + quantity
+        self._reservations[order_id] = reservation
+
+    def _release(self, order_id):
+        reservation = self._reservations.pop(order_id, None)
+        if reservation is None:
+            return None
+        user_id, stock_id, order_type, quantity, amount, _ = reservation
+        account = self._accounts.get(user_id)
+        if account is not None:
+            if order_type == 'buy':
+                account.reserved_cash = max(0, account.reserved_cash - amount)
+            else:
+                remaining = account.reserved_shares.get(stock_id, 0) - quantity
+                if remaining > 0:
+                    account.reserved_shares[stock_id] = remaining
+                else:
+                    account.reserved_shares.pop(stock_id, None)
+        return reservation
+
+    def _apply_fill(self, user_id, stock_id, order_type, quantity, price):
+        account = self._accounts.get(user_id)
+        if account is None:
+            return
+        total = price * quantity
+        if order_type == 'buy':
+            account.cash -= total
+            account.shares[stock_id] = account.shares.get(stock_id, 0) + quantity
+        else:
+            account.cash += total
+            remaining = account.shares.get(stock_id, 0) - quantity
+            if remaining > 0:
+                account.shares[stock_id] = remaining
+            else:
+                account.shares.pop(stock_id, None)
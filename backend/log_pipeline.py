@@ -0,0 +1,164 @@
+import atexit
+import itertools
+import json
+import logging
+import queue
+import sys
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Attributes every LogRecord has; anything else was passed through `extra`
+RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JSONFormatter(logging.Formatter):
+    """
+    One JSON object per line: ts, level, logger, msg, fields passed
+    with `extra=`, and exc when there is a traceback
+    """
+
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 6),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage()
+        }
+        for key, value in record.__dict__.items():
+            if key not in RECORD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        if orjson is not None:
+            return orjson.dumps(entry, default=str).decode()
+        return json.dumps(entry, default=str, separators=(',', ':'))
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    Hands records to a background listener through a bounded queue.
+    When the queue is full the record is dropped and counted instead of
+    blocking the caller. Records are queued unformatted, so message
+    formatting happens on the listener thread.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class DrainingQueueListener(QueueListener):
+    """Waits for room in a full queue for the stop sentinel"""
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep one in every 1/rate INFO and DEBUG records from sampled loggers
+    (and their children). Warnings and errors are never sampled.
+    """
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates                  # logger name -> fraction of records kept
+        self._every = {name: max(1, round(1 / rate)) if rate > 0 else 0 for name, rate in rates.items()}
+        self._counters = {name: itertools.count() for name in rates}
+        self._resolved = {}                 # logger name -> sampled ancestor or None
+        self.sampled_out = 0
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        name = self._resolved.get(record.name, '')
+        if name == '':
+            name = self._resolved[record.name] = self._sampled_ancestor(record.name)
+        if name is None:
+            return True
+        every = self._every[name]
+        if every and next(self._counters[name]) % every == 0:
+            return True
+        self.sampled_out += 1
+        return False
+
+    def _sampled_ancestor(self, name):
+        while name:
+            if name in self.rates:
+                return name
+            name = name.rpartition('.')[0]
+        return None
+
+
+def parse_sample_rates(value):
+    """Parse 'app.ticks=0.01,app.matcher=0.1' into {name: rate}"""
+    rates = {}
+    for item in (value or '').split(','):
+        name, _, rate = item.strip().partition('=')
+        if name and rate:
+            rates[name] = float(rate)
+    return rates
+
+
+class LogPipeline:
+    """
+    Root logging setup: records pass the sampling filter, then either go
+    through a bounded queue to a listener thread that formats and writes
+    them, or straight to the output handler when async is off.
+    """
+
+    def __init__(self, level=logging.INFO, json_format=True, async_enabled=True,
+                 queue_size=10000, sample_rates=None, stream=None):
+        self.output = logging.StreamHandler(stream or sys.stdout)
+        self.output.setFormatter(JSONFormatter() if json_format
+                                 else logging.Formatter('%(levelname)s:%(name)s:%(message)s'))
+        self.sampler = SamplingFilter(sample_rates or {})
+        self.listener = None
+        if async_enabled:
+            self.handler = DroppingQueueHandler(queue.Queue(maxsize=queue_size))
+            self.listener = DrainingQueueListener(self.handler.queue, self.output)
+        else:
+            self.handler = self.output
+        self.handler.addFilter(self.sampler)
+        self.level = level
+
+    def install(self):
+        root = logging.getLogger()
+        for handler in root.handlers[:]:
+            root.removeHandler(handler)
+        root.addHandler(self.handler)
+        root.setLevel(self.level)
+        if self.listener is not None:
+            self.listener.start()
+            atexit.register(self.stop)
+        return self
+
+    def stop(self):
+        """Detach from the root logger, flush queued records and stop the listener thread"""
+        logging.getLogger().removeHandler(self.handler)
+        if self.listener is not None and self.listener._thread is not None:
+            self.listener.stop()
+
+    def stats(self):
+        return {
+            'async': self.listener is not None,
+            'queued': self.handler.queue.qsize() if self.listener is not None else 0,
+            'dropped': getattr(self.handler, 'dropped', 0),
+            'sampled_out': self.sampler.sampled_out,
+            'sample_rates': self.sampler.rates,
+            'at': time.time()
+        }
@@ -0,0 +1,22 @@
+-- Cost basis and realized P&L, maintained on every fill
+ALTER TABLE user_stocks
+ADD COLUMN IF NOT EXISTS cost_basis DECIMAL(20, 2) NOT NULL DEFAULT 0,
+ADD COLUMN IF NOT EXISTS realized_pnl DECIMAL(20, 2) NOT NULL DEFAULT 0;
+
+-- Lifetime realized P&L, including positions that have been closed
+ALTER TABLE profiles
+ADD COLUMN IF NOT EXISTS realized_pnl DECIMAL(20, 2) NOT NULL DEFAULT 0;
+
+-- Existing holdings start at the average price of their completed buys, or
+-- the current price where there are none (e.g. admin starting stock)
+UPDATE user_stocks us
+SET cost_basis = ROUND(us.quantity * COALESCE(
+    (SELECT SUM(o.quantity * COALESCE(o.executed_price, o.price)) / NULLIF(SUM(o.quantity), 0)
+     FROM orders o
+     WHERE o.user_id = us.user_id
+       AND o.stock_id = us.stock_id
+       AND o.type = 'buy'
+       AND o.status = 'completed'),
+    (SELECT s.current_price FROM stocks s WHERE s.id = us.stock_id)
+), 2)
+WHERE us.cost_basis = 0;
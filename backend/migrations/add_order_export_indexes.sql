@@ -0,0 +1,3 @@
+-- Order exports page through orders by (created_at, id), market-wide or per user
+CREATE INDEX IF NOT EXISTS orders_created_at_id_idx ON orders (created_at, id);
+CREATE INDEX IF NOT EXISTS orders_user_created_at_id_idx ON orders (user_id, created_at, id);
@@ -0,0 +1,15 @@
+-- Time in force: DAY orders expire at market close, GTD orders at expires_at,
+-- GTC orders never; IOC orders are settled when placed
+ALTER TABLE orders
+ADD COLUMN IF NOT EXISTS time_in_force TEXT NOT NULL DEFAULT 'DAY'
+    CHECK (time_in_force IN ('DAY', 'GTC', 'IOC', 'GTD')),
+ADD COLUMN IF NOT EXISTS expires_at TIMESTAMP WITH TIME ZONE;
+
+-- Orders pending from before time in force keep the old five minute timeout
+UPDATE orders
+SET time_in_force = 'GTD', expires_at = created_at + INTERVAL '5 minutes'
+WHERE status = 'pending' AND expires_at IS NULL;
+
+-- The expiry wheel loads pending orders with an expiry on startup
+CREATE INDEX IF NOT EXISTS orders_pending_expires_at_idx ON orders (expires_at)
+    WHERE status = 'pending' AND expires_at IS NOT NULL;
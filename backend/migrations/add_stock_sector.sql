@@ -0,0 +1,4 @@
+-- Sector of each stock; the correlated price model moves stocks in the same
+-- sector together. Stocks without one move with the market as a whole.
+ALTER TABLE stocks
+ADD COLUMN IF NOT EXISTS sector TEXT;
@@ -0,0 +1,66 @@
+# Fixed-point money helpers. Amounts travel through the engine as integer
+# paise (1/100 rupee); conversion happens only where values enter or leave
+# (database rows, request payloads and JSON responses).
+
+PAISE_PER_RUPEE = 100
+
+
+def to_paise(value):
+    """
+    Convert a DECIMAL string, int, float or Decimal rupee amount to integer paise.
+    Strings are parsed exactly without going through float.
+    """
+    if isinstance(value, int):
+        return value * PAISE_PER_RUPEE
+    if isinstance(value, str):
+        value = value.strip()
+        negative = value.startswith('-')
+        if negative or value.startswith('+'):
+            value = value[1:]
+        whole, _, fraction = value.partition('.')
+        if not fraction or fraction.isdigit() and len(fraction) <= 2:
+            paise = int(whole or '0') * PAISE_PER_RUPEE + int((fraction + '00')[:2])
+        else:
+            # More than two decimals: round half away from zero on the third digit
+            paise = int(whole or '0') * PAISE_PER_RUPEE + int(fraction[:2])
+            if fraction[2] >= '5':
+                paise += 1
+        return -paise if negative else paise
+    return int(round(float(value) * PAISE_PER_RUPEE))
+
+
+def from_paise(paise):
+    """Convert integer paise to a float rupee amount for JSON responses"""
+    return paise / PAISE_PER_RUPEE
+
+
+def paise_str(paise):
+    """Format integer paise as an exact DECIMAL string for the database"""
+    sign = '-' if paise < 0 else ''
+    whole, fraction = divmod(abs(paise), PAISE_PER_RUPEE)
+    return f'{sign}{whole}.{fraction:02d}'
+
+
+def format_inr(paise):
+    """Format integer paise for user-facing messages"""
+    return f'₹{paise_str(paise)}'
+
+
+def percent_to_centi(percent):
+    """Convert a percentage such as 1.25 to integer hundredths of a percent"""
+    return int(round(percent * 100))
+
+
+def centi_to_percent(centi):
+    return centi / 100
+
+
+def cost_of_shares(cost_basis, held, quantity):
+    """
+    Cost in paise of quantity shares out of a position of held shares with
+    the given total cost basis, at the position's average cost. Selling the
+    whole position returns the whole cost basis.
+    """
+    if quantity >= held:
+        return cost_basis
+    return (cost_basis * quantity + held // 2) // held
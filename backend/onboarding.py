@@ -0,0 +1,271 @@
+"""
+Bulk user onboarding from a CSV of users, for competitions and classes.
+
+    python onboarding.py users.csv [--concurrency 4] [--batch-size 500] [--failures failed.csv]
+
+The CSV needs a header row with email and password columns; role ('user'
+or 'admin') and balance (rupees) are optional and default as in
+/api/auth/register. The same code backs POST /api/admin/users/bulk.
+"""
+import argparse
+import csv
+import io
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+from money import paise_str, to_paise
+
+logger = logging.getLogger(__name__)
+
+# Starting cash by role, in paise, as /api/auth/register grants it
+STARTING_BALANCES = {'user': 10000_00, 'admin': 1000000000_00}
+ADMIN_STARTING_SHARES = 1000
+MIN_PASSWORD_LENGTH = 6     # Supabase auth's default minimum
+
+# Emails per existing-profile lookup, to keep the PostgREST URL short
+LOOKUP_CHUNK = 100
+
+
+def validate_users(records):
+    """
+    Check (row, record) pairs read from a CSV or JSON upload. Returns the
+    valid users as dicts with row, email, password, role and balance (paise)
+    and a failure dict per rejected row.
+    """
+    users, failures = [], []
+    first_row = {}
+    for row, record in records:
+        email = (record.get('email') or '').strip().lower()
+        password = record.get('password') or ''
+        role = (record.get('role') or 'user').strip().lower()
+        balance = record.get('balance')
+        error = None
+        if '@' not in email:
+            error = 'A valid email is required'
+        elif email in first_row:
+            error = f'Duplicate email (first on row {first_row[email]})'
+        elif len(password) < MIN_PASSWORD_LENGTH:
+            error = f'Password must be at least {MIN_PASSWORD_LENGTH} characters'
+        elif role not in STARTING_BALANCES:
+            error = 'Invalid role specified'
+        else:
+            try:
+                balance = STARTING_BALANCES[role] if balance in (None, '') else to_paise(balance)
+                if balance < 0:
+                    error = 'Balance cannot be negative'
+            except (TypeError, ValueError):
+                error = 'Invalid balance'
+        if error:
+            failures.append({'row': row, 'email': email or None, 'error': error})
+            continue
+        first_row[email] = row
+        users.append({'row': row, 'email': email, 'password': password, 'role': role, 'balance': balance})
+    return users, failures
+
+
+def parse_users_csv(text):
+    """Validate users from CSV text; rows are numbered by line, the header being line 1"""
+    reader = csv.DictReader(io.StringIO(text))
+    if not reader.fieldnames or not {'email', 'password'} <= {name.strip().lower() for name in reader.fieldnames}:
+        raise ValueError('CSV needs a header row with email and password columns')
+    reader.fieldnames = [name.strip().lower() for name in reader.fieldnames]
+    return validate_users((reader.line_num, record) for record in reader)
+
+
+def onboard(users, create_user, client, concurrency=4, batch_size=500, admin_holdings=(),
+            on_created=None, progress_every=100):
+    """
+    Register validated users: skip emails that already have a profile,
+    create auth users through create_user(email, password) with at most
+    concurrency calls in flight, and bulk insert profiles (and admins'
+    starting holdings) batch_size rows per request as the auth users come
+    in. Yields progress dicts; the last one, with phase 'done', is the
+    report with a failure per row that was not registered.
+    admin_holdings is a list of {'stock_id', 'quantity', 'cost_basis'} given
+    to each new admin; on_created(profiles) is called after each profile batch.
+    """
+    started = time.monotonic()
+    total = len(users)
+    failures = []
+    created = 0
+
+    # Emails that are already registered are skipped rather than failed, so
+    # a partial run can simply be repeated with the same file
+    existing = set()
+    emails = [user['email'] for user in users]
+    for start in range(0, len(emails), LOOKUP_CHUNK):
+        chunk = emails[start:start + LOOKUP_CHUNK]
+        result = client.table('profiles').select('email').in_('email', chunk).execute()
+        existing.update(profile['email'].lower() for profile in result.data)
+    pending = [user for user in users if user['email'] not in existing]
+    skipped = total - len(pending)
+    yield {'phase': 'auth', 'done': skipped, 'total': total, 'created': 0, 'failed': 0}
+
+    def insert_profiles(batch):
+        nonlocal created
+        now = datetime.utcnow().isoformat()
+        profiles = [{
+            'user_id': user['user_id'],
+            'email': user['email'],
+            'role': user['role'],
+            'balance': paise_str(user['balance']),
+            'created_at': now
+        } for user in batch]
+        try:
+            client.table('profiles').insert(profiles).execute()
+            inserted = profiles
+        except Exception as e:
+            # Retry row by row so one bad row does not fail the batch
+            logger.warning("Profile batch of %s failed, inserting one by one: %s", len(profiles), e)
+            inserted = []
+            for user, profile in zip(batch, profiles):
+                try:
+                    client.table('profiles').insert(profile).execute()
+                    inserted.append(profile)
+                except Exception as row_error:
+                    failures.append({'row': user['row'], 'email': user['email'], 'user_id': user['user_id'],
+                                     'error': f'Auth user created but profile insert failed: {row_error}'})
+        created += len(inserted)
+        holdings = [dict(holding, user_id=profile['user_id'])
+                    for profile in inserted if profile['role'] == 'admin'
+                    for holding in admin_holdings]
+        for start in range(0, len(holdings), batch_size):
+            try:
+                client.table('user_stocks').insert(holdings[start:start + batch_size]).execute()
+            except Exception as e:
+                logger.error("Error adding initial admin stocks: %s", e)
+        if inserted and on_created is not None:
+            on_created(inserted)
+
+    def register(user):
+        try:
+            return user, create_user(user['email'], user['password']), None
+        except Exception as e:
+            return user, None, str(e)
+
+    batch = []
+    taken = set()
+
+    def take(future):
+        taken.add(future)
+        user, user_id, error = future.result()
+        if error or not user_id:
+            failures.append({'row': user['row'], 'email': user['email'],
+                             'error': error or 'Failed to create user in Supabase'})
+        else:
+            batch.append(dict(user, user_id=user_id))
+
+    done = skipped
+    pool = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix='onboarding')
+    futures = [pool.submit(register, user) for user in pending]
+    try:
+        for future in as_completed(futures):
+            take(future)
+            done += 1
+            if len(batch) >= batch_size:
+                insert_profiles(batch)
+                batch = []
+            if done % progress_every == 0 or done == total:
+                yield {'phase': 'auth', 'done': done, 'total': total, 'created': created, 'failed': len(failures)}
+    finally:
+        # If the caller stops early, sign-ups not yet started are dropped but
+        # every auth user that was created still gets its profile
+        pool.shutdown(wait=True, cancel_futures=True)
+        for future in futures:
+            if future not in taken and not future.cancelled():
+                take(future)
+        if batch:
+            insert_profiles(batch)
+
+    failures.sort(key=lambda failure: failure['row'])
+    yield {
+        'phase': 'done',
+        'total': total,
+        'created': created,
+        'skipped': skipped,
+        'failed': len(failures),
+        'failures': failures,
+        'seconds': round(time.monotonic() - started, 2)
+    }
+
+
+def auth_user_creator(client, mode='sign_up'):
+    """
+    create_user(email, password) -> user id. 'sign_up' goes through the
+    public sign-up flow like /api/auth/register; 'admin' uses the auth admin
+    API, which needs the service role key, confirms the email and is not
+    subject to sign-up rate limits.
+    """
+    if mode == 'admin':
+        def create_user(email, password):
+            response = client.auth.admin.create_user({'email': email, 'password': password, 'email_confirm': True})
+            return response.user.id if response.user else None
+    elif mode == 'sign_up':
+        def create_user(email, password):
+            response = client.auth.sign_up({'email': email, 'password': password})
+            return response.user.id if response.user else None
+    else:
+        raise ValueError(f'Unknown auth mode: {mode}')
+    return create_user
+
+
+def admin_starting_holdings(client):
+    """ADMIN_STARTING_SHARES of every stock, booked at the current price"""
+    stocks = client.table('stocks').select('id, current_price').execute()
+    return [{
+        'stock_id': stock['id'],
+        'quantity': ADMIN_STARTING_SHARES,
+        'cost_basis': paise_str(ADMIN_STARTING_SHARES * to_paise(stock['current_price']))
+    } for stock in stocks.data]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('csv_path')
+    parser.add_argument('--concurrency', type=int, default=int(os.getenv('BULK_ONBOARD_CONCURRENCY', '4')))
+    parser.add_argument('--batch-size', type=int, default=int(os.getenv('BULK_ONBOARD_BATCH_SIZE', '500')))
+    parser.add_argument('--auth-mode', choices=('sign_up', 'admin'), default=os.getenv('BULK_ONBOARD_AUTH', 'sign_up'))
+    parser.add_argument('--failures', help='write rows that were not registered to this CSV')
+    parser.add_argument('--dry-run', action='store_true', help='only validate the file')
+    args = parser.parse_args()
+
+    with open(args.csv_path, newline='') as f:
+        users, failures = parse_users_csv(f.read())
+    print(f"{len(users)} valid rows, {len(failures)} rejected")
+    report = {'created': 0, 'skipped': 0, 'failures': []}
+    if users and not args.dry_run:
+        from dotenv import load_dotenv
+        from supabase_pool import create_pooled_client
+        load_dotenv()
+        # Auth calls get their own client: sign-ups change the session of
+        # the client that makes them
+        auth_client = create_pooled_client('onboarding-auth', os.getenv('SUPABASE_URL'), os.getenv('SUPABASE_KEY'),
+                                           max_connections=args.concurrency)
+        client = create_pooled_client('onboarding', os.getenv('SUPABASE_URL'), os.getenv('SUPABASE_KEY'),
+                                      max_connections=2)
+        admin_holdings = admin_starting_holdings(client) if any(user['role'] == 'admin' for user in users) else ()
+        for report in onboard(users, auth_user_creator(auth_client, args.auth_mode), client, args.concurrency,
+                              args.batch_size, admin_holdings):
+            if report['phase'] != 'done':
+                print(f"\r{report['done']}/{report['total']} processed, {report['created']} created, "
+                      f"{report['failed']} failed", end='', file=sys.stderr, flush=True)
+        print(file=sys.stderr)
+        print(f"{report['created']} created, {report['skipped']} already registered, "
+              f"{report['failed']} failed in {report['seconds']}s")
+    failures = sorted(failures + report['failures'], key=lambda failure: failure['row'])
+    for failure in failures[:20]:
+        print(f"  row {failure['row']} {failure['email']}: {failure['error']}")
+    if args.failures:
+        with open(args.failures, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=['row', 'email', 'user_id', 'error'])
+            writer.writeheader()
+            writer.writerows(failures)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
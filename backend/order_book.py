@@ -0,0 +1,181 @@
+import bisect
+import threading
+from collections import deque
+from itertools import islice
+
+from money import paise_str
+from records import Order
+
+
+class OrderBook:
+    """
+    In-memory view of pending orders with running per-stock buy and sell
+    volume and aggregated price levels, maintained incrementally as orders
+    are placed, filled or cancelled so demand pressure is O(1) per stock
+    and depth reads are O(levels). Level prices are integer paise.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._orders = {}    # order_id -> (stock_id, side, quantity, price, user_id)
+        self._volume = {}    # stock_id -> [pending buy quantity, pending sell quantity]
+        self._levels = {}    # stock_id -> ({price: [quantity, orders]} for buys, same for sells)
+        self._prices = {}    # stock_id -> (sorted buy prices, sorted sell prices)
+        self._by_stock = {}  # stock_id -> {order_id: None}, in the order they were added
+
+    def add(self, order):
+        """Track a pending Order"""
+        with self._lock:
+            self._add(order)
+
+    def remove(self, order_id):
+        """Stop tracking an order once it is filled or cancelled"""
+        with self._lock:
+            return self._remove(order_id)
+
+    def rebuild(self, pending_orders):
+        """Replace the book with the given pending Orders"""
+        with self._lock:
+            self._orders = {}
+            self._volume = {}
+            self._levels = {}
+            self._prices = {}
+            self._by_stock = {}
+            for order in pending_orders:
+                self._add(order)
+
+    def snapshot(self):
+        """Return the tracked orders as rows, for a checkpoint; restore() reads them back"""
+        with self._lock:
+            return [
+                {'id': order_id, 'user_id': user_id, 'stock_id': stock_id, 'type': 'buy' if side == 0 else 'sell',
+                 'quantity': quantity, 'price': paise_str(price)}
+                for order_id, (stock_id, side, quantity, price, user_id) in self._orders.items()
+            ]
+
+    def orders(self, stock_id=None):
+        """
+        Return the tracked orders, or one stock's, as Orders, e.g. to
+        reserve them in the ledger or match them
+        """
+        with self._lock:
+            order_ids = self._orders if stock_id is None else self._by_stock.get(stock_id, ())
+            return [self._order(order_id) for order_id in order_ids]
+
+    def _order(self, order_id):
+        stock_id, side, quantity, price, user_id = self._orders[order_id]
+        return Order(order_id, user_id, stock_id, 'buy' if side == 0 else 'sell', quantity, price)
+
+    def restore(self, rows):
+        """Rebuild the book from snapshot() rows"""
+        self.rebuild(Order.from_row(row) for row in rows)
+
+    def volume(self, stock_id):
+        """Return (pending buy quantity, pending sell quantity) for a stock"""
+        totals = self._volume.get(stock_id)
+        return (totals[0], totals[1]) if totals else (0, 0)
+
+    def all_volumes(self):
+        with self._lock:
+            return {stock_id: (totals[0], totals[1]) for stock_id, totals in self._volume.items()}
+
+    def depth(self, stock_id, max_levels=None):
+        """
+        Return aggregated pending price levels for a stock as
+        (bids, asks): lists of (price, quantity, order count), best first
+        """
+        with self._lock:
+            if stock_id not in self._levels:
+                return [], []
+            buy_levels, sell_levels = self._levels[stock_id]
+            buy_prices, sell_prices = self._prices[stock_id]
+            bid_prices = list(islice(reversed(buy_prices), max_levels))
+            ask_prices = sell_prices[:max_levels]
+            bids = [(price, buy_levels[price][0], buy_levels[price][1]) for price in bid_prices]
+            asks = [(price, sell_levels[price][0], sell_levels[price][1]) for price in ask_prices]
+            return bids, asks
+
+    def _add(self, order):
+        if order.id in self._orders:
+            return
+        stock_id = order.stock_id
+        side = 0 if order.type == 'buy' else 1
+        quantity = order.quantity
+        price = order.price
+        self._orders[order.id] = (stock_id, side, quantity, price, order.user_id)
+        self._by_stock.setdefault(stock_id, {})[order.id] = None
+
+        totals = self._volume.setdefault(stock_id, [0, 0])
+        totals[side] += quantity
+
+        if stock_id not in self._levels:
+            self._levels[stock_id] = ({}, {})
+            self._prices[stock_id] = ([], [])
+        levels = self._levels[stock_id][side]
+        level = levels.get(price)
+        if level is None:
+            levels[price] = [quantity, 1]
+            bisect.insort(self._prices[stock_id][side], price)
+        else:
+            level[0] += quantity
+            level[1] += 1
+
+    def _remove(self, order_id):
+        entry = self._orders.pop(order_id, None)
+        if entry is None:
+            return False
+        stock_id, side, quantity, price, _ = entry
+        stock_orders = self._by_stock[stock_id]
+        del stock_orders[order_id]
+        if not stock_orders:
+            del self._by_stock[stock_id]
+        totals = self._volume[stock_id]
+        totals[side] -= quantity
+
+        levels = self._levels[stock_id][side]
+        level = levels[price]
+        level[0] -= quantity
+        level[1] -= 1
+        if not level[1]:
+            del levels[price]
+            prices = self._prices[stock_id][side]
+            del prices[bisect.bisect_left(prices, price)]
+
+        if not totals[0] and not totals[1]:
+            del self._volume[stock_id]
+            del self._levels[stock_id]
+            del self._prices[stock_id]
+        return True
+
+
+class TradeTape:
+    """
+    Fixed-size ring buffer of recent executions per stock, prices in paise
+    """
+
+    def __init__(self, size=200):
+        self.size = size
+        self._lock = threading.Lock()
+        self._trades = {}    # stock_id -> deque of trade dicts, newest last
+
+    def record(self, stock_id, order_type, quantity, price, executed_at, order_id=None):
+        trade = {
+            'order_id': order_id,
+            'type': order_type,
+            'quantity': quantity,
+            'price': price,
+            'executed_at': executed_at
+        }
+        with self._lock:
+            tape = self._trades.get(stock_id)
+            if tape is None:
+                tape = self._trades[stock_id] = deque(maxlen=self.size)
+            tape.append(trade)
+
+    def recent(self, stock_id, limit=None):
+        """Return up to limit recent trades for a stock, newest first"""
+        with self._lock:
+            tape = self._trades.get(stock_id)
+            if not tape:
+                return []
+            return list(islice(reversed(tape), limit))
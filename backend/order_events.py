@@ -0,0 +1,178 @@
+import json
+import logging
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+
+logger = logging.getLogger(__name__)
+
+# Tells a resuming client that events it missed are gone from the buffer
+# and it should refetch its orders once
+RESYNC = 'resync'
+
+
+def format_sse(event_id, event, data):
+    """Encode one server-sent event"""
+    lines = [f'id: {event_id}'] if event_id else []
+    lines.append(f'event: {event}')
+    lines.append(f'data: {json.dumps(data, separators=(",", ":"))}')
+    return '\n'.join(lines) + '\n\n'
+
+
+class _Channel:
+    __slots__ = ('buffer', 'subscribers', 'evicted_through')
+
+    def __init__(self, buffer_size):
+        self.buffer = deque(maxlen=buffer_size)    # (seq, event, data)
+        self.subscribers = set()
+        self.evicted_through = 0                   # newest seq dropped from the buffer
+
+
+class Subscription:
+    """One client's stream of a user's order events"""
+
+    def __init__(self, hub, user_id, backlog, resync, max_queue):
+        self.hub = hub
+        self.user_id = user_id
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.overflowed = False
+        self._backlog = backlog
+        self._resync = resync
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.hub.unsubscribe(self)
+
+    def offer(self, item):
+        # Called by the hub under its lock; a client that cannot keep up is
+        # cut off and resumes from its last event id when it reconnects
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            self.overflowed = True
+
+    def events(self, heartbeat=15, until=None):
+        """
+        Yield SSE-formatted strings: missed events first, then new ones as
+        they are published, with a comment line every heartbeat seconds so
+        dead connections are noticed. Ends at until (epoch seconds) or when
+        the client falls too far behind.
+        """
+        if self._resync:
+            yield format_sse(None, RESYNC, {'reason': 'events since last_event_id are no longer buffered'})
+        for seq, event, data in self._backlog:
+            yield format_sse(self.hub.event_id(seq), event, data)
+        self._backlog = ()
+        while not self.overflowed:
+            timeout = heartbeat if until is None else min(heartbeat, until - time.time())
+            if timeout <= 0:
+                return
+            try:
+                seq, event, data = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                yield ': keepalive\n\n'
+                continue
+            yield format_sse(self.hub.event_id(seq), event, data)
+
+
+class OrderEventHub:
+    """
+    Per-user channels of order status events (fills and cancellations)
+    for the push endpoint. Publishing looks the user's channel up in a
+    dict and hands the event to that user's open streams only. Each
+    channel keeps its last buffer_size events so a client that reconnects
+    with Last-Event-ID gets what it missed; ids are only meaningful to the
+    process that issued them, so a stale or foreign id gets a resync event.
+    """
+
+    def __init__(self, buffer_size=256, max_channels=100000, max_queue=1000):
+        self.buffer_size = buffer_size
+        self.max_channels = max_channels
+        self.max_queue = max_queue
+        self.epoch = uuid.uuid4().hex[:8]
+        self._seq = 0
+        self._channels = OrderedDict()     # user_id -> _Channel, least recently used first
+        self._lock = threading.Lock()
+        self.published = 0
+        self.dropped_streams = 0
+
+    def event_id(self, seq):
+        return f'{self.epoch}-{seq}'
+
+    def _parse_event_id(self, event_id):
+        epoch, _, seq = (event_id or '').partition('-')
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        return int(seq)
+
+    def _channel(self, user_id):
+        channel = self._channels.get(user_id)
+        if channel is None:
+            channel = self._channels[user_id] = _Channel(self.buffer_size)
+            if len(self._channels) > self.max_channels:
+                self._evict()
+        else:
+            self._channels.move_to_end(user_id)
+        return channel
+
+    def _evict(self):
+        # Forget the least recently active users nobody is listening to
+        for user_id in list(self._channels):
+            if len(self._channels) <= self.max_channels:
+                break
+            if not self._channels[user_id].subscribers:
+                del self._channels[user_id]
+
+    def publish(self, user_id, event, data):
+        with self._lock:
+            self._seq += 1
+            channel = self._channel(user_id)
+            if len(channel.buffer) == channel.buffer.maxlen:
+                channel.evicted_through = channel.buffer[0][0]
+            item = (self._seq, event, data)
+            channel.buffer.append(item)
+            for subscription in channel.subscribers:
+                subscription.offer(item)
+            self.published += 1
+            return self.event_id(self._seq)
+
+    def subscribe(self, user_id, last_event_id=None):
+        """
+        Open a stream of the user's events. With last_event_id the events
+        after it are replayed first; registration and the replay happen
+        under one lock, so nothing is missed or delivered twice.
+        """
+        with self._lock:
+            channel = self._channel(user_id)
+            backlog, resync = [], False
+            if last_event_id:
+                last_seq = self._parse_event_id(last_event_id)
+                if last_seq is None or last_seq < channel.evicted_through:
+                    resync = True
+                    backlog = list(channel.buffer)
+                else:
+                    backlog = [item for item in channel.buffer if item[0] > last_seq]
+            subscription = Subscription(self, user_id, backlog, resync, self.max_queue)
+            channel.subscribers.add(subscription)
+            return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            channel = self._channels.get(subscription.user_id)
+            if channel is not None:
+                channel.subscribers.discard(subscription)
+            if subscription.overflowed:
+                self.dropped_streams += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'channels': len(self._channels),
+                'streams': sum(len(channel.subscribers) for channel in self._channels.values()),
+                'published': self.published,
+                'dropped_streams': self.dropped_streams
+            }
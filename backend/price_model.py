@@ -0,0 +1,152 @@
+import logging
+import math
+import random
+
+# numpy is in requirements.txt; the pure Python path is for development
+# environments without it and is far slower on a full tick
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.getLogger(__name__)
+
+# Stocks without a sector share one factor, i.e. they move with the market
+DEFAULT_SECTOR = 'market'
+
+
+def cholesky(matrix):
+    """Lower triangular L with L @ L.T == matrix, for a small symmetric positive definite matrix"""
+    size = len(matrix)
+    lower = [[0.0] * size for _ in range(size)]
+    for i in range(size):
+        for j in range(i + 1):
+            total = matrix[i][j] - sum(lower[i][k] * lower[j][k] for k in range(j))
+            lower[i][j] = math.sqrt(total) if i == j else total / lower[j][j]
+    return lower
+
+
+class UniformPriceModel:
+    """The original movement: each price independently moves up to max_move either way"""
+
+    name = 'uniform'
+
+    def __init__(self, max_move=0.005, seed=None):
+        self.max_move = max_move
+        self.random = random.Random(seed)
+
+    def step(self, prices, sectors=None):
+        return {stock_id: max(1, price + round(price * self.random.uniform(-self.max_move, self.max_move)))
+                for stock_id, price in sorted(prices.items())}
+
+
+class FactorPriceModel:
+    """
+    Geometric Brownian motion with optional mean reversion and sector
+    correlation, all per tick. Each log return is
+
+        drift - volatility**2 / 2 + mean_reversion * (log(anchor) - log(price))
+            + volatility * (sqrt(s) * F[sector] + sqrt(1 - s) * e)
+
+    with s = sector_correlation, e independent per stock, and the sector
+    factors F correlated with each other at market_correlation through the
+    Cholesky factor of their correlation matrix. Stocks in one sector are
+    then correlated at s and stocks in different sectors at
+    s * market_correlation, without an N x N matrix. The anchor is the first
+    price seen for a stock. One tick for every stock is a few array
+    operations when NumPy is installed; without it the same model runs in
+    plain Python. A seed makes runs reproducible for a given backend.
+    """
+
+    name = 'correlated'
+
+    def __init__(self, volatility=0.003, drift=0.0, mean_reversion=0.0, market_correlation=0.3,
+                 sector_correlation=0.5, seed=None, use_numpy=None):
+        if not 0 <= market_correlation < 1 or not 0 <= sector_correlation <= 1:
+            raise ValueError('Correlations must be in [0, 1), and sector correlation at most 1')
+        self.volatility = volatility
+        self.drift = drift
+        self.mean_reversion = mean_reversion
+        self.market_correlation = market_correlation
+        self.sector_correlation = sector_correlation
+        self.use_numpy = np is not None if use_numpy is None else use_numpy
+        if self.use_numpy:
+            self.rng = np.random.default_rng(seed)
+        else:
+            self.random = random.Random(seed)
+        self._anchors = {}          # stock_id -> log of the first price seen
+        self._layout_key = None
+        self._layout = None
+
+    def _build_layout(self, stock_ids, sectors):
+        sector_names = sorted({sectors.get(stock_id) or DEFAULT_SECTOR for stock_id in stock_ids})
+        position = {sector: index for index, sector in enumerate(sector_names)}
+        sector_index = [position[sectors.get(stock_id) or DEFAULT_SECTOR] for stock_id in stock_ids]
+        size = len(sector_names)
+        correlation = [[1.0 if i == j else self.market_correlation for j in range(size)] for i in range(size)]
+        lower = cholesky(correlation)
+        anchors = [self._anchors[stock_id] for stock_id in stock_ids]
+        if self.use_numpy:
+            return np.array(lower), np.array(sector_index, dtype=np.intp), np.array(anchors)
+        return lower, sector_index, anchors
+
+    def step(self, prices, sectors=None):
+        """New prices (paise) for every stock in prices, keyed like it"""
+        sectors = sectors or {}
+        stock_ids = sorted(prices)
+        if not stock_ids:
+            return {}
+        for stock_id in stock_ids:
+            if stock_id not in self._anchors:
+                self._anchors[stock_id] = math.log(max(1, prices[stock_id]))
+        layout_key = (stock_ids, [sectors.get(stock_id) for stock_id in stock_ids])
+        if layout_key != self._layout_key:
+            self._layout_key = layout_key
+            self._layout = self._build_layout(stock_ids, sectors)
+        lower, sector_index, anchors = self._layout
+        current = [prices[stock_id] for stock_id in stock_ids]
+        factor_weight = math.sqrt(self.sector_correlation)
+        own_weight = math.sqrt(1 - self.sector_correlation)
+        base = self.drift - self.volatility ** 2 / 2
+
+        if self.use_numpy:
+            shocks = self.rng.standard_normal(len(lower) + len(stock_ids))
+            factors = lower @ shocks[:len(lower)]
+            log_prices = np.log(np.maximum(1, np.array(current, dtype=np.float64)))
+            returns = (base + self.mean_reversion * (anchors - log_prices)
+                       + self.volatility * (factor_weight * factors[sector_index]
+                                            + own_weight * shocks[len(lower):]))
+            moved = np.maximum(1, np.rint(np.exp(log_prices + returns))).astype(np.int64).tolist()
+            return dict(zip(stock_ids, moved))
+
+        gauss = self.random.gauss
+        shocks = [gauss(0.0, 1.0) for _ in lower]
+        factors = [sum(row[k] * shocks[k] for k in range(i + 1)) for i, row in enumerate(lower)]
+        moved = {}
+        for stock_id, price, sector, anchor in zip(stock_ids, current, sector_index, anchors):
+            log_price = math.log(max(1, price))
+            change = (base + self.mean_reversion * (anchor - log_price)
+                      + self.volatility * (factor_weight * factors[sector] + own_weight * gauss(0.0, 1.0)))
+            moved[stock_id] = max(1, round(math.exp(log_price + change)))
+        return moved
+
+
+PRICE_MODELS = {
+    'uniform': lambda seed, **params: UniformPriceModel(seed=seed),
+    'gbm': lambda seed, **params: FactorPriceModel(volatility=params['volatility'], drift=params['drift'],
+                                                   market_correlation=0.0, sector_correlation=0.0, seed=seed),
+    'correlated': lambda seed, **params: FactorPriceModel(seed=seed, **params)
+}
+
+
+def create_price_model(name, seed=None, volatility=0.003, drift=0.0, mean_reversion=0.0,
+                       market_correlation=0.3, sector_correlation=0.5):
+    """Price model for ticks without trades: 'uniform', 'gbm' or 'correlated'"""
+    if name not in PRICE_MODELS:
+        raise ValueError(f'Unknown price model: {name}')
+    model = PRICE_MODELS[name](seed, volatility=volatility, drift=drift, mean_reversion=mean_reversion,
+                               market_correlation=market_correlation, sector_correlation=sector_correlation)
+    if isinstance(model, FactorPriceModel) and not model.use_numpy:
+        logger.warning("numpy is not installed: the %s price model runs in pure Python, "
+                       "which is only meant for development", name)
+    return model
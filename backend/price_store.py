@@ -0,0 +1,219 @@
+import json
+import logging
+import os
+import threading
+import time
+from array import array
+
+from money import percent_to_centi, to_paise
+
+logger = logging.getLogger(__name__)
+
+
+class PriceStore:
+    """
+    In-memory authoritative stock prices backed by an append-only tick journal.
+    Ticks are coalesced per stock and written to the database by flush(),
+    so a stock that moves ten times between flushes costs a single write.
+    Prices are integer paise and changes integer hundredths of a percent,
+    held in array columns indexed by a per-stock slot. An empty journal_path
+    keeps ticks in memory only, for read-only filesystems.
+    """
+
+    def __init__(self, writer, journal_path, flush_interval=30):
+        # writer receives a list of (stock_id, price paise, price change centi-percent) tuples
+        self._writer = writer
+        self._journal_path = journal_path
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._slots = {}                      # stock_id -> column index
+        self._ids = []                        # column index -> stock_id
+        self._price = array('q')              # latest price
+        self._change = array('q')             # latest price change
+        self._persisted_price = array('q')    # last price written to the database, -1 if unknown
+        self._persisted_change = array('q')
+        self._dirty = set()                   # slots waiting for the next flush
+        self._journal = None
+        self.stats = {'ticks': 0, 'flushes': 0, 'db_writes': 0, 'coalesced': 0}
+
+    def _slot(self, stock_id):
+        slot = self._slots.get(stock_id)
+        if slot is None:
+            slot = self._slots[stock_id] = len(self._ids)
+            self._ids.append(stock_id)
+            self._price.append(0)
+            self._change.append(0)
+            self._persisted_price.append(-1)
+            self._persisted_change.append(0)
+        return slot
+
+    def recover(self):
+        """
+        Replay the tick journal left by a previous process.
+        Every replayed price is marked dirty so the next flush persists it.
+        Returns the number of replayed ticks.
+        """
+        replayed = 0
+        if not self._journal_path:
+            return replayed
+        with self._lock:
+            if os.path.exists(self._journal_path):
+                with open(self._journal_path, 'r') as journal:
+                    for line in journal:
+                        try:
+                            tick = json.loads(line)
+                        except ValueError:
+                            # A torn final line from a crash mid-append
+                            logger.warning("Skipping corrupt price journal entry")
+                            continue
+                        price, change = tick['p'], tick['c']
+                        if isinstance(price, float):
+                            # Journals written before prices were fixed-point
+                            price, change = to_paise(price), percent_to_centi(change)
+                        slot = self._slot(tick['id'])
+                        self._price[slot] = price
+                        self._change[slot] = change
+                        self._dirty.add(slot)
+                        replayed += 1
+            self._open_journal()
+        if replayed:
+            logger.info(f"Recovered {replayed} price ticks for {len(self._dirty)} stocks from journal")
+        return replayed
+
+    def seed(self, stocks):
+        """
+        Load prices from Stock records for stocks the store does not know yet.
+        Prices recovered from the journal are newer than the database and win.
+        """
+        with self._lock:
+            for stock in stocks:
+                if stock.id in self._slots:
+                    continue
+                slot = self._slot(stock.id)
+                price = stock.current_price
+                change = stock.price_change
+                self._price[slot] = self._persisted_price[slot] = price
+                self._change[slot] = self._persisted_change[slot] = change
+
+    def get(self, stock_id, default=None):
+        """Return the latest price in paise for a stock, or default if it is unknown"""
+        slot = self._slots.get(stock_id)
+        return self._price[slot] if slot is not None else default
+
+    def get_change(self, stock_id, default=None):
+        """Return the latest price change in hundredths of a percent"""
+        slot = self._slots.get(stock_id)
+        return self._change[slot] if slot is not None else default
+
+    def set(self, stock_id, price, price_change):
+        """
+        Record a new price tick (paise, hundredths of a percent). The tick is
+        journaled immediately and the database write is deferred to the next flush.
+        """
+        with self._lock:
+            self.stats['ticks'] += 1
+            slot = self._slots.get(stock_id)
+            if slot is not None and self._price[slot] == price and self._change[slot] == price_change:
+                return
+            if slot is None:
+                slot = self._slot(stock_id)
+            self._price[slot] = price
+            self._change[slot] = price_change
+            self._append({'t': time.time(), 'id': stock_id, 'p': price, 'c': price_change})
+            if slot in self._dirty:
+                self.stats['coalesced'] += 1
+            if self._persisted_price[slot] == price and self._persisted_change[slot] == price_change:
+                # Moved back to what the database already holds
+                self._dirty.discard(slot)
+            else:
+                self._dirty.add(slot)
+
+    def apply(self, ticks):
+        """
+        Take (stock_id, price paise, change) ticks set by another process.
+        They are not journaled or flushed here; the process that set them
+        writes them.
+        """
+        with self._lock:
+            for stock_id, price, price_change in ticks:
+                slot = self._slot(stock_id)
+                self._price[slot] = price
+                self._change[slot] = price_change
+
+    def flush(self):
+        """
+        Write all dirty prices to the database in one batch.
+        Returns the number of stocks written.
+        """
+        with self._lock:
+            if not self._dirty:
+                return 0
+            slots = self._dirty
+            self._dirty = set()
+            batch = [(self._ids[slot], self._price[slot], self._change[slot]) for slot in slots]
+
+        try:
+            self._writer(batch)
+        except Exception as e:
+            logger.error(f"Price flush failed, will retry: {str(e)}")
+            with self._lock:
+                # The arrays already hold the newest values for these slots
+                self._dirty |= slots
+            return 0
+
+        with self._lock:
+            for stock_id, price, change in batch:
+                slot = self._slots[stock_id]
+                self._persisted_price[slot] = price
+                self._persisted_change[slot] = change
+            self.stats['flushes'] += 1
+            self.stats['db_writes'] += len(batch)
+            self._compact()
+        return len(batch)
+
+    def run_flusher(self, should_run=lambda: True, wait=None):
+        """
+        Background thread function to flush coalesced prices periodically.
+        wait(seconds) replaces time.sleep and returns False to stop early.
+        """
+        while should_run():
+            if wait is None:
+                time.sleep(self.flush_interval)
+            elif not wait(self.flush_interval):
+                break
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error in price flusher: {str(e)}")
+
+    def _open_journal(self):
+        directory = os.path.dirname(self._journal_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._journal = open(self._journal_path, 'a', buffering=1)
+
+    def _append(self, tick):
+        if not self._journal_path:
+            return
+        if self._journal is None:
+            self._open_journal()
+        self._journal.write(json.dumps(tick, separators=(',', ':')) + '\n')
+
+    def _compact(self):
+        """
+        Rewrite the journal so it only holds ticks that are still unflushed.
+        Must be called with the lock held.
+        """
+        if not self._journal_path:
+            return
+        if self._journal is not None:
+            self._journal.close()
+        tmp_path = self._journal_path + '.tmp'
+        with open(tmp_path, 'w') as journal:
+            for slot in self._dirty:
+                journal.write(json.dumps({'t': time.time(), 'id': self._ids[slot], 'p': self._price[slot],
+                                          'c': self._change[slot]}, separators=(',', ':')) + '\n')
+            journal.flush()
+            os.fsync(journal.fileno())
+        os.replace(tmp_path, self._journal_path)
+        self._open_journal()
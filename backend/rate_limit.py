@@ -0,0 +1,207 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600}
+
+
+class RateLimitRule:
+    __slots__ = ('endpoint', 'rate', 'burst', 'max_in_flight')
+
+    def __init__(self, endpoint, rate, burst, max_in_flight=None):
+        self.endpoint = endpoint
+        self.rate = rate                    # tokens added per second
+        self.burst = burst                  # bucket size
+        self.max_in_flight = max_in_flight  # concurrent requests admitted, None for no cap
+
+
+def parse_rules(limits, concurrency=''):
+    """
+    Parse RATE_LIMITS and ROUTE_CONCURRENCY into {endpoint: RateLimitRule}.
+    limits is 'place_order=5/s:10,get_leaderboard=30/m': COUNT per PERIOD
+    (s, m or h) with an optional burst that defaults to COUNT.
+    concurrency is 'get_leaderboard=4': requests in flight per process.
+    """
+    rules = {}
+    for item in (limits or '').split(','):
+        endpoint, _, spec = item.strip().partition('=')
+        if not endpoint or not spec:
+            continue
+        rate, _, burst = spec.partition(':')
+        count, _, period = rate.partition('/')
+        count = float(count)
+        rules[endpoint] = RateLimitRule(endpoint, count / PERIODS[period or 's'], float(burst or count))
+    for item in (concurrency or '').split(','):
+        endpoint, _, cap = item.strip().partition('=')
+        if not endpoint or not cap:
+            continue
+        rule = rules.setdefault(endpoint, RateLimitRule(endpoint, None, None))
+        rule.max_in_flight = int(cap)
+    return rules
+
+
+class MemoryBucketStore:
+    """Token buckets held by this process"""
+
+    name = 'memory'
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = {}      # key -> [tokens, updated_at, rate, burst]
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst, now):
+        """Take one token; returns (allowed, tokens left)"""
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self.max_keys:
+                    self._prune(now)
+                bucket = self._buckets[key] = [burst, now, rate, burst]
+            tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            allowed = tokens >= 1
+            bucket[0] = tokens - 1 if allowed else tokens
+            return allowed, bucket[0]
+
+    def _prune(self, now):
+        # Buckets that have refilled are the same as no bucket
+        full = [key for key, (tokens, updated_at, rate, burst) in self._buckets.items()
+                if tokens + (now - updated_at) * rate >= burst]
+        for key in full:
+            del self._buckets[key]
+
+    def size(self):
+        return len(self._buckets)
+
+
+# Refill and take atomically on the Redis server, timed by its clock so
+# every app process sees the same buckets
+TAKE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+local tokens = tonumber(bucket[1]) or burst
+local updated_at = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated_at) * rate)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return {allowed, tostring(tokens)}
+"""
+
+
+class RedisBucketStore:
+    """Token buckets shared by every process through Redis"""
+
+    name = 'redis'
+
+    def __init__(self, url, prefix='ratelimit:'):
+        # redis is optional and only needed for this backend
+        import redis
+
+        self._client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        self._take = self._client.register_script(TAKE_SCRIPT)
+        self.prefix = prefix
+        self._client.ping()
+
+    def take(self, key, rate, burst, now):
+        allowed, tokens = self._take(keys=[self.prefix + key], args=[rate, burst])
+        return bool(allowed), float(tokens)
+
+    def size(self):
+        return None
+
+
+def create_bucket_store(redis_url=None):
+    """
+    Shared Redis buckets when RATE_LIMIT_REDIS_URL is set and reachable,
+    otherwise per-process buckets
+    """
+    if redis_url:
+        try:
+            return RedisBucketStore(redis_url)
+        except Exception as e:
+            logger.error("Redis rate limit store unavailable, using per-process buckets: %s", e)
+    return MemoryBucketStore()
+
+
+class RateLimiter:
+    """
+    Admission control in front of the routes: a token bucket per route and
+    client, plus an optional cap on requests in flight per route. If the
+    shared store fails the request is let through rather than rejected.
+    """
+
+    def __init__(self, rules, store):
+        self.rules = rules
+        self.store = store
+        self._lock = threading.Lock()
+        self._in_flight = {endpoint: 0 for endpoint in rules}
+        self._counters = {endpoint: {'allowed': 0, 'limited': 0, 'shed': 0} for endpoint in rules}
+        self.store_errors = 0
+
+    def admit(self, endpoint, client_key):
+        """
+        Decide whether to serve a request. client_key is called only for
+        routes with a rate limit. Returns None when there is no rule for the
+        route, otherwise (status, retry_after seconds) where status is
+        'allowed', 'limited' (over the client's rate) or 'shed' (route busy).
+        """
+        rule = self.rules.get(endpoint)
+        if rule is None:
+            return None
+        if rule.rate:
+            try:
+                allowed, tokens = self.store.take(f'{endpoint}:{client_key()}', rule.rate, rule.burst,
+                                                  time.monotonic())
+            except Exception as e:
+                with self._lock:
+                    self.store_errors += 1
+                logger.warning("Rate limit store error, admitting request: %s", e)
+                allowed = True
+            if not allowed:
+                with self._lock:
+                    self._counters[endpoint]['limited'] += 1
+                return 'limited', (1 - tokens) / rule.rate
+        with self._lock:
+            if rule.max_in_flight is not None:
+                if self._in_flight[endpoint] >= rule.max_in_flight:
+                    self._counters[endpoint]['shed'] += 1
+                    return 'shed', 1.0
+                self._in_flight[endpoint] += 1
+            self._counters[endpoint]['allowed'] += 1
+        return 'allowed', 0.0
+
+    def release(self, endpoint):
+        """End a request admitted by admit()"""
+        rule = self.rules.get(endpoint)
+        if rule is not None and rule.max_in_flight is not None:
+            with self._lock:
+                self._in_flight[endpoint] -= 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'store': self.store.name,
+                'store_errors': self.store_errors,
+                'tracked_buckets': self.store.size(),
+                'routes': {
+                    endpoint: dict(
+                        self._counters[endpoint],
+                        in_flight=self._in_flight[endpoint],
+                        rate_per_second=rule.rate,
+                        burst=rule.burst,
+                        max_in_flight=rule.max_in_flight
+                    )
+                    for endpoint, rule in self.rules.items()
+                }
+            }
@@ -0,0 +1,179 @@
+"""
+Typed records for the rows the engines and routes work with. Rows are
+decoded once where they are read: amounts become integer paise, stock
+price changes hundredths of a percent, timestamps ISO text whichever
+backend read them, and ids and enum values are interned so the many orders
+of one user or stock share a single string. Columns a query did not select
+are None. Each record lists the columns it needs as COLUMNS, for narrow
+PostgREST projections.
+"""
+import sys
+
+from money import paise_str, to_paise
+
+_intern = sys.intern
+
+
+def _text(value):
+    return None if value is None else _intern(str(value))
+
+
+def _timestamp(value):
+    if value is None or isinstance(value, str):
+        return value
+    return value.isoformat()
+
+
+def _paise(value):
+    return None if value is None or value == '' else to_paise(value)
+
+
+class Order:
+    """A row of orders; price in paise"""
+
+    __slots__ = ('id', 'user_id', 'stock_id', 'type', 'quantity', 'price', 'status',
+                 'time_in_force', 'expires_at', 'created_at')
+
+    COLUMNS = 'id, user_id, stock_id, type, quantity, price, status, time_in_force, expires_at, created_at'
+
+    def __init__(self, id, user_id=None, stock_id=None, type=None, quantity=None, price=None,
+                 status=None, time_in_force=None, expires_at=None, created_at=None):
+        self.id = id
+        self.user_id = user_id
+        self.stock_id = stock_id
+        self.type = type
+        self.quantity = quantity
+        self.price = price
+        self.status = status
+        self.time_in_force = time_in_force
+        self.expires_at = expires_at
+        self.created_at = created_at
+
+    @classmethod
+    def from_row(cls, row):
+        get = row.get
+        return cls(
+            row['id'],
+            _text(get('user_id')),
+            _text(get('stock_id')),
+            _text(get('type')),
+            get('quantity'),
+            _paise(get('price')),
+            _text(get('status')),
+            _text(get('time_in_force')),
+            _timestamp(get('expires_at')),
+            _timestamp(get('created_at'))
+        )
+
+    def to_row(self):
+        """The orders row, price as exact decimal text; also what the shard queue and checkpoint store"""
+        return {
+            'id': self.id,
+            'user_id': self.user_id,
+            'stock_id': self.stock_id,
+            'type': self.type,
+            'quantity': self.quantity,
+            'price': paise_str(self.price) if self.price is not None else None,
+            'status': self.status,
+            'time_in_force': self.time_in_force,
+            'expires_at': self.expires_at,
+            'created_at': self.created_at
+        }
+
+
+class Stock:
+    """A row of stocks; current_price in paise, price_change in hundredths of a percent"""
+
+    __slots__ = ('id', 'symbol', 'name', 'current_price', 'price_change', 'sector', 'min_price', 'max_price')
+
+    COLUMNS = 'id, symbol, name, current_price, price_change, sector'
+
+    def __init__(self, id, symbol=None, name=None, current_price=None, price_change=0, sector=None,
+                 min_price=None, max_price=None):
+        self.id = id
+        self.symbol = symbol
+        self.name = name
+        self.current_price = current_price
+        self.price_change = price_change
+        self.sector = sector
+        self.min_price = min_price
+        self.max_price = max_price
+
+    @classmethod
+    def from_row(cls, row):
+        get = row.get
+        return cls(
+            _text(row['id']),
+            get('symbol'),
+            get('name'),
+            _paise(get('current_price')),
+            # DECIMAL(5, 2) percent: two implied decimals, like paise
+            _paise(get('price_change')) or 0,
+            _text(get('sector')),
+            # Optional price bands, only on tables that have the columns
+            _paise(get('min_price')),
+            _paise(get('max_price'))
+        )
+
+
+class Holding:
+    """A row of user_stocks, with its embedded stocks row when selected; amounts in paise"""
+
+    __slots__ = ('id', 'user_id', 'stock_id', 'quantity', 'cost_basis', 'realized_pnl', 'stock')
+
+    COLUMNS = 'id, user_id, stock_id, quantity, cost_basis, realized_pnl'
+
+    def __init__(self, id=None, user_id=None, stock_id=None, quantity=0, cost_basis=0, realized_pnl=0, stock=None):
+        self.id = id
+        self.user_id = user_id
+        self.stock_id = stock_id
+        self.quantity = quantity
+        self.cost_basis = cost_basis
+        self.realized_pnl = realized_pnl
+        self.stock = stock
+
+    @classmethod
+    def from_row(cls, row):
+        get = row.get
+        stock = get('stocks')
+        return cls(
+            get('id'),
+            _text(get('user_id')),
+            _text(get('stock_id')),
+            get('quantity') or 0,
+            _paise(get('cost_basis')) or 0,
+            _paise(get('realized_pnl')) or 0,
+            Stock.from_row(stock) if stock else None
+        )
+
+
+class Profile:
+    """A row of profiles; amounts in paise"""
+
+    __slots__ = ('user_id', 'email', 'role', 'balance', 'realized_pnl')
+
+    COLUMNS = 'user_id, email, role, balance, realized_pnl'
+
+    def __init__(self, user_id, email=None, role=None, balance=0, realized_pnl=0):
+        self.user_id = user_id
+        self.email = email
+        self.role = role
+        self.balance = balance
+        self.realized_pnl = realized_pnl
+
+    @classmethod
+    def from_row(cls, row):
+        get = row.get
+        return cls(
+            _text(row['user_id']),
+            get('email'),
+            _text(get('role')),
+            _paise(get('balance')) or 0,
+            _paise(get('realized_pnl')) or 0
+        )
+
+
+def decode(record, rows):
+    """Records for a list of rows"""
+    from_row = record.from_row
+    return [from_row(row) for row in rows]
@@ -5,6 +5,7 @@ CREATE TABLE profiles (
     email TEXT UNIQUE NOT NULL,
     role TEXT NOT NULL DEFAULT 'user' CHECK (role IN ('admin', 'user')),
     balance DECIMAL(20, 2) NOT NULL DEFAULT 10000.00,
+    realized_pnl DECIMAL(20, 2) NOT NULL DEFAULT 0,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
 
@@ -40,6 +41,7 @@ CREATE TABLE stocks (
     symbol TEXT NOT NULL UNIQUE,
     current_price DECIMAL(15, 2) NOT NULL,
     price_change DECIMAL(5, 2) NOT NULL DEFAULT 0.00,
+    sector TEXT,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
 
@@ -52,6 +54,8 @@ CREATE TABLE orders (
     quantity INTEGER NOT NULL CHECK (quantity > 0),
     price DECIMAL(15, 2) NOT NULL CHECK (price > 0),
     status TEXT NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'completed', 'cancelled')),
+    time_in_force TEXT NOT NULL DEFAULT 'DAY' CHECK (time_in_force IN ('DAY', 'GTC', 'IOC', 'GTD')),
+    expires_at TIMESTAMP WITH TIME ZONE,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
 
@@ -61,6 +65,8 @@ CREATE TABLE user_stocks (
     user_id UUID REFERENCES profiles(user_id),
     stock_id UUID REFERENCES stocks(id),
     quantity INTEGER NOT NULL CHECK (quantity > 0),
+    cost_basis DECIMAL(20, 2) NOT NULL DEFAULT 0,
+    realized_pnl DECIMAL(20, 2) NOT NULL DEFAULT 0,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
     UNIQUE(user_id, stock_id)
 );
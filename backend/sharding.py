@@ -0,0 +1,230 @@
+import bisect
+import hashlib
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+def ring_hash(value):
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), 'big')
+
+
+class HashRing:
+    """
+    Consistent hash ring of matcher nodes. Each node gets vnodes points on
+    the ring and a stock belongs to the first node point at or after its
+    hash, so a node joining or leaving only moves about 1/N of the stocks.
+    """
+
+    def __init__(self, nodes=(), vnodes=128):
+        self.vnodes = vnodes
+        self._points = []       # sorted ring positions
+        self._owners = []       # node at each position
+        self.nodes = []
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node):
+        if node in self.nodes:
+            return
+        bisect.insort(self.nodes, node)
+        for i in range(self.vnodes):
+            point = ring_hash(f'{node}#{i}')
+            index = bisect.bisect_left(self._points, point)
+            self._points.insert(index, point)
+            self._owners.insert(index, node)
+
+    def remove(self, node):
+        if node not in self.nodes:
+            return
+        self.nodes.remove(node)
+        kept = [(point, owner) for point, owner in zip(self._points, self._owners) if owner != node]
+        self._points = [point for point, _ in kept]
+        self._owners = [owner for _, owner in kept]
+
+    def owner(self, key):
+        if not self._points:
+            return None
+        index = bisect.bisect_left(self._points, ring_hash(str(key)))
+        return self._owners[index % len(self._points)]
+
+
+class MemoryShardQueue:
+    """Per-node order queues inside one process"""
+
+    def __init__(self):
+        self._queues = {}
+        self._lock = threading.Lock()
+
+    def put(self, node, message):
+        with self._lock:
+            node_queue = self._queues.setdefault(node, queue.SimpleQueue())
+        node_queue.put(message)
+
+    def drain(self, node, limit=None):
+        node_queue = self._queues.get(node)
+        messages = []
+        while node_queue is not None and (limit is None or len(messages) < limit):
+            try:
+                messages.append(node_queue.get_nowait())
+            except queue.Empty:
+                break
+        return messages
+
+
+class SpoolShardQueue:
+    """
+    Per-node order queues in a directory shared by the processes on one
+    machine. A message is written under tmp/ and renamed into the node's
+    directory, so readers never see partial messages; a reader claims a
+    message by renaming it back out, so two readers never both get it.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._tmp = os.path.join(directory, 'tmp')
+        os.makedirs(self._tmp, exist_ok=True)
+
+    def put(self, node, message):
+        node_dir = os.path.join(self.directory, node)
+        os.makedirs(node_dir, exist_ok=True)
+        # Time-ordered names keep orders roughly first in, first out
+        name = f'{time.time_ns():020d}-{uuid.uuid4().hex}.json'
+        tmp_path = os.path.join(self._tmp, name)
+        with open(tmp_path, 'w') as f:
+            json.dump(message, f, separators=(',', ':'))
+        os.replace(tmp_path, os.path.join(node_dir, name))
+
+    def drain(self, node, limit=None):
+        node_dir = os.path.join(self.directory, node)
+        try:
+            names = sorted(os.listdir(node_dir))
+        except FileNotFoundError:
+            return []
+        messages = []
+        for name in names[:limit]:
+            claimed = os.path.join(self._tmp, f'claimed-{uuid.uuid4().hex}')
+            try:
+                os.rename(os.path.join(node_dir, name), claimed)
+            except FileNotFoundError:
+                continue
+            with open(claimed, 'r') as f:
+                messages.append(json.load(f))
+            os.remove(claimed)
+        return messages
+
+
+def create_shard_queue(kind, directory):
+    """Create the order queue matcher nodes read from: 'spool' (default) or 'memory'"""
+    if kind == 'memory':
+        return MemoryShardQueue()
+    return SpoolShardQueue(os.path.join(directory, 'queues'))
+
+
+class ShardMembership:
+    """
+    Matcher nodes on one machine announce themselves with heartbeat files in
+    a shared directory and split stocks with a consistent hash ring of the
+    live ones. A node whose heartbeat is older than ttl has left.
+
+    A node only takes over a stock handoff_delay seconds after it gained
+    it, giving the previous owner time to notice the change and finish the
+    stock in flight, so two nodes never match the same stock at once.
+    """
+
+    def __init__(self, directory, node_id, ttl=15, vnodes=128, handoff_delay=None):
+        self.directory = os.path.join(directory, 'nodes')
+        self.node_id = node_id
+        self.ttl = ttl
+        self.vnodes = vnodes
+        self.handoff_delay = ttl if handoff_delay is None else handoff_delay
+        self.ring = HashRing(vnodes=vnodes)
+        self._previous_ring = HashRing(vnodes=vnodes)
+        self._changed_at = 0.0
+        self._refreshed_at = 0.0
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def heartbeat(self):
+        """Announce this node and pick up nodes that joined or left"""
+        path = os.path.join(self.directory, f'{self.node_id}.json')
+        with open(path + '.tmp', 'w') as f:
+            json.dump({'node': self.node_id, 'pid': os.getpid(), 'beat_at': time.time()}, f)
+        os.replace(path + '.tmp', path)
+        self.refresh()
+
+    def refresh(self):
+        """Rebuild the ring from the heartbeat files of live nodes"""
+        now = time.time()
+        live = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.directory, name), 'r') as f:
+                    beat = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if now - beat.get('beat_at', 0) <= self.ttl:
+                live.append(beat['node'])
+        with self._lock:
+            self._refreshed_at = now
+            if sorted(live) != self.ring.nodes:
+                logger.info("Matcher nodes changed: %s -> %s", self.ring.nodes, sorted(live))
+                self._previous_ring = self.ring
+                self.ring = HashRing(live, self.vnodes)
+                self._changed_at = now
+
+    def leave(self, shard_queue=None):
+        """
+        Remove this node from the ring and hand the orders still queued for
+        it to the nodes that own their stocks now
+        """
+        try:
+            os.remove(os.path.join(self.directory, f'{self.node_id}.json'))
+        except FileNotFoundError:
+            pass
+        self.refresh()
+        if shard_queue is None:
+            return 0
+        moved = 0
+        for message in shard_queue.drain(self.node_id):
+            # With no nodes left the orders stay pending in the database
+            # for the next node's full order book resync
+            owner = self.ring.owner(message['stock_id'])
+            if owner is not None and owner != self.node_id:
+                shard_queue.put(owner, message)
+                moved += 1
+        if moved:
+            logger.info("Handed %s queued orders to other matcher nodes", moved)
+        return moved
+
+    def owner(self, stock_id):
+        """Node that orders for a stock should be routed to"""
+        if time.time() - self._refreshed_at > self.ttl / 3:
+            self.refresh()
+        return self.ring.owner(stock_id)
+
+    def owns(self, stock_id):
+        """Whether this node should match a stock now"""
+        with self._lock:
+            if self.ring.owner(stock_id) != self.node_id:
+                return False
+            if time.time() - self._changed_at >= self.handoff_delay:
+                return True
+            # Recently gained stocks wait out the handoff delay
+            return self._previous_ring.owner(stock_id) == self.node_id
+
+    def status(self):
+        return {
+            'node': self.node_id,
+            'nodes': self.ring.nodes,
+            'changed_at': self._changed_at,
+            'handoff_delay': self.handoff_delay
+        }
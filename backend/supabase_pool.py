@@ -0,0 +1,247 @@
+import logging
+import threading
+import time
+from functools import lru_cache
+
+import httpx
+from gotrue.http_clients import SyncClient as GoTrueSyncClient
+from postgrest import SyncPostgrestClient
+from postgrest.utils import SyncClient
+from supabase import Client
+from supabase.lib.auth_client import SupabaseAuthClient
+from supabase.lib.client_options import ClientOptions
+
+logger = logging.getLogger(__name__)
+
+# Transports by pool name, for metrics
+POOLS = {}
+
+
+@lru_cache(maxsize=None)
+def shared_ssl_context():
+    """
+    One verifying SSL context for every pool and auth client; loading the CA
+    bundle takes tens of milliseconds each time, which adds up on a cold start
+    """
+    return httpx.create_ssl_context()
+
+
+class CircuitOpenError(httpx.TransportError):
+    """Raised instead of sending a request while a pool's circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """
+    Opens after a run of consecutive failures and fails requests fast until
+    reset_timeout has passed, then lets a single trial request through.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self.times_opened = 0
+
+    @property
+    def state(self):
+        if self._opened_at is None:
+            return 'closed'
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def before_request(self, pool_name):
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return
+            if state == 'half-open' and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return
+        raise CircuitOpenError(f"Database pool '{pool_name}' is unavailable (circuit open)")
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_flight or self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    self.times_opened += 1
+                self._opened_at = time.monotonic()
+                self._trial_in_flight = False
+
+
+class PooledTransport(httpx.BaseTransport):
+    """
+    HTTP transport with a bounded keep-alive connection pool, a circuit
+    breaker and saturation / wait-time metrics.
+    """
+
+    def __init__(self, name, max_connections=10, keepalive_expiry=30, http2=False,
+                 pool_timeout=5, breaker=None):
+        self.name = name
+        self.max_connections = max_connections
+        self.pool_timeout = pool_timeout
+        self.breaker = breaker or CircuitBreaker()
+        self._transport = httpx.HTTPTransport(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+                keepalive_expiry=keepalive_expiry
+            ),
+            http2=http2,
+            verify=shared_ssl_context()
+        )
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._stats = {
+            'requests': 0,
+            'failures': 0,
+            'rejected': 0,
+            'saturated': 0,
+            'wait_total_ms': 0.0,
+            'wait_max_ms': 0.0,
+            'peak_in_flight': 0
+        }
+
+    def handle_request(self, request):
+        self.breaker.before_request(self.name)
+
+        started = time.perf_counter()
+        if not self._slots.acquire(blocking=False):
+            # Every connection is busy; wait for one up to the pool timeout
+            with self._lock:
+                self._stats['saturated'] += 1
+            if not self._slots.acquire(timeout=self.pool_timeout):
+                with self._lock:
+                    self._stats['rejected'] += 1
+                raise httpx.PoolTimeout(f"Database pool '{self.name}' exhausted", request=request)
+        waited_ms = (time.perf_counter() - started) * 1000
+
+        with self._lock:
+            self._in_flight += 1
+            self._stats['requests'] += 1
+            self._stats['wait_total_ms'] += waited_ms
+            self._stats['wait_max_ms'] = max(self._stats['wait_max_ms'], waited_ms)
+            self._stats['peak_in_flight'] = max(self._stats['peak_in_flight'], self._in_flight)
+
+        try:
+            response = self._transport.handle_request(request)
+            # Read the body while holding the slot so the connection returns to the pool
+            response.read()
+        except httpx.TransportError:
+            with self._lock:
+                self._stats['failures'] += 1
+            self.breaker.record_failure()
+            raise
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+            self._slots.release()
+
+        if response.status_code >= 500:
+            with self._lock:
+                self._stats['failures'] += 1
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return response
+
+    def close(self):
+        # The pool lives as long as the process; postgrest drops and recreates
+        # its httpx session on auth events and must not close the shared pool
+        pass
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self._stats)
+            in_flight = self._in_flight
+        requests = stats['requests']
+        return {
+            'max_connections': self.max_connections,
+            'in_flight': in_flight,
+            'saturation': round(in_flight / self.max_connections, 3),
+            'circuit': self.breaker.state,
+            'circuit_opened': self.breaker.times_opened,
+            'requests': requests,
+            'failures': stats['failures'],
+            'rejected': stats['rejected'],
+            'saturated': stats['saturated'],
+            'peak_in_flight': stats['peak_in_flight'],
+            'wait_avg_ms': round(stats['wait_total_ms'] / requests, 3) if requests else 0.0,
+            'wait_max_ms': round(stats['wait_max_ms'], 3)
+        }
+
+
+class PooledPostgrestClient(SyncPostgrestClient):
+    def __init__(self, base_url, transport, **kwargs):
+        self._transport = transport
+        super().__init__(base_url, **kwargs)
+
+    def create_session(self, base_url, headers, timeout):
+        return SyncClient(base_url=base_url, headers=headers, timeout=timeout, transport=self._transport)
+
+
+class PooledClient(Client):
+    """Supabase client whose PostgREST requests go through a PooledTransport"""
+
+    def __init__(self, supabase_url, supabase_key, options, transport):
+        self.transport = transport
+        super().__init__(supabase_url, supabase_key, options)
+
+    def _init_postgrest_client(self, rest_url, headers, schema, timeout):
+        return PooledPostgrestClient(rest_url, self.transport, headers=headers, schema=schema, timeout=timeout)
+
+    @staticmethod
+    def _init_supabase_auth_client(auth_url, client_options):
+        return SupabaseAuthClient(
+            url=auth_url,
+            auto_refresh_token=client_options.auto_refresh_token,
+            persist_session=client_options.persist_session,
+            storage=client_options.storage,
+            headers=client_options.headers,
+            flow_type=client_options.flow_type,
+            http_client=GoTrueSyncClient(verify=shared_ssl_context())
+        )
+
+
+def create_pooled_client(name, supabase_url, supabase_key, max_connections=10, timeout=10,
+                         connect_timeout=3, pool_timeout=5, keepalive_expiry=30, http2=False,
+                         failure_threshold=5, reset_timeout=30):
+    """
+    Create a Supabase client with its own named connection pool
+    """
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            logger.warning("HTTP/2 requested but the h2 package is not installed, using HTTP/1.1")
+            http2 = False
+
+    transport = PooledTransport(
+        name,
+        max_connections=max_connections,
+        keepalive_expiry=keepalive_expiry,
+        http2=http2,
+        pool_timeout=pool_timeout,
+        breaker=CircuitBreaker(failure_threshold, reset_timeout)
+    )
+    options = ClientOptions(
+        postgrest_client_timeout=httpx.Timeout(timeout, connect=connect_timeout, pool=pool_timeout)
+    )
+    POOLS[name] = transport
+    return PooledClient(supabase_url, supabase_key, options, transport)
+
+
+def pool_metrics():
+    """Return metrics for every named pool"""
+    return {name: transport.metrics() for name, transport in POOLS.items()}
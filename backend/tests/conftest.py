@@ -0,0 +1,34 @@
+import os
+import sys
+
+import pytest
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path[:0] = [BACKEND_DIR, os.path.join(BACKEND_DIR, 'benchmarks')]
+
+# app.py reads its configuration on import: no background engines, rate
+# limits or files on disk, and the in-memory Supabase stand-in for storage
+os.environ.update({
+    'SUPABASE_URL': 'http://localhost:54321',
+    'SUPABASE_KEY': 'test.test.test',
+    'START_BACKGROUND_ENGINES': 'false',
+    'LOG_LEVEL': 'WARNING',
+    'LOG_ASYNC': 'false',
+    'RATE_LIMITS': '',
+    'ROUTE_CONCURRENCY': '',
+    'TRADE_LOG_DIR': '',
+    'PRICE_JOURNAL_PATH': '',
+    'CACHE_BUS': 'off',
+})
+
+
+@pytest.fixture
+def market():
+    """The app module and a fresh in-memory database behind it"""
+    import app as trading_app
+    from memory_supabase import MemorySupabase, attach
+
+    db = MemorySupabase()
+    attach(trading_app, db)
+    trading_app.order_book.rebuild([])
+    return trading_app, db
@@ -0,0 +1,108 @@
+"""
+Property test: random trades through the real settlement code conserve
+cash and shares exactly.
+
+Orders go through buy_stock, sell_stock, IOC and resting orders matched by
+match_stock/process_order, against the in-memory Supabase stand-in, at
+random paise prices. Afterwards every profile balance must equal its
+starting balance minus its filled buys plus its filled sells, every
+holding the net filled quantity, and the in-memory ledger must agree with
+both. MONEY_CONSERVATION_TRADES scales the run (e.g. to 1000000).
+"""
+import os
+import random
+
+import jwt
+import pytest
+
+from money import to_paise
+
+TRADES = int(os.getenv('MONEY_CONSERVATION_TRADES', '400'))
+USERS = 12
+SYMBOLS = 4
+STARTING_BALANCE = 250_000
+
+
+def fill_amount(order):
+    """Paise moved by a completed order: the matcher records executed_price, direct trades the price"""
+    price = order.get('executed_price') or order['price']
+    return to_paise(price) * order['quantity']
+
+
+def expected_books(db, starting_cash):
+    cash = dict(starting_cash)
+    shares = {}
+    for order in db.tables['orders']:
+        if order['status'] != 'completed':
+            continue
+        sign = -1 if order['type'] == 'buy' else 1
+        cash[order['user_id']] += sign * fill_amount(order)
+        key = (order['user_id'], order['stock_id'])
+        shares[key] = shares.get(key, 0) - sign * order['quantity']
+    return cash, {key: quantity for key, quantity in shares.items() if quantity}
+
+
+def check_conserved(app, db, starting_cash):
+    cash, shares = expected_books(db, starting_cash)
+    balances = {profile['user_id']: to_paise(profile['balance']) for profile in db.tables['profiles']}
+    holdings = {(row['user_id'], row['stock_id']): row['quantity'] for row in db.tables['user_stocks']
+                if row['quantity']}
+    assert balances == cash
+    assert holdings == shares
+    assert all(balance >= 0 for balance in balances.values())
+    assert all(quantity > 0 for quantity in holdings.values())
+
+    pending = {}
+    for order in db.tables['orders']:
+        if order['status'] == 'pending' and order['type'] == 'buy':
+            pending[order['user_id']] = pending.get(order['user_id'], 0) + to_paise(order['price']) * order['quantity']
+    for user_id in balances:
+        account = app.ledger.get_account(user_id)
+        if account is None:
+            continue
+        assert account.cash == balances[user_id]
+        assert account.shares == {stock_id: quantity for (owner, stock_id), quantity in holdings.items()
+                                  if owner == user_id}
+        assert account.reserved_cash == pending.get(user_id, 0)
+
+
+@pytest.mark.parametrize('seed', [1, 2])
+def test_settlement_conserves_cash_and_shares(market, seed):
+    app, db = market
+    rng = random.Random(seed)
+    stocks = [db.add_stock(f'SYM{n}', 100 + n) for n in range(SYMBOLS)]
+    users = [db.add_user(f'user{n}@example.com', STARTING_BALANCE) for n in range(USERS)]
+    starting_cash = {user['user_id']: to_paise(STARTING_BALANCE) for user in users}
+    headers = {user['user_id']: {'Authorization': 'Bearer ' + jwt.encode({'user_id': user['user_id']},
+                                                                          app.JWT_SECRET, algorithm='HS256')}
+               for user in users}
+    client = app.app.test_client()
+
+    for trade in range(TRADES):
+        stock_id = rng.choice(stocks)['id']
+        user_id = rng.choice(users)['user_id']
+        side = rng.choice(('buy', 'sell'))
+        quantity = rng.randint(1, 20)
+        # Odd paise prices, so every amount exercises the fixed-point path
+        app.price_store.set(stock_id, rng.randrange(5_000, 200_000), 0)
+
+        path = rng.random()
+        if path < 0.4:
+            response = client.post(f'/api/stocks/{side}', json={'stock_id': stock_id, 'quantity': quantity},
+                                   headers=headers[user_id])
+        else:
+            time_in_force = 'IOC' if path < 0.6 else 'GTC'
+            response = client.post('/api/orders', json={'stock_id': stock_id, 'type': side, 'quantity': quantity,
+                                                        'time_in_force': time_in_force}, headers=headers[user_id])
+        # Rejections (no funds, no shares) are part of the property: they must move nothing
+        assert response.status_code in (200, 400), response.get_json()
+
+        if trade % 25 == 24:
+            for stock in stocks:
+                pending_orders = app.engine_store.pending_orders(stock['id'])
+                if pending_orders:
+                    app.match_stock(stock['id'], app.stock_price(app.Stock.from_row(stock)), pending_orders)
+            check_conserved(app, db, starting_cash)
+
+    check_conserved(app, db, starting_cash)
+    assert any(order['status'] == 'completed' and order['type'] == 'sell' for order in db.tables['orders'])
@@ -0,0 +1,115 @@
+import math
+import threading
+import time
+
+
+class TimingWheel:
+    """
+    Hierarchical timing wheel: levels of slots ticks wide, each level's slot
+    spanning a whole turn of the level below. An entry goes into the
+    coarsest level that still resolves its deadline and moves down a level
+    each time the wheel reaches its slot, so scheduling, cancelling and
+    expiring are O(1) amortized however many entries are pending.
+    Deadlines past the top level's horizon wait in an overflow list.
+    Deadlines are epoch seconds, rounded up to a whole tick.
+    """
+
+    def __init__(self, tick=1.0, slots=64, levels=4, clock=time.time):
+        self.tick = tick
+        self.slots = slots
+        self.levels = levels
+        self.clock = clock
+        self._wheels = [[{} for _ in range(slots)] for _ in range(levels)]   # slot: key -> (due tick, value)
+        self._overflow = {}
+        self._location = {}     # key -> the dict holding it
+        self._due = {}          # scheduled at or before the current tick
+        self._lock = threading.Lock()
+        self.current = int(clock() // tick)
+        self.expired = 0
+
+    def __len__(self):
+        return len(self._location)
+
+    def _place(self, key, due, value):
+        delta = due - self.current
+        span = self.slots
+        for level in range(self.levels):
+            if delta <= 0:
+                slot = self._due
+                break
+            if delta < span:
+                slot = self._wheels[level][(due // (span // self.slots)) % self.slots]
+                break
+            span *= self.slots
+        else:
+            slot = self._overflow
+        slot[key] = (due, value)
+        self._location[key] = slot
+
+    def schedule(self, key, deadline, value=None):
+        """Expire key at deadline, replacing any earlier schedule for it"""
+        due = math.ceil(deadline / self.tick)
+        with self._lock:
+            slot = self._location.pop(key, None)
+            if slot is not None:
+                del slot[key]
+            self._place(key, due, value)
+
+    def cancel(self, key):
+        with self._lock:
+            slot = self._location.pop(key, None)
+            if slot is not None:
+                del slot[key]
+            return slot is not None
+
+    def _cascade(self, slot):
+        entries = list(slot.items())
+        slot.clear()
+        for key, (due, value) in entries:
+            self._place(key, due, value)
+
+    def _take_due(self, expired):
+        for key, (_, value) in self._due.items():
+            del self._location[key]
+            expired.append((key, value))
+        self._due.clear()
+
+    def advance(self, now=None):
+        """Move the wheel up to now and return (key, value) for every entry that came due"""
+        target = int((self.clock() if now is None else now) // self.tick)
+        with self._lock:
+            expired = []
+            self._take_due(expired)
+            while self.current < target:
+                self.current += 1
+                # At the start of a higher level slot, spread its entries
+                # over the levels below, coarsest first
+                if self.current % self.slots ** self.levels == 0 and self._overflow:
+                    self._cascade(self._overflow)
+                top = 1
+                while top < self.levels and self.current % self.slots ** top == 0:
+                    top += 1
+                for level in range(top - 1, 0, -1):
+                    span = self.slots ** level
+                    slot = self._wheels[level][(self.current // span) % self.slots]
+                    if slot:
+                        self._cascade(slot)
+                slot = self._wheels[0][self.current % self.slots]
+                if slot:
+                    for key, (_, value) in slot.items():
+                        del self._location[key]
+                        expired.append((key, value))
+                    slot.clear()
+                self._take_due(expired)
+            self.expired += len(expired)
+            return expired
+
+    def entries(self):
+        """Return (key, deadline, value) for every pending entry, deadlines rounded up to a tick"""
+        with self._lock:
+            return [(key, slot[key][0] * self.tick, slot[key][1]) for key, slot in self._location.items()]
+
+    def stats(self):
+        with self._lock:
+            return {'pending': len(self._location), 'overflow': len(self._overflow),
+                    'expired': self.expired, 'tick': self.tick}
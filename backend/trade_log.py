@@ -0,0 +1,488 @@
+import logging
+import os
+import re
+import struct
+import sys
+import threading
+import time
+import uuid
+from array import array
+
+try:
+    import fcntl
+except ImportError:     # Windows: no advisory locks, one writer is assumed
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Event kinds
+FILL = 1        # order executed: share and cash deltas for the user
+DEPOSIT = 2     # cash paid in or out, including opening balances
+CANCEL = 3      # order cancelled; no balance change, kept for the audit trail
+OPEN = 4        # opening share position of an account that predates the log
+
+KIND_NAMES = {FILL: 'fill', DEPOSIT: 'deposit', CANCEL: 'cancel', OPEN: 'open'}
+
+# Every event is eight native int64s:
+# kind, user, stock, share delta, cash delta (paise), order id high/low, time (us)
+FIELDS = 8
+RECORD_SIZE = FIELDS * 8
+RECORD = struct.Struct(f'={FIELDS}q')
+
+SNAPSHOT_MAGIC = b'TLSNAP01'
+# magic, byte order, seq, user ids, stock ids, accounts, positions; then the
+# columns user, cash, opened for accounts and key, quantity for positions
+SNAPSHOT_HEADER = struct.Struct('<8sBQQQQQ')
+
+SEGMENT_NAME = re.compile(r'^events-(\d{12})\.bin$')
+SNAPSHOT_NAME = re.compile(r'^snapshot-(\d{12})\.bin$')
+
+
+def _order_halves(order_id):
+    if not order_id:
+        return 0, 0
+    raw = uuid.UUID(str(order_id)).bytes
+    return int.from_bytes(raw[:8], 'big', signed=True), int.from_bytes(raw[8:], 'big', signed=True)
+
+
+def _order_id(high, low):
+    if not high and not low:
+        return None
+    return str(uuid.UUID(bytes=high.to_bytes(8, 'big', signed=True) + low.to_bytes(8, 'big', signed=True)))
+
+
+def _position_key(user, stock):
+    return (user << 32) | stock
+
+
+def _position_stock(key):
+    return key & 0xFFFFFFFF
+
+
+class TradeLog:
+    """
+    Append-only log of fills, deposits and cancellations, the event-sourced
+    record of every balance change the app makes. Events are fixed-width
+    binary records in segment files of segment_events each; user and stock
+    ids are interned in ids.log. Every snapshot_every events the balances
+    and positions are compacted into a columnar snapshot, so a restart
+    loads the newest snapshot and replays only the tail after it.
+
+    Balances are in paise. Accounts are only complete once they are opened
+    with a deposit or open_account(); fills for accounts the log has never
+    seen opened are recorded but not trusted for warm-up.
+    """
+
+    def __init__(self, directory, segment_events=1_000_000, snapshot_every=100_000, prune=False):
+        self.directory = directory
+        self.segment_events = segment_events
+        self.snapshot_every = snapshot_every
+        self.prune = prune        # delete segments older than the kept snapshots
+        self._lock = threading.RLock()
+        self._opened = False
+        self._users = []          # index -> user id
+        self._user_index = {}
+        self._stocks = []
+        self._stock_index = {}
+        self._ids_file = None
+        self._lock_file = None
+        self._segment = None
+        self._segment_count = 0
+        self._seq = 0             # events written so far
+        self._snapshot_seq = 0
+        self._cash = {}           # user index -> paise
+        self._positions = {}      # _position_key(user, stock) -> quantity
+        self._anchored = set()    # user indexes with an opening balance
+        self.recovery = {}
+
+    # Recovery
+
+    def recover(self):
+        """
+        Rebuild balances from the newest readable snapshot plus the events
+        after it and open the log for appending. Safe to call more than once.
+        """
+        with self._lock:
+            if self._opened:
+                return self.recovery
+            started = time.perf_counter()
+            os.makedirs(self.directory, exist_ok=True)
+            self._acquire_directory()
+            self._load_ids()
+            self._load_latest_snapshot()
+            replayed = self._replay_tail()
+            self._open_segment()
+            self._opened = True
+            self.recovery = {
+                'snapshot_seq': self._snapshot_seq,
+                'replayed': replayed,
+                'seq': self._seq,
+                'accounts': len(self._anchored),
+                'seconds': round(time.perf_counter() - started, 3)
+            }
+            logger.info("Trade log recovered to event %s from snapshot %s and %s tail events in %.3fs",
+                        self._seq, self._snapshot_seq, replayed, self.recovery['seconds'])
+            return self.recovery
+
+    def _acquire_directory(self):
+        # Two processes appending to the same segments would interleave records
+        self._lock_file = open(os.path.join(self.directory, 'LOCK'), 'a')
+        if fcntl is None:
+            return
+        try:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self._lock_file.close()
+            raise RuntimeError(f'Trade log {self.directory} is in use by another process')
+
+    def _load_ids(self):
+        path = os.path.join(self.directory, 'ids.log')
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                for line in f:
+                    if not line.endswith('\n'):
+                        break        # torn final line: the event using it was never written
+                    kind, _, value = line[:-1].partition(' ')
+                    if kind == 'u':
+                        self._user_index[value] = len(self._users)
+                        self._users.append(value)
+                    elif kind == 's':
+                        self._stock_index[value] = len(self._stocks)
+                        self._stocks.append(value)
+        self._ids_file = open(path, 'a', buffering=1)
+
+    def _segments(self):
+        found = []
+        for name in os.listdir(self.directory):
+            match = SEGMENT_NAME.match(name)
+            if match:
+                found.append((int(match.group(1)), os.path.join(self.directory, name)))
+        return sorted(found)
+
+    def _snapshots(self):
+        found = []
+        for name in os.listdir(self.directory):
+            match = SNAPSHOT_NAME.match(name)
+            if match:
+                found.append((int(match.group(1)), os.path.join(self.directory, name)))
+        return sorted(found, reverse=True)
+
+    def _load_latest_snapshot(self):
+        for seq, path in self._snapshots():
+            try:
+                self._load_snapshot(path)
+                return
+            except (OSError, ValueError) as e:
+                logger.warning("Skipping unreadable trade log snapshot %s: %s", path, e)
+        self._seq = self._snapshot_seq = 0
+        self._cash, self._positions, self._anchored = {}, {}, set()
+
+    def _load_snapshot(self, path):
+        with open(path, 'rb') as f:
+            data = f.read()
+        if len(data) < SNAPSHOT_HEADER.size:
+            raise ValueError('truncated header')
+        magic, little, seq, user_count, stock_count, accounts, positions = SNAPSHOT_HEADER.unpack_from(data)
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError('not a trade log snapshot')
+        if user_count > len(self._users) or stock_count > len(self._stocks):
+            raise ValueError('snapshot refers to ids missing from ids.log')
+        columns = array('q')
+        columns.frombytes(data[SNAPSHOT_HEADER.size:])
+        if bool(little) != (sys.byteorder == 'little'):
+            columns.byteswap()
+        if len(columns) != accounts * 3 + positions * 2:
+            raise ValueError('truncated columns')
+        users = columns[0:accounts]
+        offset = accounts * 3
+        self._cash = dict(zip(users, columns[accounts:accounts * 2]))
+        self._anchored = {user for user, flag in zip(users, columns[accounts * 2:offset]) if flag}
+        self._positions = dict(zip(columns[offset:offset + positions], columns[offset + positions:]))
+        self._seq = self._snapshot_seq = seq
+
+    def _replay_tail(self):
+        """Apply the events after the loaded snapshot; returns how many"""
+        segments = self._segments()
+        cash = self._cash
+        positions = self._positions
+        anchored = self._anchored
+        replayed = 0
+        for i, (first_seq, path) in enumerate(segments):
+            next_seq = segments[i + 1][0] if i + 1 < len(segments) else None
+            if next_seq is not None and next_seq <= self._seq:
+                continue        # wholly covered by the snapshot
+            if first_seq > self._seq:
+                logger.error("Trade log is missing events %s to %s; balances may be incomplete",
+                             self._seq, first_seq - 1)
+                self._seq = first_seq
+            data = self._read_segment(path, last=next_seq is None)
+            skip = self._seq - first_seq
+            kinds = data[skip * FIELDS::FIELDS]
+            users = data[skip * FIELDS + 1::FIELDS]
+            stocks = data[skip * FIELDS + 2::FIELDS]
+            quantities = data[skip * FIELDS + 3::FIELDS]
+            amounts = data[skip * FIELDS + 4::FIELDS]
+            for kind, user, stock, quantity, amount in zip(kinds, users, stocks, quantities, amounts):
+                if kind == CANCEL:
+                    continue
+                if amount:
+                    cash[user] = cash.get(user, 0) + amount
+                if quantity:
+                    key = (user << 32) | stock
+                    remaining = positions.get(key, 0) + quantity
+                    if remaining:
+                        positions[key] = remaining
+                    else:
+                        del positions[key]
+                if kind != FILL:
+                    anchored.add(user)
+            self._seq += len(kinds)
+            replayed += len(kinds)
+        return replayed
+
+    def _read_segment(self, path, last=False):
+        with open(path, 'rb') as f:
+            raw = f.read()
+        torn = len(raw) % RECORD_SIZE
+        if torn:
+            if not last:
+                raise ValueError(f'trade log segment {path} is corrupt')
+            # A crash mid-append leaves a partial final record; drop it
+            logger.warning("Truncating %s bytes of a torn event in %s", torn, path)
+            raw = raw[:-torn]
+            with open(path, 'r+b') as f:
+                f.truncate(len(raw))
+        data = array('q')
+        data.frombytes(raw)
+        return data
+
+    def _open_segment(self):
+        segments = self._segments()
+        if segments:
+            first_seq, path = segments[-1]
+            count = os.path.getsize(path) // RECORD_SIZE
+            if first_seq + count == self._seq and count < self.segment_events:
+                self._segment = open(path, 'ab', buffering=0)
+                self._segment_count = count
+                return
+            if first_seq + count != self._seq:
+                logger.error("Trade log segments end at event %s, continuing at %s", first_seq + count, self._seq)
+        self._segment = open(os.path.join(self.directory, f'events-{self._seq:012d}.bin'), 'ab', buffering=0)
+        self._segment_count = 0
+
+    # Appending
+
+    def _intern(self, value, index, names, prefix):
+        position = index.get(value)
+        if position is None:
+            # The id is written before any event that refers to it
+            self._ids_file.write(f'{prefix} {value}\n')
+            position = index[value] = len(names)
+            names.append(value)
+        return position
+
+    def _append(self, kind, user_id, stock_id=None, quantity=0, amount=0, order_id=None):
+        user = self._intern(user_id, self._user_index, self._users, 'u') if user_id else -1
+        stock = self._intern(stock_id, self._stock_index, self._stocks, 's') if stock_id else -1
+        high, low = _order_halves(order_id)
+        self._segment.write(RECORD.pack(kind, user, stock, quantity, amount, high, low, time.time_ns() // 1000))
+        self._seq += 1
+        self._segment_count += 1
+        if user >= 0 and kind != CANCEL:
+            if amount:
+                self._cash[user] = self._cash.get(user, 0) + amount
+            if quantity:
+                key = _position_key(user, stock)
+                remaining = self._positions.get(key, 0) + quantity
+                if remaining:
+                    self._positions[key] = remaining
+                else:
+                    self._positions.pop(key, None)
+            if kind != FILL:
+                self._anchored.add(user)
+        if self._segment_count >= self.segment_events:
+            self._rotate()
+
+    def _rotate(self):
+        os.fsync(self._segment.fileno())
+        self._segment.close()
+        self._segment = open(os.path.join(self.directory, f'events-{self._seq:012d}.bin'), 'ab', buffering=0)
+        self._segment_count = 0
+
+    def fill(self, user_id, stock_id, order_type, quantity, price, order_id=None):
+        """Record an executed buy or sell of quantity shares at price paise"""
+        total = price * quantity
+        with self._lock:
+            self.recover()
+            if order_type == 'buy':
+                self._append(FILL, user_id, stock_id, quantity, -total, order_id)
+            else:
+                self._append(FILL, user_id, stock_id, -quantity, total, order_id)
+
+    def deposit(self, user_id, amount):
+        """Record cash paid into (or, when negative, out of) an account"""
+        with self._lock:
+            self.recover()
+            self._append(DEPOSIT, user_id, amount=amount)
+
+    def cancel(self, order_id, user_id=None, stock_id=None):
+        """Record a cancelled order"""
+        with self._lock:
+            self.recover()
+            self._append(CANCEL, user_id, stock_id, order_id=order_id)
+
+    def open_account(self, user_id, cash, holdings):
+        """
+        Anchor an account that predates the log to its database balance in
+        paise and {stock_id: quantity} holdings. Does nothing for accounts
+        the log already has an opening balance for.
+        """
+        with self._lock:
+            self.recover()
+            user = self._user_index.get(user_id)
+            if user is not None and user in self._anchored:
+                return False
+            # Fills recorded before the account was opened are already in
+            # the database balance, so only the difference is appended
+            current_cash = self._cash.get(user, 0) if user is not None else 0
+            current_shares = self._holdings(user) if user is not None else {}
+            self._append(DEPOSIT, user_id, amount=cash - current_cash)
+            for stock_id in set(holdings) | set(current_shares):
+                difference = holdings.get(stock_id, 0) - current_shares.get(stock_id, 0)
+                if difference:
+                    self._append(OPEN, user_id, stock_id, quantity=difference)
+            return True
+
+    # Reading
+
+    def _holdings(self, user):
+        # Positions are keyed flat for fast replay, so this scans them all
+        low, high = _position_key(user, 0), _position_key(user + 1, 0)
+        return {self._stocks[_position_stock(key)]: quantity
+                for key, quantity in self._positions.items() if low <= key < high}
+
+    def balance(self, user_id):
+        """(cash paise, {stock_id: quantity}) for an opened account, else None"""
+        with self._lock:
+            self.recover()
+            user = self._user_index.get(user_id)
+            if user is None or user not in self._anchored:
+                return None
+            return self._cash.get(user, 0), self._holdings(user)
+
+    def accounts(self):
+        """Every opened account as {user_id: (cash paise, {stock_id: quantity})}"""
+        with self._lock:
+            self.recover()
+            users, stocks = self._users, self._stocks
+            accounts = {users[user]: (self._cash.get(user, 0), {}) for user in self._anchored}
+            for key, quantity in self._positions.items():
+                account = accounts.get(users[key >> 32])
+                if account is not None:
+                    account[1][stocks[_position_stock(key)]] = quantity
+            return accounts
+
+    def events(self, since=0):
+        """Yield (seq, kind, user_id, stock_id, quantity, amount, order_id, ts_us) from event since"""
+        with self._lock:
+            self.recover()
+            segments = self._segments()
+            end = self._seq
+        for i, (first_seq, path) in enumerate(segments):
+            next_seq = segments[i + 1][0] if i + 1 < len(segments) else end
+            if next_seq <= since:
+                continue
+            data = self._read_segment(path)
+            for n in range(max(0, since - first_seq), min(len(data) // FIELDS, end - first_seq)):
+                kind, user, stock, quantity, amount, high, low, ts = data[n * FIELDS:(n + 1) * FIELDS]
+                yield (first_seq + n, KIND_NAMES.get(kind, kind), self._users[user] if user >= 0 else None,
+                       self._stocks[stock] if stock >= 0 else None, quantity, amount, _order_id(high, low), ts)
+
+    # Snapshots
+
+    def snapshot(self):
+        """
+        Write balances and positions as of the latest event to a columnar
+        snapshot file. Returns the snapshot's event number.
+        """
+        with self._lock:
+            self.recover()
+            seq = self._seq
+            if seq == self._snapshot_seq:
+                return seq
+            os.fsync(self._segment.fileno())
+            self._ids_file.flush()
+            os.fsync(self._ids_file.fileno())
+            user_count, stock_count = len(self._users), len(self._stocks)
+            cash = dict(self._cash)
+            anchored = set(self._anchored)
+            positions = dict(self._positions)
+
+        users = array('q', cash.keys())
+        columns = users + array('q', cash.values()) + array('q', (user in anchored for user in users))
+        columns += array('q', positions.keys())
+        columns += array('q', positions.values())
+        path = os.path.join(self.directory, f'snapshot-{seq:012d}.bin')
+        with open(path + '.tmp', 'wb') as f:
+            f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, sys.byteorder == 'little', seq, user_count, stock_count,
+                                         len(users), len(positions)))
+            f.write(columns.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + '.tmp', path)
+        with self._lock:
+            self._snapshot_seq = max(self._snapshot_seq, seq)
+        self._compact()
+        logger.info("Trade log snapshot at event %s: %s accounts, %s positions", seq, len(users), len(positions))
+        return seq
+
+    def _compact(self, keep=2):
+        """Keep the newest snapshots and, with prune, only the segments after the oldest of them"""
+        snapshots = self._snapshots()
+        for _, path in snapshots[keep:]:
+            os.remove(path)
+        if not self.prune or len(snapshots) < keep:
+            return
+        oldest_kept = snapshots[keep - 1][0]
+        segments = self._segments()
+        for i, (first_seq, path) in enumerate(segments[:-1]):
+            if segments[i + 1][0] <= oldest_kept:
+                os.remove(path)
+
+    def run_snapshotter(self, should_run=lambda: True, wait=None, interval=10):
+        """
+        Background thread function writing a snapshot every snapshot_every events.
+        wait(seconds) replaces time.sleep and returns False to stop early.
+        """
+        while should_run():
+            if wait is None:
+                time.sleep(interval)
+            elif not wait(interval):
+                break
+            try:
+                if self._seq - self._snapshot_seq >= self.snapshot_every:
+                    self.snapshot()
+            except Exception as e:
+                logger.error("Error writing trade log snapshot: %s", e)
+
+    def close(self):
+        with self._lock:
+            if not self._opened:
+                return
+            os.fsync(self._segment.fileno())
+            self._segment.close()
+            self._ids_file.close()
+            self._lock_file.close()
+            self._opened = False
+
+    def stats(self):
+        with self._lock:
+            return {
+                'directory': self.directory,
+                'seq': self._seq,
+                'snapshot_seq': self._snapshot_seq,
+                'events_since_snapshot': self._seq - self._snapshot_seq,
+                'accounts': len(self._anchored),
+                'segments': len(self._segments()) if self._opened else None,
+                'recovery': self.recovery
+            }
@@ -1,4 +1,20 @@
+import os
+
+# Serverless entry point (vercel.json). A function instance is frozen between
+# requests, so nothing here may rely on background threads: the engines are
+# left to a long-running process (Procfile), logs are written inline and the
+# trade log, which needs one long-lived writer, is off. The filesystem is
+# read-only, so there is no price tick journal either. Instances share no
+# machine to signal each other on, so the cache bus is off too; set
+# CACHE_BUS=postgres for order event streams to see the engine process's fills.
+# Explicit settings in the environment still take precedence.
+os.environ.setdefault('START_BACKGROUND_ENGINES', 'false')
+os.environ.setdefault('LOG_ASYNC', 'false')
+os.environ.setdefault('TRADE_LOG_DIR', '')
+os.environ.setdefault('PRICE_JOURNAL_PATH', '')
+os.environ.setdefault('CACHE_BUS', 'off')
+
 from app import app
 
 if __name__ != "__main__":
-    application = app
\ No newline at end of file
+    application = app